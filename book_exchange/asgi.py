@@ -3,6 +3,20 @@ ASGI config for book_exchange project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+The Procfile serves the WSGI app on sync gunicorn workers by default, which
+had the higher throughput under ``manage.py benchmark_concurrency`` (/books/,
+2 workers, SQLite, 10 clients: 77 against 57 req/s). Opt in to this app when
+slow clients are the bottleneck instead: gunicorn managing uvicorn workers
+serves many connections from one event loop per process, so clients that
+trickle their requests and the async catalog views (home, book_list,
+book_details, purchase, swap) no longer hold a whole process each (59 against
+0.3 req/s with 4 slow clients). Change the Procfile's web line to::
+
+    gunicorn book_exchange.asgi:application -k uvicorn_worker.UvicornWorker \
+        --workers ${WEB_CONCURRENCY:-2} --bind 0.0.0.0:$PORT
+
+The remaining sync views then run in Django's thread pool.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
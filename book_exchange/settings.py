@@ -4,13 +4,17 @@ Production-ready for Render deployment with PostgreSQL.
 """
 
 import os
+import sys
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 # 🔑 Secret Key & Debug
 SECRET_KEY = os.environ.get("SECRET_KEY", "fallback-secret-key")
 DEBUG = os.environ.get("DEBUG", "False") == "True"
+TESTING = len(sys.argv) > 1 and sys.argv[1] == "test"
 
 # 🌍 Allowed Hosts
 ALLOWED_HOSTS = os.environ.get("ALLOWED_HOSTS", "localhost").split(",")
@@ -23,6 +27,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "core",
 ]
 
@@ -38,19 +43,29 @@ MIDDLEWARE = [
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
+# 🧮 Per-view query counts and N+1 warnings (core.middleware), off by default
+if os.environ.get("QUERY_INSPECTOR", "False") == "True":
+    MIDDLEWARE.append("core.middleware.QueryBudgetMiddleware")
+
 ROOT_URLCONF = "book_exchange.urls"
 
 # 🎨 Templates
+TEMPLATE_LOADERS = [
+    "django.template.loaders.filesystem.Loader",
+    "django.template.loaders.app_directories.Loader",
+]
 TEMPLATES = [
     {
         "BACKEND": "django.template.backends.django.DjangoTemplates",
         "DIRS": [BASE_DIR / "templates"],
-        "APP_DIRS": True,
         "OPTIONS": {
+            # Parsed templates are kept in memory in production; DEBUG re-reads them on every render.
+            "loaders": TEMPLATE_LOADERS if DEBUG else [("django.template.loaders.cached.Loader", TEMPLATE_LOADERS)],
             "context_processors": [
                 "django.template.context_processors.request",
                 "django.contrib.auth.context_processors.auth",
                 "django.contrib.messages.context_processors.messages",
+                "core.context_processors.dashboard_summary",
             ],
         },
     },
@@ -58,17 +73,135 @@ TEMPLATES = [
 
 WSGI_APPLICATION = "book_exchange.wsgi.application"
 
-# 🗄 Database (PostgreSQL via env)
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.postgresql",
-        "NAME": os.environ.get("DB_NAME"),
-        "USER": os.environ.get("DB_USER"),
-        "PASSWORD": os.environ.get("DB_PASSWORD"),
-        "HOST": os.environ.get("DB_HOST"),
-        "PORT": os.environ.get("DB_PORT", "5432"),
+# 🗄 Database (PostgreSQL via env). SQLite only stands in for a missing DB_NAME under DEBUG,
+# in test runs or with DB_SQLITE=True, so a production deploy without DB_NAME fails loudly.
+DB_SQLITE = os.environ.get("DB_SQLITE", "False") == "True"
+if os.environ.get("DB_NAME") or not (DEBUG or TESTING or DB_SQLITE):
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": os.environ.get("DB_NAME"),
+            "USER": os.environ.get("DB_USER"),
+            "PASSWORD": os.environ.get("DB_PASSWORD"),
+            "HOST": os.environ.get("DB_HOST"),
+            "PORT": os.environ.get("DB_PORT", "5432"),
+            # Seconds a thread keeps its connection between requests (0: reconnect every request).
+            "CONN_MAX_AGE": int(os.environ.get("DB_CONN_MAX_AGE", "0")),
+            "CONN_HEALTH_CHECKS": os.environ.get("DB_CONN_HEALTH_CHECKS", "True") == "True",
+        }
+    }
+    # 🏊 Connection pool (psycopg 3): the better fit under ASGI, where requests hop between
+    # threads and per-thread persistent connections pile up. Each worker process has its own
+    # pool, so DB_MAX_CONNECTIONS (what the web tier may use in total) is split between the
+    # WEB_CONCURRENCY workers unless DB_POOL_MAX_SIZE says otherwise. With CONN_HEALTH_CHECKS
+    # the pool checks each connection before handing it out.
+    if os.environ.get("DB_POOL", "False") == "True":
+        DB_POOL_MIN_SIZE = int(os.environ.get("DB_POOL_MIN_SIZE", "2"))
+        DB_POOL_MAX_SIZE = int(os.environ.get(
+            "DB_POOL_MAX_SIZE",
+            max(DB_POOL_MIN_SIZE, int(os.environ.get("DB_MAX_CONNECTIONS", "20")) // int(os.environ.get("WEB_CONCURRENCY", "2"))),
+        ))
+        DATABASES["default"]["CONN_MAX_AGE"] = 0  # the pool keeps the connections instead
+        DATABASES["default"]["OPTIONS"] = {
+            "pool": {
+                "min_size": DB_POOL_MIN_SIZE,
+                "max_size": DB_POOL_MAX_SIZE,
+                # Seconds a request waits for a free connection before failing.
+                "timeout": float(os.environ.get("DB_POOL_TIMEOUT", "10")),
+                # Recycle connections so server-side memory and stale sockets don't build up.
+                "max_lifetime": float(os.environ.get("DB_POOL_MAX_LIFETIME", "1800")),
+            }
+        }
+else:
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": BASE_DIR / "db.sqlite3",
+            # SQLite has no row locks: writers take the database lock when their transaction
+            # begins and later ones wait up to "timeout" seconds for it, instead of failing
+            # when a read lock cannot be upgraded.
+            "OPTIONS": {"transaction_mode": "IMMEDIATE", "timeout": 20},
+            # A file rather than the shared-cache in-memory default, whose table locks fail at once.
+            "TEST": {"NAME": BASE_DIR / "test_db.sqlite3"},
+        }
+    }
+
+# 🧊 Cache for catalog pages and fragments (core.caching). A write bumps version keys that
+# every worker has to see, so the cache must be shared: a Redis server (REDIS_URL, expected in
+# production) or, on a single host, a file cache under CACHE_DIR. A per-process cache would let
+# the other gunicorn workers serve stale pages for up to PAGE_TIMEOUT, so without a shared one
+# nothing is cached, except in DEBUG's single-process runserver and in test runs.
+if os.environ.get("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ["REDIS_URL"],
+            "KEY_PREFIX": "bookswap",
+        }
+    }
+elif os.environ.get("CACHE_DIR"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": os.environ.get("CACHE_DIR"),
+        }
+    }
+elif DEBUG or TESTING:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "bookswap",
+        }
     }
+else:
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+
+# 🍪 Sessions: "db" (default: one django_session read per request), "cached_db" (db writes,
+# reads from the shared cache), "cache" (no database) or "signed_cookies". The cache modes
+# need a cache every worker shares, or a session would stay alive in other workers after a
+# logout or password change: a Redis server (REDIS_URL, expected in production) or, on a
+# single host, a file cache under CACHE_DIR. The file cache lists its whole directory on
+# every write and culls a third of it at SESSION_CACHE_MAX_ENTRIES, logging those users out
+# in "cache" mode, so keep the limit well above the live sessions. Sessions stored by "db"
+# survive a switch, see core.sessions.
+SESSION_ENGINES = {
+    "db": "django.contrib.sessions.backends.db",
+    "cached_db": "django.contrib.sessions.backends.cached_db",
+    "cache": "core.sessions.cache",
+    "signed_cookies": "core.sessions.signed_cookies",
 }
+SESSION_MODE = os.environ.get("SESSION_MODE", "db")
+if SESSION_MODE not in SESSION_ENGINES:
+    raise ImproperlyConfigured(f"SESSION_MODE must be one of {', '.join(SESSION_ENGINES)}.")
+if SESSION_MODE in ("cache", "cached_db") and not (os.environ.get("REDIS_URL") or os.environ.get("CACHE_DIR")):
+    raise ImproperlyConfigured(f'SESSION_MODE "{SESSION_MODE}" needs REDIS_URL or CACHE_DIR, so every worker shares the sessions.')
+SESSION_ENGINE = SESSION_ENGINES[SESSION_MODE]
+SESSION_CACHE_ALIAS = "sessions"
+if os.environ.get("REDIS_URL"):
+    CACHES["sessions"] = {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.environ["REDIS_URL"],
+        "KEY_PREFIX": "sessions",
+    }
+elif os.environ.get("CACHE_DIR"):
+    CACHES["sessions"] = {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.path.join(os.environ["CACHE_DIR"], "sessions"),
+        "OPTIONS": {"MAX_ENTRIES": int(os.environ.get("SESSION_CACHE_MAX_ENTRIES", "100000"))},
+    }
+else:  # only for tests that switch engines with override_settings
+    CACHES["sessions"] = {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "bookswap-sessions",
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    }
+
+# 🧵 Background jobs (core.jobs); eager runs them in-process after commit, without a worker
+JOB_QUEUE_EAGER = os.environ.get("JOB_QUEUE_EAGER", "False") == "True"
+
+# 🔎 Fuzzy title/author matching (core.fuzzy)
+FUZZY_SEARCH_THRESHOLD = float(os.environ.get("FUZZY_SEARCH_THRESHOLD", "0.4"))
+FUZZY_SEARCH_BUDGET_MS = int(os.environ.get("FUZZY_SEARCH_BUDGET_MS", "150"))
 
 # 🔐 Password Validators
 AUTH_PASSWORD_VALIDATORS = [
@@ -92,8 +225,16 @@ STATIC_ROOT = BASE_DIR / "staticfiles"
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
-# ⚡ Whitenoise for static files
-STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
+# ⚡ Whitenoise for static files: hashed names (cached forever) with gzip and Brotli copies.
+# The manifest comes from collectstatic, so DEBUG and test runs serve the files as they are.
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {
+        "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"
+        if DEBUG or TESTING
+        else "whitenoise.storage.CompressedManifestStaticFilesStorage"
+    },
+}
 
 # 🔧 Default Auto Field
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
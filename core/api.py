@@ -0,0 +1,277 @@
+"""
+Read-only JSON API (v1) over the catalog, book reviews and public seller profiles.
+
+- Compact JSON: no whitespace, no HTML, decimals as strings.
+- ``?fields=id,title,price`` returns only those fields and narrows the SELECT to match.
+- Lists are keyset-paginated like the HTML listings (``?after=``, ``?before=``,
+  ``?per_page=``) and carry absolute ``next``/``previous`` links.
+- ``changes/`` is the catalog change feed (see core.changes): entries after
+  ``?after=<cursor>`` in commit order, each with the book's current state.
+- Every other response has a strong ``ETag`` and answers a matching ``If-None-Match``
+  with ``304 Not Modified``. Single books also send ``Last-Modified`` and honour
+  ``If-Modified-Since``.
+
+Book ETags come from ``Book.updated_at``, so a 304 is decided before anything
+is serialized. Reviews and profiles hash the body instead.
+"""
+import hashlib
+import json
+from datetime import datetime
+
+from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from . import changes
+from .facets import apply_filters
+from .models import Book, Review
+from .pagination import apaginate_keyset, decode_cursor, encode_cursor
+
+
+CONTENT_TYPE = "application/json"
+FEED_LIMIT = 500
+FEED_MAX_LIMIT = 2000
+
+
+class FieldError(ValueError):
+    pass
+
+
+def _rating(book):
+    return round(book.rating_avg, 2) if book.rating_avg is not None else None
+
+
+# API field -> (model fields it needs loaded, value getter)
+BOOK_FIELDS = {
+    "id": (("id",), lambda b: b.id),
+    "title": (("title",), lambda b: b.title),
+    "author": (("author",), lambda b: b.author),
+    "genre": (("genre",), lambda b: b.genre),
+    "condition": (("condition",), lambda b: b.condition),
+    "availability": (("availability",), lambda b: b.availability),
+    "price": (("price",), lambda b: b.price),
+    "description": (("description",), lambda b: b.description),
+    "cover": (("cover",), lambda b: b.cover.url if b.cover else None),
+    "rating": (("rating_avg",), _rating),
+    "review_count": (("review_count",), lambda b: b.review_count),
+    "owner": (("owner__username",), lambda b: b.owner.username),
+    "created_at": (("created_at",), lambda b: b.created_at),
+    "updated_at": (("updated_at",), lambda b: b.updated_at),
+}
+# Loaded whatever was asked for: keyset cursors and ETags are built from them.
+BOOK_KEY_FIELDS = ("id", "created_at", "updated_at")
+
+REVIEW_FIELDS = {
+    "id": (("id",), lambda r: r.id),
+    "rating": (("rating",), lambda r: r.rating),
+    "comment": (("comment",), lambda r: r.comment),
+    "reviewer": (("reviewer__username",), lambda r: r.reviewer.username),
+    "created_at": (("created_at",), lambda r: r.created_at),
+}
+REVIEW_KEY_FIELDS = ("id", "created_at")
+
+
+def selected_fields(request, spec):
+    """The API field names requested with ``?fields=``, in the order given (default: all)."""
+    raw = request.GET.get("fields", "").strip()
+    if not raw:
+        return list(spec)
+    names = list(dict.fromkeys(name.strip() for name in raw.split(",") if name.strip()))
+    unknown = [name for name in names if name not in spec]
+    if unknown:
+        raise FieldError(f"Unknown field(s): {', '.join(unknown)}. Available: {', '.join(spec)}.")
+    return names
+
+
+def _narrow(queryset, spec, names, key_fields):
+    """Restrict ``queryset`` to the columns the chosen fields read."""
+    columns = set(key_fields)
+    for name in names:
+        columns.update(spec[name][0])
+    related = {column.split("__")[0] for column in columns if "__" in column}
+    if related:
+        queryset = queryset.select_related(*related)
+    return queryset.only(*columns, *related)
+
+
+def serialize(obj, spec, names):
+    return {name: spec[name][1](obj) for name in names}
+
+
+def _dumps(payload):
+    return json.dumps(payload, cls=DjangoJSONEncoder, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def _etag(*parts):
+    return '"%s"' % hashlib.sha1("|".join(str(part) for part in parts).encode()).hexdigest()
+
+
+def _error(status, message):
+    return HttpResponse(_dumps({"error": message}), content_type=CONTENT_TYPE, status=status)
+
+
+def conditional(request, etag, last_modified=None):
+    """
+    An empty response carrying ``etag`` (and ``last_modified``), or the 304/412
+    the request's conditional headers call for. Callers fill in the content only
+    when the status is 200.
+    """
+    timestamp = int(last_modified.timestamp()) if last_modified is not None else None
+    response = HttpResponse(content_type=CONTENT_TYPE)
+    response["ETag"] = etag
+    if timestamp is not None:
+        response["Last-Modified"] = http_date(timestamp)
+    # Shared caches may keep a copy but must revalidate it on every use.
+    patch_cache_control(response, public=True, no_cache=True)
+    return get_conditional_response(request, etag=etag, last_modified=timestamp, response=response)
+
+
+def _page_links(request, page):
+    def link(query):
+        return request.build_absolute_uri(f"{request.path}?{query}")
+
+    return {
+        "next": link(page.next_query) if page.has_next else None,
+        "previous": link(page.previous_query) if page.has_previous else None,
+    }
+
+
+async def book_list(request):
+    try:
+        names = selected_fields(request, BOOK_FIELDS)
+    except FieldError as exc:
+        return _error(400, str(exc))
+    books, _ = apply_filters(Book.objects.all(), request.GET)
+    if request.GET.get("owner"):
+        books = books.filter(owner__username=request.GET["owner"])
+    page = await apaginate_keyset(request, _narrow(books, BOOK_FIELDS, names, BOOK_KEY_FIELDS))
+    links = _page_links(request, page)
+    # No Last-Modified on lists: a book leaving the page changes the ETag but not the newest timestamp.
+    etag = _etag("books", ",".join(names), links["next"], links["previous"], *(f"{b.id}:{b.updated_at.timestamp()}" for b in page))
+    response = conditional(request, etag)
+    if response.status_code == 200:
+        response.content = _dumps({"results": [serialize(book, BOOK_FIELDS, names) for book in page], **links})
+    return response
+
+
+async def book_detail(request, book_id):
+    try:
+        names = selected_fields(request, BOOK_FIELDS)
+    except FieldError as exc:
+        return _error(400, str(exc))
+    book = await _narrow(Book.objects.filter(pk=book_id), BOOK_FIELDS, names, BOOK_KEY_FIELDS).afirst()
+    if book is None:
+        return _error(404, "Book not found.")
+    response = conditional(request, _etag("book", ",".join(names), book.id, book.updated_at.timestamp()), book.updated_at)
+    if response.status_code == 200:
+        response.content = _dumps(serialize(book, BOOK_FIELDS, names))
+    return response
+
+
+def _hashed(request, payload):
+    body = _dumps(payload)
+    response = conditional(request, _etag(hashlib.sha1(body).hexdigest()))
+    if response.status_code == 200:
+        response.content = body
+    return response
+
+
+async def book_reviews(request, book_id):
+    try:
+        names = selected_fields(request, REVIEW_FIELDS)
+    except FieldError as exc:
+        return _error(400, str(exc))
+    if not await Book.objects.filter(pk=book_id).aexists():
+        return _error(404, "Book not found.")
+    reviews = _narrow(Review.objects.filter(book_id=book_id), REVIEW_FIELDS, names, REVIEW_KEY_FIELDS)
+    page = await apaginate_keyset(request, reviews)
+    return _hashed(request, {"results": [serialize(review, REVIEW_FIELDS, names) for review in page], **_page_links(request, page)})
+
+
+async def user_profile(request, username):
+    user = await (
+        User.objects.filter(username=username, is_active=True)
+        .select_related("profile", "dashboard_summary")
+        .only("username", "date_joined", "profile__place", "profile__avatar", "dashboard_summary__books")
+        .afirst()
+    )
+    if user is None:
+        return _error(404, "User not found.")
+    profile = getattr(user, "profile", None)
+    summary = getattr(user, "dashboard_summary", None)
+    if summary is None:
+        books = await Book.objects.filter(owner=user).acount()
+    else:
+        books = summary.books
+    return _hashed(request, {
+        "username": user.username,
+        "place": profile.place if profile else None,
+        "avatar": profile.avatar.url if profile and profile.avatar else None,
+        "member_since": user.date_joined,
+        "books": books,
+    })
+
+
+def _feed_cursor(token):
+    """
+    ``((txid, entry id), time the consumer was last caught up)`` from a feed
+    cursor, or None for the start. Cursors from before entries recorded their
+    transaction hold just the id; those entries all have txid 0.
+    """
+    if not token:
+        return None
+    values = decode_cursor(token, 3) or decode_cursor(token, 2)
+    if values is None:
+        raise ValueError(token)
+    if len(values) == 2:
+        values = [0, *values]
+    txid, entry_id, caught_up = values
+    return (int(txid), int(entry_id)), datetime.fromisoformat(caught_up)
+
+
+async def change_feed(request):
+    try:
+        names = selected_fields(request, BOOK_FIELDS)
+    except FieldError as exc:
+        return _error(400, str(exc))
+    try:
+        cursor = _feed_cursor(request.GET.get("after"))
+        limit = max(1, min(int(request.GET.get("limit", FEED_LIMIT)), FEED_MAX_LIMIT))
+    except (TypeError, ValueError):
+        return _error(400, "Invalid cursor or limit.")
+    if cursor and changes.is_expired(cursor[1]):
+        return _error(410, "Cursor expired: deletes since then may have been compacted away. Resync from the start of the feed.")
+
+    entries = [entry async for entry in changes.feed(cursor[0] if cursor else None, limit + 1)]
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+    live = {entry.book_id for entry in entries if entry.action != "deleted"}
+    books = {book.pk: book async for book in _narrow(Book.objects.filter(pk__in=live), BOOK_FIELDS, names, BOOK_KEY_FIELDS)}
+
+    position = (entries[-1].txid, entries[-1].id) if entries else (cursor[0] if cursor else (0, 0))
+    # A consumer that has read everything is caught up as of now, which keeps an idle cursor from expiring.
+    caught_up = entries[-1].created_at if has_more else timezone.now()
+    next_cursor = encode_cursor(*position, caught_up)
+    params = request.GET.copy()
+    params["after"] = next_cursor
+    response = HttpResponse(_dumps({
+        "changes": [
+            {
+                "id": entry.id,
+                "book_id": entry.book_id,
+                "action": entry.action,
+                "fields": entry.fields,
+                "at": entry.created_at,
+                "book": serialize(books[entry.book_id], BOOK_FIELDS, names) if entry.book_id in books else None,
+            }
+            for entry in entries
+        ],
+        "cursor": next_cursor,
+        "next": request.build_absolute_uri(f"{request.path}?{params.urlencode()}"),
+        "has_more": has_more,
+    }), content_type=CONTENT_TYPE)
+    patch_cache_control(response, no_store=True)
+    return response
@@ -0,0 +1,259 @@
+"""
+Content-addressed media storage.
+
+Covers, avatars, GPay QR codes and payment screenshots are stored once per
+distinct content, as ``blobs/<ab>/<cd>/<sha256><ext>``. ``ContentAddressedStorage``
+hashes an upload while copying it to a temporary file beside the blobs;
+when that content is already stored, the copy is dropped and the existing
+name is returned. So the same QR code uploaded by a hundred sellers takes
+the disk (and the backup) once. Saving is file I/O only, like
+FileSystemStorage, so imports can still store covers from worker processes.
+
+A ``Blob`` row per referenced file counts the model fields pointing at it.
+The model signals keep the count in step as files are set, replaced or
+their rows deleted. ``delete()`` never removes a blob directly, because
+another row may share it. ``manage.py gc_blobs`` removes blobs nobody
+refers to, along with their image derivatives, once their file is older
+than a grace period (an upload is stored before the row that refers to it
+is saved, and uploading known content touches the file).
+``manage.py migrate_media_to_blobs`` moves existing uploads into the store.
+
+Image derivatives (``core.images``) live under their blob's name and are
+written through this storage unchanged.
+"""
+import hashlib
+import os
+import posixpath
+import shutil
+import tempfile
+from collections import Counter
+from datetime import timedelta
+
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .images import DERIVATIVES_DIR
+
+
+BLOB_DIR = "blobs"
+TMP_DIR = posixpath.join(BLOB_DIR, "tmp")
+# Models with file fields stored here, by model label.
+FILE_FIELDS = {
+    "core.Book": ("cover",),
+    "core.UserProfile": ("avatar", "gpay_qr"),
+    "core.Payment": ("screenshot",),
+}
+GRACE = timedelta(hours=24)
+MAX_EXTENSION = 10
+CHUNK_SIZE = 64 * 1024
+
+
+def is_blob(name):
+    return bool(name) and name.startswith(BLOB_DIR + "/") and not name.startswith(TMP_DIR + "/")
+
+
+def blob_dir(content_hash):
+    return posixpath.join(BLOB_DIR, content_hash[:2], content_hash[2:4])
+
+
+def _extension(name):
+    ext = posixpath.splitext(name or "")[1].lower()
+    return ext if len(ext) <= MAX_EXTENSION and ext[1:].isalnum() else ""
+
+
+def digest(fh):
+    """``(sha256 hex digest, size)`` of a file, read in chunks."""
+    hasher, size = hashlib.sha256(), 0
+    for chunk in iter(lambda: fh.read(CHUNK_SIZE), b""):
+        hasher.update(chunk)
+        size += len(chunk)
+    return hasher.hexdigest(), size
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage that files uploads under their SHA-256 and stores each content once."""
+
+    def __init__(self, **kwargs):
+        # Derivatives are rewritten in place; blob names never collide with different content.
+        kwargs.setdefault("allow_overwrite", True)
+        super().__init__(**kwargs)
+
+    def stored_as(self, content_hash):
+        """The name ``content_hash`` is already stored under (with whatever extension it came with), or None."""
+        directory = blob_dir(content_hash)
+        try:
+            entries = os.listdir(self.path(directory))
+        except FileNotFoundError:
+            return None
+        for entry in entries:
+            if posixpath.splitext(entry)[0] == content_hash:
+                return posixpath.join(directory, entry)
+        return None
+
+    def _save(self, name, content):
+        if name.startswith(DERIVATIVES_DIR + "/"):
+            return super()._save(name, content)
+        tmp_dir = self.path(TMP_DIR)
+        os.makedirs(tmp_dir, exist_ok=True)
+        hasher = hashlib.sha256()
+        with tempfile.NamedTemporaryFile(dir=tmp_dir, delete=False) as tmp:
+            try:
+                if hasattr(content, "seek"):
+                    content.seek(0)
+                for chunk in content.chunks(CHUNK_SIZE):
+                    hasher.update(chunk)
+                    tmp.write(chunk)
+            except BaseException:
+                tmp.close()
+                os.remove(tmp.name)
+                raise
+        content_hash = hasher.hexdigest()
+        existing = self.stored_as(content_hash)
+        if existing is not None:
+            os.remove(tmp.name)
+            os.utime(self.path(existing))  # restarts its grace period
+            return existing
+        blob = posixpath.join(blob_dir(content_hash), content_hash + _extension(name))
+        path = self.path(blob)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if self.directory_permissions_mode is not None:
+            os.chmod(os.path.dirname(path), self.directory_permissions_mode)
+        os.replace(tmp.name, path)
+        if self.file_permissions_mode is not None:
+            os.chmod(path, self.file_permissions_mode)
+        return blob
+
+    def delete(self, name):
+        # Blobs may be shared, and derivatives belong to their blob; gc_blobs removes both.
+        if is_blob(name) or name.startswith(posixpath.join(DERIVATIVES_DIR, BLOB_DIR) + "/"):
+            return
+        super().delete(name)
+
+
+storage = ContentAddressedStorage()
+
+
+def media_storage():
+    """The storage for uploaded files (a callable, so FileFields don't pin MEDIA_ROOT at import)."""
+    return storage
+
+
+def names(instance):
+    """The blob names an instance's file fields point at."""
+    return Counter(
+        name for name in (getattr(instance, field).name for field in FILE_FIELDS.get(instance._meta.label, ()))
+        if is_blob(name)
+    )
+
+
+def snapshot(instance, field_names):
+    """Remember the files a freshly loaded row refers to, if its file fields were loaded."""
+    if set(FILE_FIELDS[instance._meta.label]) <= set(field_names):
+        instance._blob_names = names(instance)
+
+
+def stored_names(instance):
+    stored = type(instance)._default_manager.filter(pk=instance.pk).first()
+    return names(stored) if stored else Counter()
+
+
+def _new_blob(name, refs):
+    from .models import Blob
+
+    return Blob(name=name, size=storage.size(name) if storage.exists(name) else 0, refs=refs)
+
+
+def adjust(deltas):
+    """Apply ``{blob name: change}`` to the reference counts, adding rows for newly referenced blobs."""
+    from .models import Blob
+
+    for name, delta in deltas.items():
+        if not delta or Blob.objects.filter(name=name).update(refs=F("refs") + delta) or delta < 0:
+            continue
+        try:
+            with transaction.atomic():
+                _new_blob(name, delta).save(force_insert=True)
+        except IntegrityError:
+            Blob.objects.filter(name=name).update(refs=F("refs") + delta)
+
+
+def row_saved(instance, previous):
+    current = names(instance)
+    deltas = Counter(current)
+    deltas.subtract(previous or {})
+    adjust(deltas)
+    instance._blob_names = current
+
+
+def rows_added(instances):
+    """Count the files of rows written with ``bulk_create()``, which sends no signals."""
+    deltas = Counter()
+    for instance in instances:
+        deltas.update(names(instance))
+    adjust(deltas)
+
+
+def row_deleted(instance, previous):
+    adjust({name: -count for name, count in previous.items()})
+
+
+def recount(dry_run=False):
+    """Recompute every blob's reference count from the file fields. Returns the blob names fixed."""
+    from django.apps import apps
+
+    from .models import Blob
+
+    actual = Counter()
+    for label, field_names in FILE_FIELDS.items():
+        model = apps.get_model(label)
+        for field_name in field_names:
+            rows = model._default_manager.filter(**{f"{field_name}__startswith": BLOB_DIR + "/"})
+            actual.update(rows.values_list(field_name, flat=True).iterator(chunk_size=2000))
+    drifted = []
+    for blob in Blob.objects.only("name", "refs").iterator(chunk_size=2000):
+        refs = actual.pop(blob.name, 0)
+        if blob.refs != refs:
+            blob.refs = refs
+            drifted.append(blob)
+    # What is left is referenced but has no row yet.
+    missing = [_new_blob(name, refs) for name, refs in actual.items()]
+    if not dry_run:
+        Blob.objects.bulk_update(drifted, ["refs"], batch_size=1000)
+        Blob.objects.bulk_create(missing, batch_size=1000, ignore_conflicts=True)
+    return [blob.name for blob in drifted + missing]
+
+
+def collect(grace=GRACE, dry_run=False):
+    """
+    Remove blobs nothing refers to whose file is older than ``grace``, with
+    their derivatives and Blob rows, and stale temporary files of interrupted
+    uploads. Returns ``(files removed, bytes freed)``.
+    """
+    from .models import Blob
+
+    cutoff = (timezone.now() - grace).timestamp()
+    referenced = set(Blob.objects.filter(refs__gt=0).values_list("name", flat=True).iterator(chunk_size=2000))
+    removed = freed = 0
+    for root, _, files in os.walk(storage.path(BLOB_DIR)):
+        for file_name in files:
+            path = os.path.join(root, file_name)
+            name = posixpath.join(*os.path.relpath(path, storage.location).split(os.sep))
+            if name in referenced or os.path.getmtime(path) >= cutoff:
+                continue
+            # A row may have taken it up since the scan started.
+            if is_blob(name) and Blob.objects.filter(name=name, refs__gt=0).exists():
+                continue
+            removed, freed = removed + 1, freed + os.path.getsize(path)
+            if dry_run:
+                continue
+            os.remove(path)
+            if is_blob(name):
+                Blob.objects.filter(name=name).delete()
+                stem, _ = posixpath.splitext(name)
+                shutil.rmtree(storage.path(posixpath.join(DERIVATIVES_DIR, stem)), ignore_errors=True)
+    if not dry_run:
+        gone = [name for name in Blob.objects.filter(refs__lte=0).values_list("name", flat=True) if not storage.exists(name)]
+        Blob.objects.filter(name__in=gone, refs__lte=0).delete()
+    return removed, freed
@@ -0,0 +1,142 @@
+"""
+Page and fragment caching for the public catalog pages.
+
+Cache keys embed a version number: one for the whole catalog and one per
+book. Book and Review signals bump those versions after commit, which
+orphans every stale entry at once instead of hunting down individual keys.
+Old entries simply age out of the cache.
+
+Every worker must see the bumps, so settings only point the default cache at
+a shared backend (Redis or a file cache); without one it is a DummyCache and
+nothing here is cached. A version key the cache evicted restarts from the
+clock rather than from 1, so it cannot come back to a number whose stale
+entries are still stored.
+"""
+import time
+from functools import wraps
+from inspect import isawaitable
+
+from asgiref.sync import iscoroutinefunction
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.db import transaction
+from django.http import HttpResponse
+
+
+PAGE_TIMEOUT = 60 * 10
+FRAGMENT_TIMEOUT = 60 * 10  # the {% cache 600 ... %} tags in home.html and book_details.html
+CATALOG_VERSION_KEY = "catalog:version"
+
+
+def _book_version_key(book_id):
+    return f"book:{book_id}:version"
+
+
+def _initial_version():
+    return time.time_ns() // 1000
+
+
+def _version(key):
+    version = cache.get(key)
+    if version is None:
+        initial = _initial_version()
+        cache.add(key, initial, None)
+        version = cache.get(key, initial)
+    return version
+
+
+def catalog_version():
+    return _version(CATALOG_VERSION_KEY)
+
+
+def book_version(book_id):
+    return _version(_book_version_key(book_id))
+
+
+async def _aversion(key):
+    version = await cache.aget(key)
+    if version is None:
+        initial = _initial_version()
+        await cache.aadd(key, initial, None)
+        version = await cache.aget(key, initial)
+    return version
+
+
+async def acatalog_version():
+    return await _aversion(CATALOG_VERSION_KEY)
+
+
+async def abook_version(book_id):
+    return await _aversion(_book_version_key(book_id))
+
+
+async def afragment_cached(fragment_name, *vary_on):
+    """
+    Whether a ``{% cache %}`` fragment is present, so an async view can skip
+    the queries that fill it. Touching it keeps it alive until it is rendered.
+    """
+    return await cache.atouch(make_template_fragment_key(fragment_name, vary_on), FRAGMENT_TIMEOUT)
+
+
+def _bump(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _initial_version(), None)
+
+
+def invalidate_catalog():
+    transaction.on_commit(lambda: _bump(CATALOG_VERSION_KEY))
+
+
+def invalidate_book(book_id):
+    transaction.on_commit(lambda: _bump(_book_version_key(book_id)))
+
+
+def _cacheable(request, response):
+    # Pages that render a CSRF token or set cookies are per-visitor.
+    return (
+        response.status_code == 200
+        and not response.streaming
+        and not response.cookies
+        and not request.META.get("CSRF_COOKIE_NEEDS_UPDATE")
+    )
+
+
+def cache_anonymous_page(key_func):
+    """
+    Serve whole responses for anonymous, parameterless GETs from the cache.
+    ``key_func(request, *args, **kwargs)`` returns the versioned key; for async
+    views it may be a coroutine function.
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                if request.method != "GET" or request.GET or (await request.auser()).is_authenticated:
+                    return await view(request, *args, **kwargs)
+                key = key_func(request, *args, **kwargs)
+                key = "page:" + (await key if isawaitable(key) else key)
+                content = await cache.aget(key)
+                if content is not None:
+                    return HttpResponse(content)
+                response = await view(request, *args, **kwargs)
+                if _cacheable(request, response):
+                    await cache.aset(key, response.content, PAGE_TIMEOUT)
+                return response
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method != "GET" or request.GET or request.user.is_authenticated:
+                return view(request, *args, **kwargs)
+            key = "page:" + key_func(request, *args, **kwargs)
+            content = cache.get(key)
+            if content is not None:
+                return HttpResponse(content)
+            response = view(request, *args, **kwargs)
+            if _cacheable(request, response):
+                cache.set(key, response.content, PAGE_TIMEOUT)
+            return response
+        return wrapper
+    return decorator
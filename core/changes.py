@@ -0,0 +1,135 @@
+"""
+Append-only change log for the Book catalog, behind ``/api/v1/changes/``.
+
+Every create, edit, availability change and delete of a Book appends a
+``BookChange`` row in the same transaction as the write. Partners replay the
+log from a cursor to keep a mirror in sync, instead of re-downloading the
+catalog.
+
+``manage.py compact_book_changes`` (also run as a daily job) keeps the log
+small. It drops every entry older than ``COMPACT_AFTER`` that is not the
+latest for its book, and drops delete tombstones once they are older than
+``TOMBSTONE_RETENTION``.
+After compaction the log still holds at least one entry for every book that
+exists, so replaying it from the start rebuilds the whole catalog. A cursor
+older than the tombstone window may have missed deletes; the feed answers
+it with 410 and the consumer starts over.
+
+Entry ids are handed out at insert, not at commit, so a transaction can
+commit an entry below ids a consumer has already read past. The feed
+therefore follows commit order instead: each entry records the id of the
+transaction that wrote it, and the feed serves entries in (transaction, id)
+order, only from transactions older than every one still running. On
+PostgreSQL that is the snapshot's xmin. SQLite lets one transaction write at
+a time, so there id order already is commit order.
+"""
+from datetime import timedelta
+
+from django.db.models import BigIntegerField, Func, Max, Q, Subquery
+from django.utils import timezone
+
+
+# Fields whose changes are worth telling a mirror about (what core.api serves).
+TRACKED_FIELDS = ("title", "author", "genre", "condition", "description", "cover", "availability", "price")
+COMPACT_AFTER = timedelta(days=7)
+TOMBSTONE_RETENTION = timedelta(days=90)
+
+
+class WritingTransaction(Func):
+    """The id of the transaction inserting the row; 0 where writers are serialized."""
+
+    template = "0"
+    output_field = BigIntegerField()
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return "pg_current_xact_id()::text::bigint", []
+
+
+class FinishedBelow(Func):
+    """A transaction id below which every transaction has committed or rolled back."""
+
+    template = "9223372036854775807"
+    output_field = BigIntegerField()
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return "pg_snapshot_xmin(pg_current_snapshot())::text::bigint", []
+
+
+def tracked_values(book):
+    return {field: book.cover.name if field == "cover" else getattr(book, field) for field in TRACKED_FIELDS}
+
+
+def snapshot(book, field_names):
+    if set(TRACKED_FIELDS) <= set(field_names):
+        book._change_values = tracked_values(book)
+
+
+def stored_values(book):
+    """Tracked values of the row as currently stored, for books loaded without a snapshot."""
+    stored = type(book)._default_manager.filter(pk=book.pk).first()
+    return tracked_values(stored) if stored else None
+
+
+def record(book_id, action, fields=()):
+    from .models import BookChange
+
+    return BookChange.objects.create(book_id=book_id, action=action, fields=list(fields), txid=WritingTransaction())
+
+
+def book_saved(book, created, previous):
+    current = tracked_values(book)
+    book._change_values = current
+    if created or previous is None:
+        record(book.pk, "created")
+        return
+    changed = [field for field in TRACKED_FIELDS if current[field] != previous[field]]
+    if changed:
+        record(book.pk, "availability" if "availability" in changed else "updated", changed)
+
+
+def book_deleted(book_id):
+    record(book_id, "deleted")
+
+
+def books_created(books):
+    """Log a batch of bulk-created books, which bypass the model signals."""
+    from .models import BookChange
+
+    BookChange.objects.bulk_create([BookChange(book_id=book.pk, action="created", txid=WritingTransaction()) for book in books])
+    for book in books:
+        book._change_values = tracked_values(book)
+
+
+def feed(after, limit):
+    """
+    Up to ``limit`` committed entries after the ``(txid, id)`` position ``after``
+    (None for the start), in commit order, as a queryset.
+    """
+    from .models import BookChange
+
+    finished = BookChange.objects.filter(txid__lt=FinishedBelow())
+    if after is not None:
+        txid, entry_id = after
+        finished = finished.filter(Q(txid__gt=txid) | Q(txid=txid, id__gt=entry_id))
+    return finished.order_by("txid", "id")[:limit]
+
+
+def is_expired(cursor_time):
+    """Whether a cursor is too old to have seen every delete since."""
+    return cursor_time < timezone.now() - TOMBSTONE_RETENTION
+
+
+def compact(dry_run=False, now=None):
+    """Drop superseded entries and old tombstones. Returns the number of entries removed."""
+    from .models import BookChange
+
+    now = now or timezone.now()
+    latest = BookChange.objects.values("book_id").annotate(last=Max("id")).values("last")
+    superseded = BookChange.objects.filter(created_at__lt=now - COMPACT_AFTER).exclude(id__in=Subquery(latest))
+    tombstones = BookChange.objects.filter(action="deleted", created_at__lt=now - TOMBSTONE_RETENTION)
+    if dry_run:
+        return superseded.count() + tombstones.count()
+    removed, _ = superseded.delete()
+    # Tombstones go last: while one is still there it is its book's latest entry.
+    removed_tombstones, _ = tombstones.delete()
+    return removed + removed_tombstones
@@ -0,0 +1,11 @@
+from django.utils.functional import SimpleLazyObject
+
+from . import counters
+
+
+def dashboard_summary(request):
+    """Sidebar badge counts; the lookup only runs if a template reads them."""
+    user = getattr(request, "user", None)
+    if user is None or not user.is_authenticated:
+        return {"dashboard_summary": None}
+    return {"dashboard_summary": SimpleLazyObject(lambda: counters.for_user(user))}
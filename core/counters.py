@@ -0,0 +1,157 @@
+"""
+Per-user dashboard counters.
+
+``DashboardSummary`` holds one row per user with the numbers the dashboard and
+sidebar badges show. Each Book, SwapRequest, Payment and Transaction row
+contributes a set of (user, counter) pairs; the model signals move a row's
+contribution from its previous pairs to its current ones with F() updates in
+the same transaction as the save. ``manage.py reconcile_dashboard`` repairs
+any drift from the source tables.
+"""
+from collections import Counter
+
+from django.db.models import Count, F
+
+COUNTERS = ("books", "pending_swaps_received", "pending_payments", "purchases", "sales")
+
+# Attributes a loaded instance needs for contributions() to be computed from it.
+SNAPSHOT_FIELDS = {
+    "Book": {"owner_id"},
+    "SwapRequest": {"owner_id", "status"},
+    "Payment": {"seller_id", "status"},
+    "Transaction": {"buyer_id", "seller_id"},
+}
+
+
+def contributions(instance):
+    """
+    The (key, counter) pairs a row counts towards. Keys are ("user", id), or
+    ("profile", id) for Payment, whose seller is a UserProfile.
+    """
+    name = type(instance).__name__
+    if name == "Book":
+        return {(("user", instance.owner_id), "books")}
+    if name == "SwapRequest":
+        return {(("user", instance.owner_id), "pending_swaps_received")} if instance.status == "pending" else set()
+    if name == "Payment":
+        return {(("profile", instance.seller_id), "pending_payments")} if instance.status == "Pending" else set()
+    if name == "Transaction":
+        return {(("user", instance.buyer_id), "purchases"), (("user", instance.seller_id), "sales")}
+    return set()
+
+
+def snapshot(instance, field_names):
+    """Remember what a freshly loaded row contributes, if enough of it was loaded."""
+    if SNAPSHOT_FIELDS[type(instance).__name__] <= set(field_names):
+        instance._counter_values = contributions(instance)
+
+
+def stored_contributions(instance):
+    """Contributions of the row as currently stored, for instances loaded without a snapshot."""
+    stored = type(instance)._default_manager.filter(pk=instance.pk).first()
+    return contributions(stored) if stored else set()
+
+
+def _apply(deltas):
+    from .models import DashboardSummary
+
+    per_key = {}
+    for (key, counter), delta in deltas.items():
+        if delta:
+            per_key.setdefault(key, {})[counter] = delta
+    # In key order, so concurrent transactions lock the summary rows in the same order.
+    for (kind, pk), changes in sorted(per_key.items()):
+        rows = DashboardSummary.objects.filter(**{"user__profile" if kind == "profile" else "user": pk})
+        # Rows that do not exist yet are computed from scratch on first read.
+        rows.update(**{counter: F(counter) + delta for counter, delta in changes.items()})
+
+
+def _moved(instance, previous, deltas):
+    current = contributions(instance)
+    for pair in previous - current:
+        deltas[pair] -= 1
+    for pair in current - previous:
+        deltas[pair] += 1
+    instance._counter_values = current
+
+
+def row_saved(instance, previous):
+    deltas = Counter()
+    _moved(instance, previous, deltas)
+    _apply(deltas)
+
+
+def rows_updated(instances):
+    """Count rows changed by a bulk update(), which bypasses the model signals; each needs its snapshot."""
+    deltas = Counter()
+    for instance in instances:
+        _moved(instance, instance._counter_values, deltas)
+    _apply(deltas)
+
+
+def rows_added(instances):
+    """Count a batch of bulk-created rows, which bypass the model signals."""
+    _apply(Counter(pair for instance in instances for pair in contributions(instance)))
+
+
+def row_deleted(instance, previous):
+    _apply(Counter({pair: -1 for pair in previous}))
+
+
+def compute(user_id):
+    """Counts for one user straight from the source tables."""
+    from .models import Book, Payment, SwapRequest, Transaction
+
+    return {
+        "books": Book.objects.filter(owner_id=user_id).count(),
+        "pending_swaps_received": SwapRequest.objects.filter(owner_id=user_id, status="pending").count(),
+        "pending_payments": Payment.objects.filter(seller__user_id=user_id, status="Pending").count(),
+        "purchases": Transaction.objects.filter(buyer_id=user_id).count(),
+        "sales": Transaction.objects.filter(seller_id=user_id).count(),
+    }
+
+
+def for_user(user):
+    """The user's summary row: one primary-key lookup, computed and stored if it is missing."""
+    from .models import DashboardSummary
+
+    try:
+        return DashboardSummary.objects.get(pk=user.pk)
+    except DashboardSummary.DoesNotExist:
+        summary, _ = DashboardSummary.objects.get_or_create(user_id=user.pk, defaults=compute(user.pk))
+        return summary
+
+
+def _grouped(queryset, field):
+    counts = queryset.values(field).annotate(n=Count("id")).order_by()
+    return {row[field]: row["n"] for row in counts}
+
+
+def reconcile(dry_run=False):
+    """Recompute every user's counters and fix the rows that drifted. Returns the user ids fixed."""
+    from django.contrib.auth.models import User
+
+    from .models import Book, DashboardSummary, Payment, SwapRequest, Transaction
+
+    actual = {
+        "books": _grouped(Book.objects.all(), "owner"),
+        "pending_swaps_received": _grouped(SwapRequest.objects.filter(status="pending"), "owner"),
+        "pending_payments": _grouped(Payment.objects.filter(status="Pending"), "seller__user"),
+        "purchases": _grouped(Transaction.objects.all(), "buyer"),
+        "sales": _grouped(Transaction.objects.all(), "seller"),
+    }
+    existing = DashboardSummary.objects.in_bulk()
+    drifted, missing = [], []
+    for user_id in User.objects.values_list("id", flat=True).iterator(chunk_size=2000):
+        counts = {counter: actual[counter].get(user_id, 0) for counter in COUNTERS}
+        row = existing.get(user_id)
+        if row is None:
+            missing.append(DashboardSummary(user_id=user_id, **counts))
+        elif any(getattr(row, counter) != value for counter, value in counts.items()):
+            for counter, value in counts.items():
+                setattr(row, counter, value)
+            drifted.append(row)
+    if not dry_run:
+        DashboardSummary.objects.bulk_update(drifted, COUNTERS, batch_size=1000)
+        DashboardSummary.objects.bulk_create(missing, batch_size=1000, ignore_conflicts=True)
+    return [row.user_id for row in drifted + missing]
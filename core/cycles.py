@@ -0,0 +1,168 @@
+"""
+Multi-party swap matching.
+
+A pending SwapRequest is an edge of the want-graph: its requester wants
+``requested_book`` from the owner and will give ``offered_book`` in return
+(any book they are asked for, if none is offered). When every participant of
+a ring of 3 or 4 requests can hand over the book the previous one asked
+them for, the ring is a swap nobody could have made pairwise. Such a ring is
+proposed as a ``SwapCycle``. Once everyone involved accepts, every request
+in it is accepted like a pairwise swap.
+
+The graph is never scanned as a whole. A new request can only close rings
+that run through it, so ``propose()`` (queued per request) looks forward
+two steps from its owner and back one step into its requester, using three
+indexed queries. A request that stops being pending cancels the proposals
+it is part of.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Prefetch
+
+from . import jobs
+
+
+# Rings proposed per new request, smallest first; each one asks several people to act.
+PROPOSALS_PER_REQUEST = 3
+
+
+def follows(previous, following):
+    """Whether ``following``'s requester can give what ``previous`` asked them for."""
+    return following.requester_id == previous.owner_id and following.offered_book_id in (None, previous.requested_book_id)
+
+
+def cycles_through(swap):
+    """Every ring of 3 or 4 pending requests that includes ``swap``, each as a list of requests starting with it."""
+    from .models import SwapRequest
+
+    pending = SwapRequest.objects.filter(status="pending").exclude(pk=swap.pk).only(
+        "id", "requester_id", "owner_id", "requested_book_id", "offered_book_id"
+    )
+    seconds = [s for s in pending.filter(requester_id=swap.owner_id) if follows(swap, s)]
+    if not seconds:
+        return []
+    # Requests back into swap's requester, by whoever made them.
+    lasts = defaultdict(list)
+    for last in pending.filter(owner_id=swap.requester_id):
+        if follows(last, swap):
+            lasts[last.requester_id].append(last)
+    if not lasts:
+        return []
+    thirds = defaultdict(list)
+    for third in pending.filter(requester_id__in={second.owner_id for second in seconds}):
+        thirds[third.requester_id].append(third)
+
+    rings = []
+    for second in seconds:
+        for last in lasts.get(second.owner_id, ()):
+            if follows(second, last):
+                rings.append([swap, second, last])
+        for third in thirds.get(second.owner_id, ()):
+            if not follows(second, third):
+                continue
+            for last in lasts.get(third.owner_id, ()):
+                if follows(third, last):
+                    rings.append([swap, second, third, last])
+    # Everyone in a ring is a different person.
+    return [ring for ring in rings if len({request.requester_id for request in ring}) == len(ring)]
+
+
+def ring_key(ring):
+    return "-".join(str(request_id) for request_id in sorted(request.id for request in ring))
+
+
+def propose(swap_id):
+    """Propose the rings a newly pending request closes. Returns the new SwapCycles."""
+    from .models import SwapCycle, SwapCycleLeg, SwapRequest
+
+    swap = SwapRequest.objects.filter(pk=swap_id, status="pending").first()
+    if swap is None:
+        return []
+    proposed = []
+    for ring in sorted(cycles_through(swap), key=len)[:PROPOSALS_PER_REQUEST]:
+        with transaction.atomic():
+            cycle, created = SwapCycle.objects.get_or_create(key=ring_key(ring), defaults={"size": len(ring)})
+            if created:
+                SwapCycleLeg.objects.bulk_create(
+                    SwapCycleLeg(cycle=cycle, swap_request=request, position=position)
+                    for position, request in enumerate(ring)
+                )
+                proposed.append(cycle)
+    return proposed
+
+
+def request_opened(swap_id):
+    jobs.enqueue("core.match_swap_cycles", swap_id=swap_id, unique_key=f"swap-cycles:{swap_id}")
+
+
+def request_closed(*swap_ids):
+    """Withdraw the proposals requests that are no longer pending were part of."""
+    from .models import SwapCycle
+
+    SwapCycle.objects.filter(status="proposed", legs__swap_request_id__in=swap_ids).update(status="cancelled")
+
+
+def for_user(user):
+    """Proposed rings ``user`` takes part in, with their legs in order."""
+    from .models import SwapCycle, SwapCycleLeg
+
+    legs = SwapCycleLeg.objects.select_related("swap_request__requester", "swap_request__owner", "swap_request__requested_book")
+    return (
+        SwapCycle.objects.filter(status="proposed", legs__swap_request__requester=user)
+        .prefetch_related(Prefetch("legs", queryset=legs))
+        .order_by("-created_at")
+    )
+
+
+def accept(cycle, user):
+    """
+    Record ``user``'s acceptance; when everyone has accepted, accept every
+    request and reject those competing for the ring's books. Returns True once
+    complete. If a request was accepted, rejected or withdrawn meanwhile, the
+    ring cannot go ahead and is cancelled instead.
+    """
+    from .models import SwapCycle, SwapRequest
+    from .swaps import SwapNotPending, closed, lock_books, record_sales, reject_competing
+
+    with transaction.atomic():
+        # Books first, as in swaps.accept, so a pairwise accept and this ring wait for each other in one order.
+        lock_books(SwapRequest.objects.filter(cycle_legs__cycle=cycle).only("requested_book_id", "offered_book_id"))
+        cycle = SwapCycle.objects.select_for_update().filter(pk=cycle.pk, status="proposed").first()
+        if cycle is None:
+            return False
+        legs = list(cycle.legs.select_related("swap_request"))
+        for leg in legs:
+            if leg.swap_request.requester_id == user.id:
+                leg.accepted = True
+                leg.save(update_fields=["accepted"])
+        if not all(leg.accepted for leg in legs):
+            return False
+        swaps = [leg.swap_request for leg in legs]
+        swap_ids = [swap.pk for swap in swaps]
+        try:
+            with transaction.atomic():
+                list(SwapRequest.objects.select_for_update().filter(pk__in=swap_ids).values_list("pk"))
+                # As in swaps.accept: without row locks (SQLite) only requests still pending move,
+                # and falling short of every leg rolls the others back.
+                if SwapRequest.objects.filter(pk__in=swap_ids, status="pending").update(status="accepted") < len(swap_ids):
+                    raise SwapNotPending(f"Swap cycle {cycle.pk} has a request that is no longer pending.")
+        except SwapNotPending:
+            cycle.status = "cancelled"
+            cycle.save(update_fields=["status"])
+            return False
+        # Completed first, so closing the requests leaves this cycle alone.
+        cycle.status = "completed"
+        cycle.save(update_fields=["status"])
+        for swap in swaps:
+            swap.status = "accepted"
+        closed(swaps)
+        record_sales(swaps)
+        reject_competing(swaps)
+    return True
+
+
+def decline(cycle):
+    from .models import SwapCycle
+
+    SwapCycle.objects.filter(pk=cycle.pk, status="proposed").update(status="cancelled")
@@ -0,0 +1,170 @@
+"""
+Streaming CSV/NDJSON exports of a user's sales and purchases.
+
+Rows come straight from ``values_list(...).iterator(chunk_size=...)`` (or
+``aiterator`` when served over ASGI) and are encoded in small batches, so an
+export of any size runs in constant memory and starts downloading at once.
+"""
+import csv
+import json
+from datetime import date, datetime, time, timedelta
+from io import StringIO
+
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+
+CHUNK_SIZE = 2000  # rows fetched per round trip
+BATCH_ROWS = 500  # rows encoded per chunk sent to the client
+FORMATS = {"csv": "text/csv; charset=utf-8", "ndjson": "application/x-ndjson"}
+
+# (values_list path, column name) per export, oldest first.
+COLUMNS = {
+    ("sales", "payments"): [
+        ("id", "id"), ("created_at", "created_at"), ("status", "status"), ("book__title", "book"),
+        ("buyer__username", "buyer"), ("amount", "amount"), ("payment_method", "payment_method"),
+        ("transaction_id", "transaction_id"), ("mobile", "mobile"),
+    ],
+    ("purchases", "payments"): [
+        ("id", "id"), ("created_at", "created_at"), ("status", "status"), ("book__title", "book"),
+        ("seller__user__username", "seller"), ("amount", "amount"), ("payment_method", "payment_method"),
+        ("transaction_id", "transaction_id"),
+    ],
+    ("sales", "transactions"): [
+        ("id", "id"), ("created_at", "created_at"), ("status", "status"), ("book__title", "book"),
+        ("buyer__username", "buyer"), ("amount", "amount"), ("mobile", "mobile"),
+    ],
+    ("purchases", "transactions"): [
+        ("id", "id"), ("created_at", "created_at"), ("status", "status"), ("book__title", "book"),
+        ("seller__username", "seller"), ("amount", "amount"),
+    ],
+}
+
+
+class ExportError(ValueError):
+    pass
+
+
+def parse_date(value, name):
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ExportError(f"{name} must be a date in YYYY-MM-DD form.")
+
+
+def history(user, side, source, start=None, end=None):
+    """The rows for one export as a ``values_list`` queryset, oldest first."""
+    from .models import Payment, Transaction
+
+    if source == "payments":
+        queryset = Payment.objects.filter(seller__user=user) if side == "sales" else Payment.objects.filter(buyer=user)
+    else:
+        queryset = Transaction.objects.filter(seller=user) if side == "sales" else Transaction.objects.filter(buyer=user)
+    # Whole-day bounds as datetimes, so the (user, created_at) indexes still apply.
+    if start:
+        queryset = queryset.filter(created_at__gte=timezone.make_aware(datetime.combine(start, time.min)))
+    if end:
+        queryset = queryset.filter(created_at__lt=timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min)))
+    fields = [path for path, _ in COLUMNS[side, source]]
+    return queryset.order_by("created_at", "id").values_list(*fields)
+
+
+def _cell(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, str) and value[:1] in ("=", "+", "-", "@"):
+        # Spreadsheets would evaluate these as formulas.
+        return "'" + value
+    return value
+
+
+class _CsvEncoder:
+    def __init__(self, columns):
+        self.buffer = StringIO()
+        self.writer = csv.writer(self.buffer)
+        self.header = self.encode([[name for _, name in columns]])
+
+    def encode(self, rows):
+        self.writer.writerows([_cell(value) for value in row] for row in rows)
+        text = self.buffer.getvalue()
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        return text
+
+
+class _NdjsonEncoder:
+    def __init__(self, columns):
+        self.names = [name for _, name in columns]
+        self.header = ""
+
+    def encode(self, rows):
+        return "".join(json.dumps(dict(zip(self.names, row)), cls=DjangoJSONEncoder) + "\n" for row in rows)
+
+
+def _batches(rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_ROWS:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def _abatches(rows):
+    batch = []
+    async for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_ROWS:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def stream(request, queryset, columns, fmt, filename):
+    """
+    A ``StreamingHttpResponse`` for ``queryset``. Django buffers a sync iterator
+    under ASGI (and an async one under WSGI), so pick the one the server can stream.
+    """
+    encoder = (_CsvEncoder if fmt == "csv" else _NdjsonEncoder)(columns)
+
+    if isinstance(request, ASGIRequest):
+        async def content():
+            yield encoder.header
+            async for batch in _abatches(queryset.aiterator(chunk_size=CHUNK_SIZE)):
+                yield encoder.encode(batch)
+    else:
+        def content():
+            yield encoder.header
+            for batch in _batches(queryset.iterator(chunk_size=CHUNK_SIZE)):
+                yield encoder.encode(batch)
+
+    response = StreamingHttpResponse(content(), content_type=FORMATS[fmt])
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    response["Cache-Control"] = "no-store"
+    return response
+
+
+def export_response(request, side):
+    """Parse ``?format=&source=&start=&end=`` and stream the user's ``side`` ("sales"/"purchases")."""
+    fmt = request.GET.get("format", "csv")
+    source = request.GET.get("source", "payments")
+    if fmt not in FORMATS:
+        raise ExportError("format must be csv or ndjson.")
+    if source not in ("payments", "transactions"):
+        raise ExportError("source must be payments or transactions.")
+    start = parse_date(request.GET.get("start"), "start")
+    end = parse_date(request.GET.get("end"), "end")
+    if start and end and start > end:
+        raise ExportError("start must not be after end.")
+
+    queryset = history(request.user, side, source, start, end)
+    span = "-".join(d.isoformat() for d in (start, end) if d) or "all"
+    filename = f"bookswap-{side}-{source}-{span}.{fmt}"
+    return stream(request, queryset, COLUMNS[side, source], fmt, filename)
@@ -0,0 +1,223 @@
+"""
+Faceted browsing for the Book catalog.
+
+Counts per facet value live in ``FacetCount`` and are adjusted by the Book
+signals whenever a book is created, edited or deleted, so listing pages read
+a handful of small rows instead of running ``COUNT(*)`` per facet value.
+``manage.py rebuild_facets`` recomputes the table from scratch.
+
+Genres are free text and shown as entered. They group and filter by
+``genre_key()``; "genre_spelling" rows count each spelling, so a genre is
+labelled with its most common one.
+"""
+from collections import Counter
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, CharField, Count, F, Value, When
+
+from .pagination import first_page_query
+
+
+FACETS = ("genre", "condition", "availability", "price")
+FACET_LABELS = {"genre": "Genre", "condition": "Condition", "availability": "Availability", "price": "Price"}
+FACET_FIELDS = {"genre", "condition", "availability", "price"}
+GENRE_LIMIT = 20
+
+# (key, label, lower bound inclusive, upper bound exclusive or None)
+PRICE_BUCKETS = [
+    ("free", "Free", Decimal("0"), Decimal("0.01")),
+    ("0-100", "Under ₹100", Decimal("0.01"), Decimal("100")),
+    ("100-250", "₹100 – ₹250", Decimal("100"), Decimal("250")),
+    ("250-500", "₹250 – ₹500", Decimal("250"), Decimal("500")),
+    ("500-1000", "₹500 – ₹1000", Decimal("500"), Decimal("1000")),
+    ("1000+", "₹1000 and above", Decimal("1000"), None),
+]
+_BUCKETS = {key: (label, low, high) for key, label, low, high in PRICE_BUCKETS}
+
+
+def price_bucket(price):
+    price = Decimal(price or 0)
+    for key, _, low, high in PRICE_BUCKETS:
+        if price >= low and (high is None or price < high):
+            return key
+    return PRICE_BUCKETS[0][0]
+
+
+def genre_key(genre):
+    """What "fiction", "Fiction " and "FICTION" have in common; Book.save stores it as ``genre_key``."""
+    return (genre or "").strip().casefold()
+
+
+def facet_values(book):
+    """The (facet, value) pairs a book counts towards."""
+    values = {
+        ("condition", book.condition),
+        ("availability", book.availability),
+        ("price", price_bucket(book.price)),
+    }
+    key = genre_key(book.genre)
+    if key:
+        values |= {("genre", key), ("genre_spelling", book.genre.strip())}
+    return values
+
+
+def _bump(pairs, delta):
+    from .models import FacetCount
+
+    for facet, value in pairs:
+        updated = FacetCount.objects.filter(facet=facet, value=value).update(count=F("count") + delta)
+        if not updated and delta > 0:
+            row, created = FacetCount.objects.get_or_create(facet=facet, value=value, defaults={"count": delta})
+            if not created:
+                FacetCount.objects.filter(pk=row.pk).update(count=F("count") + delta)
+
+
+def book_saved(book, previous):
+    """Move a book's contribution from its ``previous`` facet values to its current ones."""
+    current = facet_values(book)
+    with transaction.atomic():
+        _bump(previous - current, -1)
+        _bump(current - previous, +1)
+
+
+def books_added(books):
+    """Count a batch of bulk-created books with one UPDATE per facet value."""
+    totals = Counter(pair for book in books for pair in facet_values(book))
+    with transaction.atomic():
+        for pair, n in totals.items():
+            _bump({pair}, n)
+
+
+def book_deleted(book, previous):
+    with transaction.atomic():
+        _bump(previous, -1)
+
+
+def rebuild():
+    """Recompute every count from the Book table. Returns the number of facet rows written."""
+    from .models import Book, FacetCount
+
+    bucket = Case(
+        *[
+            When(price__gte=low, price__lt=high, then=Value(key)) if high is not None
+            else When(price__gte=low, then=Value(key))
+            for key, _, low, high in PRICE_BUCKETS
+        ],
+        default=Value(PRICE_BUCKETS[0][0]),
+        output_field=CharField(),
+    )
+    rows = []
+    for facet in ("condition", "availability"):
+        for entry in Book.objects.values(facet).annotate(n=Count("id")).order_by():
+            rows.append(FacetCount(facet=facet, value=entry[facet], count=entry["n"]))
+    genres = Counter()
+    for entry in Book.objects.exclude(genre="").values("genre").annotate(n=Count("id")).order_by():
+        if genre_key(entry["genre"]):
+            genres["genre", genre_key(entry["genre"])] += entry["n"]
+            genres["genre_spelling", entry["genre"].strip()] += entry["n"]
+    rows += [FacetCount(facet=facet, value=value, count=n) for (facet, value), n in genres.items()]
+    for entry in Book.objects.annotate(bucket=bucket).values("bucket").annotate(n=Count("id")).order_by():
+        rows.append(FacetCount(facet="price", value=entry["bucket"], count=entry["n"]))
+
+    with transaction.atomic():
+        FacetCount.objects.all().delete()
+        FacetCount.objects.bulk_create(rows)
+    return len(rows)
+
+
+def apply_filters(queryset, params):
+    """Narrow ``queryset`` by the facet values selected in ``params`` (usually ``request.GET``)."""
+    selected = {}
+    for facet in FACETS:
+        value = params.get(facet, "").strip()
+        if not value:
+            continue
+        if facet == "price":
+            if value not in _BUCKETS:
+                continue
+            _, low, high = _BUCKETS[value]
+            queryset = queryset.filter(price__gte=low)
+            if high is not None:
+                queryset = queryset.filter(price__lt=high)
+        elif facet == "genre":
+            queryset = queryset.filter(genre_key=genre_key(value))
+        else:
+            queryset = queryset.filter(**{facet: value})
+        selected[facet] = value
+    return queryset, selected
+
+
+def _facet_rows():
+    from .models import FacetCount
+
+    return FacetCount.objects.filter(count__gt=0).order_by("facet", "-count", "value")
+
+
+def _own_books(owner):
+    from .models import Book
+
+    return Book.objects.filter(owner=owner).only(*FACET_FIELDS)
+
+
+def facet_groups(request, selected, exclude_owner=None):
+    """
+    Facet options with counts and toggle links, ready for the listing templates.
+    For listings that leave out ``exclude_owner``'s books, their books are
+    taken off the counts too.
+    """
+    own = Counter(pair for book in _own_books(exclude_owner) for pair in facet_values(book)) if exclude_owner else Counter()
+    return _build_groups(request, selected, list(_facet_rows()), own)
+
+
+async def afacet_groups(request, selected, exclude_owner=None):
+    own = Counter()
+    if exclude_owner:
+        async for book in _own_books(exclude_owner):
+            own.update(facet_values(book))
+    return _build_groups(request, selected, [row async for row in _facet_rows()], own)
+
+
+def _build_groups(request, selected, facet_rows, own):
+    from .models import Book
+
+    labels = {
+        "condition": dict(Book.CONDITION_CHOICES),
+        "availability": dict(Book.AVAILABILITY_CHOICES),
+        "price": {key: label for key, (label, _, _) in _BUCKETS.items()},
+    }
+    order = {key: i for i, (key, *_) in enumerate(PRICE_BUCKETS)}
+    rows = {}
+    for row in facet_rows:
+        row.count -= own[row.facet, row.value]
+        if row.count > 0:
+            rows.setdefault(row.facet, []).append(row)
+    if own:
+        for entries in rows.values():
+            entries.sort(key=lambda r: (-r.count, r.value))
+    # Most common spelling first, as _facet_rows orders them.
+    labels["genre"] = {}
+    for row in rows.get("genre_spelling", []):
+        labels["genre"].setdefault(genre_key(row.value), row.value)
+
+    groups = []
+    for facet in FACETS:
+        entries = rows.get(facet, [])
+        if facet == "price":
+            entries = sorted(entries, key=lambda r: order.get(r.value, 0))
+        elif facet == "genre" and len(entries) > GENRE_LIMIT:
+            chosen = genre_key(selected.get("genre"))
+            entries = [r for i, r in enumerate(entries) if i < GENRE_LIMIT or r.value == chosen]
+        options = []
+        for row in entries:
+            is_selected = genre_key(selected.get(facet)) == row.value.casefold()
+            options.append({
+                "value": row.value,
+                "label": labels.get(facet, {}).get(row.value, row.value),
+                "count": row.count,
+                "selected": is_selected,
+                "query": first_page_query(request, **{facet: None if is_selected else row.value}),
+            })
+        if options:
+            groups.append({"name": facet, "label": FACET_LABELS[facet], "options": options})
+    return groups
@@ -0,0 +1,252 @@
+"""
+Typo-tolerant matching for Book titles and authors.
+
+Every book keeps ``fuzzy_key``: its title and author folded to lower-case
+ASCII-ish text, with Indic scripts transliterated to Latin, so that "प्रेमचंद",
+"Premchand" and "premchnd" end up a few trigrams apart. PostgreSQL matches on
+that column with pg_trgm behind a GIN index. SQLite keeps the trigrams of
+every key in the ``core_book_trigram`` table, indexed by trigram and kept
+current by the Book signals, so every worker sees the same postings. Either
+way a query only ever touches the candidate rows.
+"""
+import math
+import re
+import time
+import unicodedata
+
+from django.conf import settings
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.db import OperationalError, connection, transaction
+
+
+# Offsets inside each Brahmic Unicode block, which share Devanagari's layout.
+_INDIC_BLOCKS = range(0x0900, 0x0D80, 0x80)
+_SCHWA_DELETING = {0x0900, 0x0980, 0x0A00, 0x0A80}  # Devanagari, Bengali, Gurmukhi, Gujarati
+_VOWELS = {
+    0x05: "a", 0x06: "a", 0x07: "i", 0x08: "i", 0x09: "u", 0x0A: "u", 0x0B: "ri", 0x0C: "li",
+    0x0D: "e", 0x0E: "e", 0x0F: "e", 0x10: "ai", 0x11: "o", 0x12: "o", 0x13: "o", 0x14: "au",
+}
+_CONSONANTS = {
+    0x15: "k", 0x16: "kh", 0x17: "g", 0x18: "gh", 0x19: "ng",
+    0x1A: "ch", 0x1B: "chh", 0x1C: "j", 0x1D: "jh", 0x1E: "ny",
+    0x1F: "t", 0x20: "th", 0x21: "d", 0x22: "dh", 0x23: "n",
+    0x24: "t", 0x25: "th", 0x26: "d", 0x27: "dh", 0x28: "n", 0x29: "n",
+    0x2A: "p", 0x2B: "ph", 0x2C: "b", 0x2D: "bh", 0x2E: "m",
+    0x2F: "y", 0x30: "r", 0x31: "r", 0x32: "l", 0x33: "l", 0x34: "zh", 0x35: "v",
+    0x36: "sh", 0x37: "sh", 0x38: "s", 0x39: "h",
+}
+_VOWEL_SIGNS = {
+    0x3E: "a", 0x3F: "i", 0x40: "i", 0x41: "u", 0x42: "u", 0x43: "ri", 0x44: "ri",
+    0x45: "e", 0x46: "e", 0x47: "e", 0x48: "ai", 0x49: "o", 0x4A: "o", 0x4B: "o", 0x4C: "au", 0x57: "u",
+}
+_MALAYALAM_CHILLU = {0x7A: "n", 0x7B: "n", 0x7C: "r", 0x7D: "l", 0x7E: "l", 0x7F: "k"}
+_GURMUKHI_TIPPI = 0x70
+_VIRAMA, _NUKTA, _ANUSVARA, _CANDRABINDU, _VISARGA = 0x4D, 0x3C, 0x02, 0x01, 0x03
+_NASAL = "\x00"  # placeholder until we know whether an anusvara reads as "m" or "n"
+
+_NON_WORD_RE = re.compile(r"[\W_]+", re.UNICODE)
+# Romanised Indian names spell long vowels every which way ("Basheer", "Bashir").
+_LONG_VOWEL_RE = re.compile(r"aa|ee|ii|oo|uu")
+_LONG_VOWELS = {"aa": "a", "ee": "i", "ii": "i", "oo": "u", "uu": "u"}
+
+
+def transliterate(text):
+    """Romanise Brahmic-script text with a simple, typing-friendly scheme."""
+    out = []
+    pending = None  # block of the last consonant, which still carries its inherent "a"
+
+    def close(word_end):
+        if pending is not None and not (word_end and pending in _SCHWA_DELETING):
+            out.append("a")
+
+    for ch in unicodedata.normalize("NFC", text):
+        code = ord(ch)
+        block = code & ~0x7F
+        if block not in _INDIC_BLOCKS:
+            close(word_end=True)
+            pending = None
+            out.append(ch)
+            continue
+        offset = code - block
+        if offset in _CONSONANTS:
+            close(word_end=False)
+            out.append(_CONSONANTS[offset])
+            pending = block
+        elif offset in _VOWEL_SIGNS:
+            out.append(_VOWEL_SIGNS[offset])
+            pending = None
+        elif offset == _VIRAMA:
+            pending = None
+        elif offset == _NUKTA:
+            continue
+        else:
+            close(word_end=False)
+            pending = None
+            if offset in _VOWELS:
+                out.append(_VOWELS[offset])
+            elif offset in (_ANUSVARA, _CANDRABINDU) or (block == 0x0A00 and offset == _GURMUKHI_TIPPI):
+                out.append(_NASAL)
+            elif offset == _VISARGA:
+                out.append("h")
+            elif 0x66 <= offset <= 0x6F:
+                out.append(str(offset - 0x66))
+            elif block == 0x0D00 and offset in _MALAYALAM_CHILLU:
+                out.append(_MALAYALAM_CHILLU[offset])
+    close(word_end=True)
+
+    text = "".join(out)
+    text = re.sub(_NASAL + r"(?=[pbm]|[^a-z]|$)", "m", text)
+    return text.replace(_NASAL, "n")
+
+
+def fold(text):
+    """Normalise text for fuzzy comparison: transliterate, strip accents, casefold."""
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFKD", transliterate(text))
+    text = "".join(ch for ch in text if not unicodedata.combining(ch)).casefold()
+    text = _LONG_VOWEL_RE.sub(lambda m: _LONG_VOWELS[m.group()], text)
+    return _NON_WORD_RE.sub(" ", text).strip()
+
+
+def trigrams(text):
+    """pg_trgm-style trigrams: each word padded with two leading and one trailing space."""
+    grams = set()
+    for word in text.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+TRIGRAM_TABLE = "core_book_trigram"
+
+
+def has_trigram_table(conn=connection):
+    return conn.vendor == "sqlite"
+
+
+def _postings(books):
+    return [(gram, pk) for pk, key in books for gram in trigrams(key or "")]
+
+
+def index_book(pk, key):
+    """Replace the trigram postings of one book."""
+    if not has_trigram_table():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TRIGRAM_TABLE} WHERE book_id = %s", [pk])
+        cursor.executemany(f"INSERT INTO {TRIGRAM_TABLE} (gram, book_id) VALUES (%s, %s)", _postings([(pk, key)]))
+
+
+def index_books(books):
+    """Add trigram postings for newly bulk-created books."""
+    if not has_trigram_table():
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT INTO {TRIGRAM_TABLE} (gram, book_id) VALUES (%s, %s)",
+            _postings((book.pk, book.fuzzy_key) for book in books),
+        )
+
+
+def unindex_book(pk):
+    if not has_trigram_table():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TRIGRAM_TABLE} WHERE book_id = %s", [pk])
+
+
+def rebuild_index(batch_size=1000):
+    """Recompute every book's trigram postings from ``fuzzy_key``."""
+    from .models import Book
+
+    if not has_trigram_table():
+        return
+    insert = f"INSERT INTO {TRIGRAM_TABLE} (gram, book_id) VALUES (%s, %s)"
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TRIGRAM_TABLE}")
+        batch = []
+        for row in Book.objects.values_list("id", "fuzzy_key").iterator(chunk_size=batch_size):
+            batch.append(row)
+            if len(batch) >= batch_size:
+                cursor.executemany(insert, _postings(batch))
+                batch = []
+        cursor.executemany(insert, _postings(batch))
+
+
+def _sqlite_candidates(folded, threshold, limit, budget_ms):
+    """``{id: similarity}`` for up to ``limit`` books sharing enough trigrams with ``folded``, best first."""
+    grams = sorted(trigrams(folded))
+    if not grams:
+        return {}
+    deadline = time.monotonic() + budget_ms / 1000
+    connection.ensure_connection()
+    # SQLite's answer to statement_timeout: the handler aborts the query once it returns True.
+    connection.connection.set_progress_handler(lambda: time.monotonic() > deadline, 1000)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT book_id, COUNT(*) FROM {TRIGRAM_TABLE} WHERE gram IN ({', '.join(['%s'] * len(grams))}) "
+                "GROUP BY book_id HAVING COUNT(*) >= %s ORDER BY COUNT(*) DESC, book_id DESC LIMIT %s",
+                [*grams, math.ceil(threshold * len(grams)), limit],
+            )
+            return {pk: shared / len(grams) for pk, shared in cursor.fetchall()}
+    finally:
+        connection.connection.set_progress_handler(None, 1000)
+
+
+def rebuild_keys(batch_size=1000):
+    """Recompute ``fuzzy_key`` for every book, e.g. after changing ``fold``. Returns the row count."""
+    from .models import Book
+
+    count, batch = 0, []
+    for book in Book.objects.only("id", "title", "author").iterator(chunk_size=batch_size):
+        book.fuzzy_key = fold(f"{book.title} {book.author}")
+        batch.append(book)
+        if len(batch) >= batch_size:
+            count += Book.objects.bulk_update(batch, ["fuzzy_key"])
+            batch = []
+    count += Book.objects.bulk_update(batch, ["fuzzy_key"])
+    rebuild_index(batch_size)
+    return count
+
+
+def fuzzy_books(queryset, query, limit):
+    """
+    Return up to ``limit`` books from ``queryset`` whose title/author loosely
+    match ``query``, best first, each with a ``similarity`` attribute.
+
+    Gives up and returns what it has (possibly nothing) once
+    ``FUZZY_SEARCH_BUDGET_MS`` is spent.
+    """
+    folded = fold(query)
+    if not folded:
+        return []
+    threshold = settings.FUZZY_SEARCH_THRESHOLD
+    budget_ms = settings.FUZZY_SEARCH_BUDGET_MS
+
+    if connection.vendor == "postgresql":
+        try:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute("SET LOCAL statement_timeout = %s", [budget_ms])
+                cursor.execute("SET LOCAL pg_trgm.word_similarity_threshold = %s", [threshold])
+                return list(
+                    queryset.filter(fuzzy_key__trigram_word_similar=folded)
+                    .annotate(similarity=TrigramWordSimilarity(folded, "fuzzy_key"))
+                    .order_by("-similarity", "-id")[:limit]
+                )
+        except OperationalError:
+            return []  # statement_timeout hit: no fuzzy suggestions this time
+
+    if not has_trigram_table():
+        return []
+    try:
+        # Over-fetch so rows the caller's queryset filters out don't starve the page.
+        candidates = _sqlite_candidates(folded, threshold, limit * 4, budget_ms)
+    except OperationalError:
+        return []  # interrupted: no fuzzy suggestions this time
+    books = list(queryset.filter(id__in=candidates))
+    for book in books:
+        book.similarity = candidates[book.id]
+    books.sort(key=lambda b: (b.similarity, b.id), reverse=True)
+    return books[:limit]
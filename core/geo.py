@@ -0,0 +1,200 @@
+"""
+Locations for "books near me".
+
+``UserProfile.place`` is free text. ``locate()`` matches it against the
+offline gazetteer in ``core/data/places.csv`` (cities and towns with their
+common other spellings), and the profile stores the coordinates and their
+geohash whenever it is saved.
+
+``near()`` narrows a Book queryset to a radius around the viewer in two
+steps. First it keeps the owners whose geohash falls in the 3x3 block of
+cells around the viewer, which is one index range scan per cell. Then it
+computes distances only for the books that are left, and orders them
+nearest first.
+"""
+import csv
+import difflib
+import math
+import os
+import unicodedata
+from functools import lru_cache
+
+from django.db.models import F, Q
+from django.db.models.functions import Sqrt
+
+
+GAZETTEER = os.path.join(os.path.dirname(__file__), "data", "places.csv")
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+PRECISION = 9  # about 5 m, far finer than a city-level match
+RADII_KM = (5, 20, 100)  # the choices listings offer
+MAX_RADIUS_KM = 1000
+KM_PER_DEGREE = 111.195
+FUZZY_CUTOFF = 0.85
+MAX_NAME_WORDS = 4
+
+
+class Place:
+    def __init__(self, name, latitude, longitude):
+        self.name = name
+        self.latitude = latitude
+        self.longitude = longitude
+
+    def __repr__(self):
+        return f"<Place {self.name} {self.latitude},{self.longitude}>"
+
+
+def fold(text):
+    """Lower-case ASCII words only: "Bengaluru, KA." -> "bengaluru ka"."""
+    text = unicodedata.normalize("NFKD", text or "").encode("ascii", "ignore").decode().lower()
+    return " ".join("".join(ch if ch.isalnum() else " " for ch in text).split())
+
+
+@lru_cache(maxsize=None)
+def gazetteer():
+    """Folded name or alias -> Place."""
+    places = {}
+    with open(GAZETTEER, encoding="utf-8", newline="") as fh:
+        for row in csv.DictReader(fh):
+            place = Place(row["name"], float(row["latitude"]), float(row["longitude"]))
+            for name in [row["name"], *filter(None, row["aliases"].split("|"))]:
+                places.setdefault(fold(name), place)
+    return places
+
+
+@lru_cache(maxsize=1024)
+def locate(text):
+    """The gazetteer Place named in free text such as "Koramangala, Bangalore", or None."""
+    words = fold(text).split()
+    places = gazetteer()
+    # Longest run of words first, so "new delhi" wins over "delhi".
+    for size in range(min(len(words), MAX_NAME_WORDS), 0, -1):
+        for start in range(len(words) - size + 1):
+            place = places.get(" ".join(words[start:start + size]))
+            if place is not None:
+                return place
+    # Misspellings ("Banglore"), only for words long enough not to match by chance.
+    for candidate in [" ".join(words), *words]:
+        if len(candidate) >= 5:
+            match = difflib.get_close_matches(candidate, places, n=1, cutoff=FUZZY_CUTOFF)
+            if match:
+                return places[match[0]]
+    return None
+
+
+def encode(latitude, longitude, precision=PRECISION):
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, bit_count, even = [], 0, 0, True
+    while len(chars) < precision:
+        value, interval = (longitude, lon_range) if even else (latitude, lat_range)
+        mid = (interval[0] + interval[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            interval[0] = mid
+        else:
+            interval[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(BASE32[bits])
+            bits, bit_count = 0, 0
+    return "".join(chars)
+
+
+def cell_size(precision):
+    """``(height, width)`` of a geohash cell in degrees."""
+    lon_bits = (precision * 5 + 1) // 2
+    lat_bits = precision * 5 // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def precision_for(radius_km, latitude):
+    """The finest precision whose 3x3 block around any point reaches ``radius_km`` in every direction."""
+    for precision in range(PRECISION, 0, -1):
+        height, width = cell_size(precision)
+        if min(height, width * math.cos(math.radians(latitude))) * KM_PER_DEGREE >= radius_km:
+            return precision
+    return None
+
+
+def cells_around(latitude, longitude, precision):
+    height, width = cell_size(precision)
+    cells = set()
+    for dy in (-1, 0, 1):
+        for dx in (-1, 0, 1):
+            lat = max(-90.0, min(90.0, latitude + dy * height))
+            lon = (longitude + dx * width + 180.0) % 360.0 - 180.0
+            cells.add(encode(lat, lon, precision))
+    return sorted(cells)
+
+
+def _successor(cell):
+    """The first geohash after every geohash starting with ``cell``, or None past the last one."""
+    cell = cell.rstrip(BASE32[-1])
+    if not cell:
+        return None
+    return cell[:-1] + BASE32[BASE32.index(cell[-1]) + 1]
+
+
+def in_cells(field, cells):
+    """A Q matching geohashes in ``field`` that start with any of ``cells``, as index-friendly ranges."""
+    condition = Q()
+    for cell in cells:
+        bound = _successor(cell)
+        term = Q(**{f"{field}__gte": cell})
+        if bound is not None:
+            term &= Q(**{f"{field}__lt": bound})
+        condition |= term
+    return condition
+
+
+def distance_km(latitude_field, longitude_field, latitude, longitude):
+    """An expression for the distance in km to a point (equirectangular, fine at city scale)."""
+    scale = math.cos(math.radians(latitude))
+    return Sqrt(
+        (F(latitude_field) - latitude) * (F(latitude_field) - latitude)
+        + (F(longitude_field) - longitude) * (F(longitude_field) - longitude) * scale * scale
+    ) * KM_PER_DEGREE
+
+
+def near(books, latitude, longitude, radius_km, owner="owner__profile__"):
+    """
+    ``books`` owned by people within ``radius_km`` of a point, annotated with
+    ``distance`` (km) and ``nearness`` (its negative, to page nearest first
+    with descending keyset keys).
+    """
+    precision = precision_for(radius_km, latitude)
+    if precision is not None:
+        books = books.filter(in_cells(f"{owner}geohash", cells_around(latitude, longitude, precision)))
+    distance = distance_km(f"{owner}latitude", f"{owner}longitude", latitude, longitude)
+    return books.annotate(distance=distance).filter(distance__lte=radius_km).annotate(nearness=-F("distance"))
+
+
+def radius_from(params):
+    """The ``?within=<km>`` radius asked for, or None."""
+    try:
+        radius = float(params.get("within", ""))
+    except ValueError:
+        return None
+    return min(radius, MAX_RADIUS_KM) if radius > 0 else None
+
+
+async def aviewer_location(user):
+    """``(latitude, longitude)`` of a signed-in viewer whose place is known, or None."""
+    from .models import UserProfile
+
+    if not user.is_authenticated:
+        return None
+    location = await UserProfile.objects.filter(user=user, latitude__isnull=False).values_list("latitude", "longitude").afirst()
+    return tuple(location) if location else None
+
+
+def locate_profile(profile):
+    """Set a profile's coordinates and geohash from its place."""
+    place = locate(profile.place)
+    if place is None:
+        profile.latitude = profile.longitude = None
+        profile.geohash = ""
+    else:
+        profile.latitude, profile.longitude = place.latitude, place.longitude
+        profile.geohash = encode(place.latitude, place.longitude)
@@ -0,0 +1,143 @@
+"""
+Resized WebP/JPEG derivatives of uploaded images.
+
+Each image field listed in ``WIDTHS`` gets a ``<field>_variants`` JSONField
+recording which source file the derivatives were made from, the widths that
+exist and the source dimensions. Derivative names are derived from the source
+name (``derivatives/<source>/<width>w.<format>``) so templates can build
+``srcset`` without touching storage; see ``core.templatetags.images``.
+
+Derivatives are generated by a background job queued when a new file is
+saved (``core.tasks.refresh_image_variants``) and by
+``manage.py generate_image_variants`` for existing media.
+"""
+import logging
+import posixpath
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+
+logger = logging.getLogger("core.images")
+
+# Target widths per field; a card is 250-300px wide, so covers top out at 2x that.
+WIDTHS = {
+    "cover": (160, 320, 640),
+    "avatar": (64, 128, 256),
+    "gpay_qr": (200, 400),
+}
+# Models carrying image fields, by model label.
+IMAGE_FIELDS = {
+    "core.Book": ("cover",),
+    "core.UserProfile": ("avatar", "gpay_qr"),
+}
+FORMATS = ("webp", "jpeg")
+QUALITY = {"webp": 80, "jpeg": 82}
+# QR codes must stay scannable.
+LOSSLESS_FIELDS = {"gpay_qr"}
+DERIVATIVES_DIR = "derivatives"
+
+
+def variants_field(field_name):
+    return f"{field_name}_variants"
+
+
+def variant_name(source, width, fmt):
+    stem, _ = posixpath.splitext(source)
+    return posixpath.join(DERIVATIVES_DIR, stem, f"{width}w.{fmt}")
+
+
+def is_current(fieldfile, variants):
+    return bool(fieldfile) and bool(variants) and variants.get("source") == fieldfile.name
+
+
+def _encode(image, fmt, lossless):
+    buffer = BytesIO()
+    if fmt == "jpeg":
+        if image.mode in ("RGBA", "LA", "P"):
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, "white")
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+        image.save(buffer, "JPEG", quality=95 if lossless else QUALITY["jpeg"], optimize=True, progressive=True)
+    else:
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA")
+        image.save(buffer, "WEBP", quality=QUALITY["webp"], lossless=lossless, method=4)
+    return buffer.getvalue()
+
+
+def render_variants(storage, source, field_name):
+    """
+    Write every derivative of ``source`` to ``storage`` and return the
+    ``<field>_variants`` value. Safe to run in a worker process: it only does
+    file I/O, never database access.
+    """
+    with storage.open(source, "rb") as fh:
+        original = Image.open(fh)
+        original.load()
+    original = ImageOps.exif_transpose(original)
+    width, height = original.size
+    lossless = field_name in LOSSLESS_FIELDS
+    # Never upscale; a small source still gets one derivative at its own width.
+    widths = [w for w in WIDTHS[field_name] if w < width] or [width]
+    for target in widths:
+        resized = original.copy()
+        resized.thumbnail((target, round(height * target / width) or 1), Image.LANCZOS)
+        for fmt in FORMATS:
+            name = variant_name(source, target, fmt)
+            if storage.exists(name):
+                storage.delete(name)
+            storage.save(name, ContentFile(_encode(resized, fmt, lossless)))
+    return {"source": source, "widths": widths, "width": width, "height": height}
+
+
+def delete_variants(storage, variants):
+    for width in (variants or {}).get("widths", ()):
+        for fmt in FORMATS:
+            name = variant_name(variants["source"], width, fmt)
+            if storage.exists(name):
+                storage.delete(name)
+
+
+def refresh(instance, field_name, force=False):
+    """
+    Bring one instance's derivatives in line with its current file and store
+    the result with a signal-free UPDATE. Returns True if anything was written.
+    """
+    fieldfile = getattr(instance, field_name)
+    attr = variants_field(field_name)
+    variants = getattr(instance, attr) or {}
+    if not force and (is_current(fieldfile, variants) or (not fieldfile and not variants)):
+        return False
+    if variants.get("source") != fieldfile.name:
+        delete_variants(fieldfile.storage, variants)
+    new_variants = {}
+    if fieldfile:
+        try:
+            new_variants = render_variants(fieldfile.storage, fieldfile.name, field_name)
+        except (OSError, ValueError, Image.DecompressionBombError):
+            # No widths: templates fall back to the original upload, and saves don't retry.
+            logger.warning("Could not generate %s derivatives for %s", field_name, fieldfile.name, exc_info=True)
+            new_variants = {"source": fieldfile.name, "widths": []}
+    setattr(instance, attr, new_variants)
+    type(instance)._default_manager.filter(pk=instance.pk).update(**{attr: new_variants})
+    return True
+
+
+def needs_refresh(instance):
+    """Cheap check (no storage access) for whether any image field has stale derivatives."""
+    for field_name in IMAGE_FIELDS.get(instance._meta.label, ()):
+        fieldfile = getattr(instance, field_name)
+        variants = getattr(instance, variants_field(field_name)) or {}
+        if not is_current(fieldfile, variants) and (fieldfile or variants):
+            return True
+    return False
+
+
+def refresh_all(instance, force=False):
+    label = instance._meta.label
+    return [field_name for field_name in IMAGE_FIELDS.get(label, ()) if refresh(instance, field_name, force=force)]
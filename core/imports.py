@@ -0,0 +1,353 @@
+"""
+Bulk catalog import from CSV or NDJSON, for sellers with large inventories.
+
+Rows are validated a batch at a time with the Book field validators and each
+valid batch is written with one ``bulk_create`` inside a transaction. Because
+``bulk_create`` skips ``save()`` and the model signals, the batch then updates
+the search index, facet counts, dashboard counters and change log in bulk itself.
+
+A row may name a cover image, read from a directory (``DirectoryCovers``, for
+``manage.py import_books``) or an uploaded zip archive (``ZipCovers``). Covers
+are copied into media storage and, given an executor, resized in parallel
+before the batch is written. Covers imported without derivatives get the usual
+background job. Problems are reported per row and never stop the import; a
+batch the database refuses is reported against each of its lines.
+
+Uploads are imported by the ``core.import_catalog`` job (``import_upload()``),
+which commits a ``CatalogImport``'s progress with each batch, so the upload
+page can show it and a retried job resumes after the last committed batch.
+"""
+import csv
+import json
+import os
+import posixpath
+import zipfile
+from contextlib import nullcontext
+from io import BytesIO, TextIOWrapper
+
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.db import DatabaseError, transaction
+from django.utils import timezone
+from PIL import Image
+
+from . import blobs, caching, changes, counters, facets, fuzzy, images, jobs, search
+
+
+BATCH_SIZE = 1000
+FORMATS = ("csv", "ndjson")
+COLUMNS = ("title", "author", "genre", "condition", "description", "availability", "price", "cover")
+COVER_DIR = "book_covers"
+# Uncompressed size limits for cover archives, checked against the zip directory before
+# anything is inflated, so a small upload can't expand into gigabytes.
+MAX_COVER_BYTES = 10 * 1024 * 1024
+MAX_ARCHIVE_BYTES = 500 * 1024 * 1024
+UPLOAD_ERRORS_KEPT = 200  # row errors a CatalogImport keeps for the upload page
+
+
+class ImportFileError(ValueError):
+    """The file as a whole can't be imported (unknown format, missing columns)."""
+
+
+class RowError(ValueError):
+    pass
+
+
+class ImportTakenOver(RuntimeError):
+    """Another run of the same CatalogImport committed progress first."""
+
+
+class DirectoryCovers:
+    """Cover paths relative to ``root`` on the local filesystem."""
+
+    def __init__(self, root):
+        self.root = os.path.realpath(root)
+
+    def read(self, name):
+        path = os.path.realpath(os.path.join(self.root, name))
+        if os.path.commonpath([self.root, path]) != self.root:
+            raise RowError(f"cover {name!r} is outside the covers directory.")
+        try:
+            with open(path, "rb") as fh:
+                return fh.read()
+        except OSError:
+            raise RowError(f"cover {name!r} not found.")
+
+
+class ZipCovers:
+    """Cover paths naming members of an uploaded zip archive."""
+
+    def __init__(self, fileobj):
+        try:
+            self.archive = zipfile.ZipFile(fileobj)
+        except zipfile.BadZipFile:
+            raise ImportFileError("covers must be a zip archive.")
+        if sum(info.file_size for info in self.archive.infolist()) > MAX_ARCHIVE_BYTES:
+            raise ImportFileError(f"the covers archive may hold at most {MAX_ARCHIVE_BYTES // 2**20} MB uncompressed.")
+
+    def read(self, name):
+        try:
+            info = self.archive.getinfo(name)
+        except KeyError:
+            raise RowError(f"cover {name!r} not found in the archive.")
+        if info.file_size > MAX_COVER_BYTES:
+            raise RowError(f"cover {name!r} is larger than {MAX_COVER_BYTES // 2**20} MB.")
+        # A header can understate the size: inflate no more than the cap either way.
+        try:
+            with self.archive.open(info) as member:
+                data = member.read(MAX_COVER_BYTES + 1)
+        except (zipfile.BadZipFile, NotImplementedError, RuntimeError) as exc:
+            raise RowError(f"cover {name!r} can't be read: {exc}")
+        if len(data) > MAX_COVER_BYTES:
+            raise RowError(f"cover {name!r} is larger than {MAX_COVER_BYTES // 2**20} MB.")
+        return data
+
+
+class ImportResult:
+    def __init__(self, errors_kept=None):
+        self.valid = 0
+        self.created = 0
+        self.covers = 0
+        self.error_count = 0
+        self.errors = []  # (line, message), the first ``errors_kept`` of them (all by default)
+        self.errors_kept = errors_kept
+
+    def error(self, line, message):
+        self.error_count += 1
+        if self.errors_kept is None or len(self.errors) < self.errors_kept:
+            self.errors.append((line, message))
+
+
+def detect_format(filename, fmt=None):
+    fmt = fmt or posixpath.splitext(filename or "")[1].lstrip(".").lower()
+    if fmt in ("jsonl", "json"):
+        fmt = "ndjson"
+    if fmt not in FORMATS:
+        raise ImportFileError("format must be csv or ndjson.")
+    return fmt
+
+
+def read_rows(text, fmt):
+    """Yield ``(line, row, error)`` from a text stream; ``row`` is a dict, or None with an error."""
+    if fmt == "csv":
+        reader = csv.DictReader(text)
+        if not reader.fieldnames or "title" not in [name.strip().lower() for name in reader.fieldnames]:
+            raise ImportFileError("the CSV header must include a title column.")
+        for row in reader:
+            yield reader.line_num, {(k or "").strip().lower(): v for k, v in row.items()}, None
+        return
+    for line, raw in enumerate(text, start=1):
+        if not raw.strip():
+            continue
+        try:
+            row = json.loads(raw)
+        except ValueError as exc:
+            yield line, None, f"invalid JSON: {exc}"
+            continue
+        if not isinstance(row, dict):
+            yield line, None, "each line must be a JSON object."
+            continue
+        yield line, {str(k).strip().lower(): v for k, v in row.items()}, None
+
+
+def build_book(owner, row):
+    """A validated, unsaved Book for ``row``, and its cover path. Raises ValidationError."""
+    from .models import Book
+
+    values = {}
+    for column in COLUMNS[:-1]:
+        value = row.get(column)
+        if value is None:
+            continue
+        value = str(value).strip()
+        if value:
+            values[column] = value.lower() if column in ("condition", "availability") else value
+    book = Book(owner=owner, **values)
+    book.clean_fields(exclude=["owner", "cover"])
+    book.genre_key = facets.genre_key(book.genre)
+    book.fuzzy_key = fuzzy.fold(f"{book.title} {book.author}")
+    return book, str(row.get("cover") or "").strip()
+
+
+def prepare_cover(covers, name, render):
+    """
+    Copy one cover into media storage and optionally render its derivatives.
+    Returns ``(stored name, variants, error)``. Does no database access, so it
+    can run in a worker process.
+    """
+    from .models import Book
+
+    try:
+        data = covers.read(name)
+        try:
+            with Image.open(BytesIO(data)) as image:
+                image.verify()
+        except (OSError, ValueError, Image.DecompressionBombError):
+            raise RowError(f"cover {name!r} is not a readable image.")
+        storage = Book._meta.get_field("cover").storage
+        stored = storage.save(posixpath.join(COVER_DIR, posixpath.basename(name.replace("\\", "/"))), ContentFile(data))
+    except RowError as exc:
+        return None, None, str(exc)
+    variants = {}
+    if render:
+        try:
+            variants = images.render_variants(storage, stored, "cover")
+        except (OSError, ValueError, Image.DecompressionBombError):
+            variants = {"source": stored, "widths": []}
+    return stored, variants, None
+
+
+def _format_errors(error):
+    if hasattr(error, "message_dict"):
+        return "; ".join(f"{field}: {' '.join(messages)}" for field, messages in error.message_dict.items())
+    return " ".join(error.messages)
+
+
+def _write_batch(batch, covers, executor, render, result):
+    """Attach covers to ``batch`` (a list of ``(line, book, cover)``) and insert the rows that remain."""
+    from .models import Book
+
+    named = [(line, book, cover) for line, book, cover in batch if cover]
+    if named:
+        if covers is None:
+            outcomes = [(None, None, "covers were given but no cover directory or archive.")] * len(named)
+        else:
+            args = ([covers] * len(named), [cover for _, _, cover in named], [render] * len(named))
+            if executor is None:
+                outcomes = list(map(prepare_cover, *args))
+            else:
+                outcomes = list(executor.map(prepare_cover, *args, chunksize=16))
+        failed = set()
+        for (line, book, _), (stored, variants, error) in zip(named, outcomes):
+            if error:
+                result.error(line, error)
+                failed.add(line)
+            else:
+                book.cover = stored
+                book.cover_variants = variants
+        batch = [entry for entry in batch if entry[0] not in failed]
+    books = [book for _, book, _ in batch]
+    if not books:
+        return
+    try:
+        with transaction.atomic():
+            Book.objects.bulk_create(books)
+            search.index_books(books)
+            fuzzy.index_books(books)
+            facets.books_added(books)
+            counters.rows_added(books)
+            blobs.rows_added(books)
+            changes.books_created(books)
+            for book in books:
+                if images.needs_refresh(book):
+                    jobs.enqueue(
+                        "core.refresh_image_variants",
+                        label=Book._meta.label,
+                        pk=book.pk,
+                        unique_key=f"images:{Book._meta.label}:{book.pk}",
+                    )
+    except Exception as exc:
+        for book in books:
+            if book.cover:
+                images.delete_variants(book.cover.storage, book.cover_variants)
+                book.cover.storage.delete(book.cover.name)
+        if not isinstance(exc, DatabaseError):
+            raise
+        for line, _, _ in batch:
+            result.error(line, f"could not be saved: {exc}")
+        return
+    result.created += len(books)
+    result.covers += sum(1 for book in books if book.cover)
+
+
+def _flush(batch, last_line, covers, executor, render, result, on_batch):
+    with transaction.atomic():
+        _write_batch(batch, covers, executor, render, result)
+        if on_batch is not None:
+            on_batch(result, last_line)
+
+
+def import_books(
+    owner, text, fmt, covers=None, executor=None, render_covers=False, dry_run=False, batch_size=BATCH_SIZE,
+    result=None, start_line=0, on_batch=None,
+):
+    """
+    Import every valid row of ``text`` (a text stream in ``fmt``) as a book
+    owned by ``owner``. ``executor`` (e.g. a ProcessPoolExecutor) prepares
+    covers in parallel; with ``render_covers`` it also makes the derivatives.
+    With ``dry_run`` rows are only validated. Returns an ImportResult.
+
+    To resume, pass the ``result`` so far and the ``start_line`` it covers.
+    ``on_batch(result, last_line)`` runs in each batch's transaction, the
+    last time with whatever rows remain.
+    """
+    result = result or ImportResult()
+    batch = []
+    last_line = start_line
+    for line, row, error in read_rows(text, fmt):
+        if line <= start_line:
+            continue
+        last_line = line
+        if error:
+            result.error(line, error)
+            continue
+        try:
+            book, cover = build_book(owner, row)
+        except ValidationError as exc:
+            result.error(line, _format_errors(exc))
+            continue
+        result.valid += 1
+        batch.append((line, book, cover))
+        if len(batch) >= batch_size:
+            if not dry_run:
+                _flush(batch, last_line, covers, executor, render_covers, result, on_batch)
+            batch = []
+    if not dry_run and (batch or on_batch is not None):
+        _flush(batch, last_line, covers, executor, render_covers, result, on_batch)
+    if result.created:
+        caching.invalidate_catalog()
+    result.errors.sort()
+    return result
+
+
+def import_upload(import_id):
+    """Run a CatalogImport, resuming after the progress an earlier attempt committed."""
+    from .models import CatalogImport
+
+    upload = CatalogImport.objects.select_related("owner").filter(pk=import_id, status__in=("queued", "running")).first()
+    if upload is None:
+        return
+    CatalogImport.objects.filter(pk=upload.pk).update(status="running")
+    result = ImportResult(errors_kept=UPLOAD_ERRORS_KEPT)
+    result.valid, result.created, result.covers = upload.valid, upload.created, upload.covers_imported
+    result.error_count, result.errors = upload.error_count, [tuple(error) for error in upload.errors]
+    progress = {"line": upload.processed}
+
+    def on_batch(result, last_line):
+        # Compare-and-set on the line, so two runs of one import can't both commit a batch.
+        saved = CatalogImport.objects.filter(pk=upload.pk, processed=progress["line"]).update(
+            processed=last_line, valid=result.valid, created=result.created, covers_imported=result.covers,
+            error_count=result.error_count, errors=sorted(result.errors),
+        )
+        if not saved:
+            raise ImportTakenOver(f"Catalog import {upload.pk} moved past line {progress['line']} meanwhile.")
+        progress["line"] = last_line
+
+    try:
+        with upload.file.open("rb") as raw, (upload.covers.open("rb") if upload.covers else nullcontext()) as archive:
+            text = TextIOWrapper(raw, encoding="utf-8-sig", newline="")
+            covers = ZipCovers(archive) if archive else None
+            import_books(
+                upload.owner, text, upload.format, covers=covers, batch_size=BATCH_SIZE,
+                result=result, start_line=upload.processed, on_batch=on_batch,
+            )
+    except (ImportFileError, UnicodeDecodeError) as exc:
+        status, message = "failed", str(exc)
+    else:
+        status, message = "done", ""
+    for field in (upload.file, upload.covers):
+        if field:
+            field.delete(save=False)
+    CatalogImport.objects.filter(pk=upload.pk).update(
+        status=status, message=message, file="", covers="", finished_at=timezone.now()
+    )
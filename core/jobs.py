@@ -0,0 +1,267 @@
+"""
+A small job queue stored in the ``Job`` table, so slow work can leave the
+request cycle without running a separate broker.
+
+Tasks are plain functions registered with ``@task`` (``core/tasks.py`` and any
+other app's ``tasks`` module). Views call ``enqueue()``; ``manage.py run_jobs``
+claims due rows with ``SELECT ... FOR UPDATE SKIP LOCKED`` on PostgreSQL (a
+compare-and-set UPDATE elsewhere), runs them in a thread pool and retries
+failures with exponential backoff. Tasks declared with ``every=`` reschedule
+themselves after each run, including one that failed for good.
+
+A task's writes commit together with its job being marked done. A task
+declared with ``atomic=False`` (a long import, say) commits its own work as it
+goes instead, so it must pick up where an earlier attempt stopped.
+
+A worker refreshes ``locked_at`` of the jobs it is running every
+``HEARTBEAT_INTERVAL``, so only jobs whose worker stopped doing so for
+``STALE_AFTER`` are put back on the queue. A job only counts as done if it is
+still locked by the worker finishing it; otherwise its writes roll back.
+
+With ``JOB_QUEUE_EAGER = True`` jobs run in-process once the enqueuing
+transaction commits, for local development without a worker.
+"""
+import logging
+import os
+import random
+import socket
+import threading
+import traceback
+from contextlib import nullcontext
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, connection, connections, transaction
+from django.utils import timezone
+from django.utils.module_loading import autodiscover_modules
+
+
+logger = logging.getLogger("core.jobs")
+
+BACKOFF_BASE = 10  # seconds before the first retry
+BACKOFF_MAX = 60 * 60
+STALE_AFTER = timedelta(minutes=15)  # no heartbeat for this long means the worker died
+HEARTBEAT_INTERVAL = 60  # seconds between refreshes of a running job's locked_at
+ERROR_BACKOFF_MAX = 60  # seconds a worker thread waits after repeated errors, e.g. a database outage
+DONE_RETENTION = timedelta(days=7)
+
+_registry = {}
+
+
+class JobLost(Exception):
+    """The job was requeued and claimed by another worker while this one was running it."""
+
+
+class Task:
+    def __init__(self, func, name, max_attempts, every, atomic):
+        self.func = func
+        self.name = name
+        self.max_attempts = max_attempts
+        self.every = every
+        self.atomic = atomic
+
+
+def task(name=None, *, max_attempts=5, every=None, atomic=True):
+    """
+    Register a function as a job. ``every`` (a timedelta) makes it periodic.
+    With ``atomic=False`` the task runs outside a transaction and commits its own work.
+    """
+    def decorator(func):
+        registered = Task(func, name or f"{func.__module__}.{func.__name__}", max_attempts, every, atomic)
+        _registry[registered.name] = registered
+        func.task = registered
+        return func
+    return decorator
+
+
+def autodiscover():
+    autodiscover_modules("tasks")
+
+
+def get_task(name):
+    if name not in _registry:
+        autodiscover()
+    return _registry[name]
+
+
+def enqueue(func_or_name, *, delay=None, run_at=None, unique_key=None, **kwargs):
+    """
+    Queue ``func_or_name(**kwargs)``. ``kwargs`` must be JSON-serializable.
+    With ``unique_key`` an already queued or running job with that key is
+    returned instead of adding a duplicate. Returns the Job (None when eager).
+    """
+    from .models import Job
+
+    registered = func_or_name.task if callable(func_or_name) else get_task(func_or_name)
+    if getattr(settings, "JOB_QUEUE_EAGER", False):
+        transaction.on_commit(lambda: registered.func(**kwargs))
+        return None
+    if run_at is None:
+        run_at = timezone.now() + (delay or timedelta())
+    job = Job(task=registered.name, kwargs=kwargs, run_at=run_at, unique_key=unique_key, max_attempts=registered.max_attempts)
+    if unique_key is None:
+        job.save()
+        return job
+    try:
+        with transaction.atomic():
+            job.save()
+        return job
+    except IntegrityError:
+        return Job.objects.filter(unique_key=unique_key, status__in=Job.ACTIVE).first()
+
+
+def schedule_periodic():
+    """Make sure every periodic task has a queued or running job."""
+    autodiscover()
+    for registered in list(_registry.values()):
+        if registered.every:
+            enqueue(registered.name, unique_key=registered.name)
+
+
+def claim(worker_id):
+    """Mark the next due job as running for ``worker_id`` and return it, or None."""
+    from .models import Job
+
+    now = timezone.now()
+    with transaction.atomic():
+        due = Job.objects.filter(status="queued", run_at__lte=now).order_by("run_at", "id")
+        if connection.features.has_select_for_update_skip_locked:
+            due = due.select_for_update(skip_locked=True)
+        for job in due[:5]:
+            # Without row locks two workers can pick the same row; only one wins this UPDATE.
+            claimed = Job.objects.filter(pk=job.pk, status="queued").update(
+                status="running", locked_by=worker_id, locked_at=now, attempts=job.attempts + 1
+            )
+            if claimed:
+                job.status, job.locked_by, job.locked_at, job.attempts = "running", worker_id, now, job.attempts + 1
+                return job
+    return None
+
+
+def backoff(attempts):
+    delay = min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+    return timedelta(seconds=delay * random.uniform(0.75, 1.25))
+
+
+def execute(job):
+    """Run a claimed job and record the outcome. Returns True on success."""
+    from .models import Job
+
+    mine = Job.objects.filter(pk=job.pk, status="running", locked_by=job.locked_by)
+    registered = None
+    try:
+        registered = get_task(job.task)
+        with transaction.atomic() if registered.atomic else nullcontext():
+            registered.func(**job.kwargs)
+            # Done commits with the task's writes, so a worker dying in between can't run them twice.
+            if not mine.update(status="done", finished_at=timezone.now(), last_error=""):
+                raise JobLost(f"Job {job.pk} is no longer locked by {job.locked_by}.")
+    except JobLost:
+        logger.warning("Job %s (%s) was taken over by another worker", job.pk, job.task)
+        return False
+    except Exception:
+        error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            logger.warning("Job %s (%s) failed, attempt %d of %d", job.pk, job.task, job.attempts, job.max_attempts)
+            mine.update(status="queued", run_at=timezone.now() + backoff(job.attempts), last_error=error)
+            return False
+        logger.error("Job %s (%s) failed for good after %d attempts\n%s", job.pk, job.task, job.attempts, error)
+        mine.update(status="failed", finished_at=timezone.now(), last_error=error)
+        success = False
+    else:
+        success = True
+    if registered is not None and registered.every:
+        enqueue(registered.name, delay=registered.every, unique_key=registered.name)
+    return success
+
+
+def heartbeat(worker_ids):
+    """Refresh ``locked_at`` of the jobs ``worker_ids`` are running, so requeue_stale() leaves them alone."""
+    from .models import Job
+
+    return Job.objects.filter(status="running", locked_by__in=worker_ids).update(locked_at=timezone.now())
+
+
+def requeue_stale(stale_after=STALE_AFTER):
+    """Put jobs whose worker vanished mid-run back on the queue."""
+    from .models import Job
+
+    cutoff = timezone.now() - stale_after
+    return Job.objects.filter(status="running", locked_at__lt=cutoff).update(status="queued", locked_by="")
+
+
+def run_pending(worker_id="inline"):
+    """Run every due job in this thread. Returns the number of jobs run."""
+    count = 0
+    while (job := claim(worker_id)) is not None:
+        execute(job)
+        count += 1
+    return count
+
+
+class Worker:
+    """``concurrency`` threads claiming and running jobs until ``stop()`` (or the queue drains, with ``burst``)."""
+
+    def __init__(self, concurrency=1, poll_interval=1.0, burst=False):
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.burst = burst
+        self.stopping = threading.Event()
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+
+    def stop(self):
+        self.stopping.set()
+
+    def run(self):
+        autodiscover()
+        requeue_stale()
+        schedule_periodic()
+        worker_ids = [f"{self.name}:{i}" for i in range(self.concurrency)]
+        threads = [
+            threading.Thread(target=self._loop, args=(worker_id,), name=f"job-worker-{i}", daemon=True)
+            for i, worker_id in enumerate(worker_ids)
+        ]
+        for thread in threads:
+            thread.start()
+        threading.Thread(target=self._heartbeat, args=(worker_ids,), name="job-heartbeat", daemon=True).start()
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(timeout=0.5)
+        self.stopping.set()  # ends the heartbeat once a burst run drains the queue
+
+    def _loop(self, worker_id):
+        errors = 0
+        try:
+            while not self.stopping.is_set():
+                try:
+                    close_old_connections()
+                    job = claim(worker_id)
+                    if job is None:
+                        if self.burst:
+                            return
+                        requeue_stale()
+                        self.stopping.wait(self.poll_interval)
+                    else:
+                        execute(job)
+                    errors = 0
+                except Exception:
+                    # A database outage or dropped connection; keep the thread alive and retry.
+                    errors += 1
+                    logger.exception("Job worker %s failed, retrying", worker_id)
+                    connections.close_all()
+                    self.stopping.wait(min(self.poll_interval * 2 ** errors, ERROR_BACKOFF_MAX))
+        finally:
+            connections.close_all()
+
+    def _heartbeat(self, worker_ids):
+        try:
+            while not self.stopping.wait(HEARTBEAT_INTERVAL):
+                try:
+                    close_old_connections()
+                    heartbeat(worker_ids)
+                except Exception:
+                    logger.exception("Job worker %s heartbeat failed", self.name)
+                    connections.close_all()
+        finally:
+            connections.close_all()
+
@@ -0,0 +1,100 @@
+import asyncio
+import statistics
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        "Load a running server with N concurrent clients per level, optionally while slow clients "
+        "trickle their request headers, and report throughput and latency. Start the server first, e.g.\n"
+        "  gunicorn book_exchange.wsgi:application -w 4                                 (sync)\n"
+        "  gunicorn book_exchange.asgi:application -w 4 -k uvicorn_worker.UvicornWorker  (async)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="http://127.0.0.1:8000", help="Server base URL.")
+        parser.add_argument("--paths", default="/,/books/", help="Comma-separated paths to request in turn.")
+        parser.add_argument("--concurrency", default="10,50,200", help="Comma-separated client counts to try.")
+        parser.add_argument("--duration", type=float, default=10.0, help="Seconds per concurrency level.")
+        parser.add_argument("--slow-clients", type=int, default=0, help="Clients that send headers one byte every 0.5s.")
+        parser.add_argument("--timeout", type=float, default=30.0, help="Per-request timeout in seconds.")
+
+    def handle(self, *args, **options):
+        url = urlsplit(options["url"])
+        self.host, self.port = url.hostname, url.port or 80
+        self.paths = [p.strip() for p in options["paths"].split(",") if p.strip()]
+        self.timeout = options["timeout"]
+        self.stdout.write(f"{'clients':>8} {'slow':>5} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {'errors':>7}")
+        for level in (int(n) for n in options["concurrency"].split(",")):
+            result = asyncio.run(self.run_level(level, options["slow_clients"], options["duration"]))
+            self.stdout.write(
+                f"{level:>8} {options['slow_clients']:>5} {result['rps']:>8.1f} {result['p50']:>8.1f} "
+                f"{result['p95']:>8.1f} {result['max']:>8.1f} {result['errors']:>7}"
+            )
+
+    async def request(self, path, slow=False):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            head = f"GET {path} HTTP/1.1\r\nHost: {self.host}\r\nConnection: close\r\n\r\n".encode()
+            if slow:
+                for i in range(len(head)):
+                    writer.write(head[i:i + 1])
+                    await writer.drain()
+                    await asyncio.sleep(0.5)
+            else:
+                writer.write(head)
+                await writer.drain()
+            status_line = await reader.readline()
+            await reader.read()
+            return int(status_line.split()[1])
+        finally:
+            writer.close()
+
+    async def run_level(self, clients, slow_clients, duration):
+        deadline = time.monotonic() + duration
+        latencies, errors = [], 0
+
+        async def client(offset):
+            nonlocal errors
+            i = offset
+            while time.monotonic() < deadline:
+                path = self.paths[i % len(self.paths)]
+                i += 1
+                start = time.monotonic()
+                try:
+                    status = await asyncio.wait_for(self.request(path), self.timeout)
+                except (OSError, asyncio.TimeoutError, IndexError, ValueError):
+                    errors += 1
+                    continue
+                if status >= 400:
+                    errors += 1
+                else:
+                    latencies.append((time.monotonic() - start) * 1000)
+
+        async def slow_client():
+            while time.monotonic() < deadline:
+                try:
+                    await self.request(self.paths[0], slow=True)
+                except OSError:
+                    await asyncio.sleep(0.5)
+
+        slow = [asyncio.create_task(slow_client()) for _ in range(slow_clients)]
+        await asyncio.sleep(0.5 if slow_clients else 0)  # let the slow clients occupy their connections
+        started = time.monotonic()
+        await asyncio.gather(*(client(n) for n in range(clients)))
+        elapsed = time.monotonic() - started
+        for task in slow:
+            task.cancel()
+        await asyncio.gather(*slow, return_exceptions=True)
+
+        ordered = sorted(latencies) or [0.0]
+        return {
+            "rps": len(latencies) / elapsed if elapsed else 0.0,
+            "p50": statistics.median(ordered),
+            "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+            "max": ordered[-1],
+            "errors": errors,
+        }
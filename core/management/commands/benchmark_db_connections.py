@@ -0,0 +1,84 @@
+import statistics
+import time
+from copy import deepcopy
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+
+
+MODES = ("fresh", "persistent", "pool")
+
+
+class Command(BaseCommand):
+    help = (
+        "Time simulated requests against the default database under each connection mode: fresh "
+        "(a new connection per request), persistent (CONN_MAX_AGE with health checks) and pool "
+        "(psycopg's pool, PostgreSQL only). Each request opens, runs --queries SELECTs and is "
+        "closed the way Django's request signals do it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=500, help="Requests per mode.")
+        parser.add_argument("--queries", type=int, default=3, help="Queries per request.")
+        parser.add_argument("--modes", default=",".join(MODES), help="Comma-separated modes.")
+
+    def handle(self, *args, **options):
+        modes = [mode.strip() for mode in options["modes"].split(",") if mode.strip()]
+        unknown = set(modes) - set(MODES)
+        if unknown:
+            raise CommandError(f"Unknown mode(s): {', '.join(sorted(unknown))}.")
+        self.stdout.write(f"{'mode':<12} {'p50 ms':>8} {'p95 ms':>8} {'mean ms':>8}")
+        for mode in modes:
+            wrapper = self.connect(mode)
+            if wrapper is None:
+                self.stdout.write(f"{mode:<12} skipped (needs PostgreSQL and psycopg_pool)")
+                continue
+            try:
+                timings = self.run_mode(wrapper, options["requests"], max(1, options["queries"]))
+            finally:
+                wrapper.close()
+                if mode == "pool":
+                    wrapper.close_pool()
+                del connections[wrapper.alias]
+                del connections.settings[wrapper.alias]
+            p95 = statistics.quantiles(timings, n=20)[-1] if len(timings) > 1 else timings[0]
+            self.stdout.write(f"{mode:<12} {statistics.median(timings):>8.2f} {p95:>8.2f} {statistics.fmean(timings):>8.2f}")
+
+    def connect(self, mode):
+        """A private connection to the default database configured for ``mode``, or None if unsupported."""
+        settings_dict = deepcopy(connection.settings_dict)
+        configured_pool = settings_dict["OPTIONS"].pop("pool", None)
+        settings_dict["CONN_MAX_AGE"] = 0
+        if mode == "persistent":
+            settings_dict["CONN_MAX_AGE"] = None
+            settings_dict["CONN_HEALTH_CHECKS"] = True
+        elif mode == "pool":
+            if connection.vendor != "postgresql":
+                return None
+            try:
+                import psycopg_pool  # noqa: F401
+            except ImportError:
+                return None
+            settings_dict["CONN_HEALTH_CHECKS"] = True
+            settings_dict["OPTIONS"]["pool"] = configured_pool or {"min_size": 1, "max_size": 2}
+        # Registered under its own alias: the psycopg backend keeps one pool per alias.
+        alias = f"benchmark_{mode}"
+        connections.settings[alias] = settings_dict
+        return connections[alias]
+
+    def run_mode(self, wrapper, requests, queries):
+        def request():
+            wrapper.close_if_unusable_or_obsolete()  # request_started
+            with wrapper.cursor() as cursor:
+                for _ in range(queries):
+                    cursor.execute("SELECT 1")
+                    cursor.fetchone()
+            wrapper.close_if_unusable_or_obsolete()  # request_finished
+
+        request()  # connect (and fill the pool) before timing
+        timings = []
+        for _ in range(requests):
+            started = time.perf_counter()
+            request()
+            timings.append((time.perf_counter() - started) * 1000)
+        return timings
@@ -0,0 +1,45 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+
+
+class Command(BaseCommand):
+    help = (
+        "Log a throwaway user in under each session mode, request authenticated pages and report "
+        "database queries (total and django_session) and time per request. Nothing is kept."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--paths", default="/dashboard/,/my-books/,/books/", help="Comma-separated paths to request in turn.")
+        parser.add_argument("--requests", type=int, default=200, help="Requests per mode.")
+        parser.add_argument("--modes", default=",".join(settings.SESSION_ENGINES), help="Comma-separated session modes.")
+
+    def handle(self, *args, **options):
+        paths = [p.strip() for p in options["paths"].split(",") if p.strip()]
+        self.stdout.write(f"{'mode':<16} {'queries/req':>12} {'session q/req':>14} {'ms/req':>8}")
+        for mode in options["modes"].split(","):
+            with override_settings(SESSION_ENGINE=settings.SESSION_ENGINES[mode], ALLOWED_HOSTS=["testserver"]):
+                total, session, elapsed = self.run_mode(paths, options["requests"])
+            n = options["requests"]
+            self.stdout.write(f"{mode:<16} {total / n:>12.2f} {session / n:>14.2f} {elapsed / n * 1000:>8.2f}")
+
+    def run_mode(self, paths, requests):
+        with transaction.atomic():
+            user = User.objects.create_user("session-benchmark", password="unused")
+            client = Client()
+            client.force_login(user)
+            for path in paths:  # warm caches and the session
+                client.get(path)
+            with CaptureQueriesContext(connection) as ctx:
+                started = time.perf_counter()
+                for i in range(requests):
+                    client.get(paths[i % len(paths)])
+                elapsed = time.perf_counter() - started
+            transaction.set_rollback(True)
+        session = sum(1 for query in ctx.captured_queries if "django_session" in query["sql"])
+        return len(ctx.captured_queries), session, elapsed
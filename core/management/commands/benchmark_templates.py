@@ -0,0 +1,118 @@
+import gzip
+import io
+import os
+import subprocess
+import tarfile
+import tempfile
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.staticfiles import finders
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import Client, override_settings
+
+try:
+    import brotli
+except ImportError:  # WhiteNoise only writes .br files when Brotli is installed
+    brotli = None
+
+
+BUNDLES = ("css/bookswap.css", "js/bookswap.js")
+PATHS = (
+    "/,/books/,/login/,/signup/,/dashboard/,/my-books/,/purchase/,/swap/,/purchases/,/sales/,"
+    "/settings/,/review/,/swap/history/,/swap/received/,/payments/seller/"
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Request pages as a throwaway user with the cached template loader and report HTML bytes (raw and "
+        "gzipped) and time per request; with --baseline, the same for the templates of another git revision. "
+        "Nothing is kept."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--paths", default=PATHS, help="Comma-separated paths to request.")
+        parser.add_argument("--requests", type=int, default=50, help="Requests per page and template set.")
+        parser.add_argument("--rounds", type=int, default=3, help="Times to measure each template set.")
+        parser.add_argument("--baseline", help="Git revision whose core/templates to compare with, e.g. HEAD~1.")
+
+    def handle(self, *args, **options):
+        paths = [p.strip() for p in options["paths"].split(",") if p.strip()]
+        with tempfile.TemporaryDirectory() as tmp:
+            template_sets = [[]]
+            if options["baseline"]:
+                self.extract_templates(options["baseline"], tmp)
+                template_sets.append([os.path.join(tmp, "core", "templates")])
+            # Alternate the sets and keep each page's best time, so neither pays for warming shared caches.
+            best = [{} for _ in template_sets]
+            for _ in range(options["rounds"]):
+                for results, template_dirs in zip(best, template_sets):
+                    for path, row in self.measure(paths, options["requests"], template_dirs).items():
+                        results[path] = min(results.get(path, row), row, key=lambda r: r[2])
+        current, baseline = best[0], best[1] if options["baseline"] else None
+
+        header = f"{'path':<22} {'bytes':>8} {'gzip':>7} {'ms/req':>7}"
+        if baseline:
+            header += f" | {'baseline':>8} {'gzip':>7} {'ms/req':>7}"
+        self.stdout.write(header)
+        totals = [0] * 6
+        for path in paths:
+            row = current[path] + (baseline[path] if baseline else ())
+            totals = [total + value for total, value in zip(totals, row)]
+            self.stdout.write(self.format_row(path, row))
+        self.stdout.write(self.format_row("total", tuple(totals[:6 if baseline else 3])))
+
+        self.stdout.write("\nShared static bundles, fetched once and then cached:")
+        for bundle in BUNDLES:
+            path = finders.find(bundle)
+            with open(path, "rb") as fh:
+                data = fh.read()
+            compressed = f"{len(gzip.compress(data)):>7} gzip"
+            if brotli is not None:
+                compressed += f" {len(brotli.compress(data)):>7} brotli"
+            self.stdout.write(f"  {bundle:<20} {len(data):>8} {compressed}")
+
+    def format_row(self, label, row):
+        line = f"{label:<22} {row[0]:>8} {row[1]:>7} {row[2]:>7.2f}"
+        if len(row) == 6:
+            line += f" | {row[3]:>8} {row[4]:>7} {row[5]:>7.2f}"
+        return line
+
+    def extract_templates(self, revision, target):
+        result = subprocess.run(
+            ["git", "archive", "--format=tar", revision, "core/templates"],
+            cwd=settings.BASE_DIR, capture_output=True,
+        )
+        if result.returncode:
+            raise CommandError(result.stderr.decode().strip() or f"git archive {revision} failed")
+        with tarfile.open(fileobj=io.BytesIO(result.stdout)) as archive:
+            archive.extractall(target, filter="data")
+
+    def measure(self, paths, requests, template_dirs):
+        engine = settings.TEMPLATES[0]
+        templates = [{
+            **engine,
+            "DIRS": [*template_dirs, *engine.get("DIRS", [])],
+            "OPTIONS": {**engine["OPTIONS"], "loaders": [("django.template.loaders.cached.Loader", settings.TEMPLATE_LOADERS)]},
+        }]
+        # Plain static storage, so the report does not need collectstatic's manifest.
+        storages = {**settings.STORAGES, "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"}}
+        results = {}
+        with override_settings(TEMPLATES=templates, STORAGES=storages, ALLOWED_HOSTS=["testserver"]), transaction.atomic():
+            user = User.objects.create_user("template-benchmark", password="unused")
+            client = Client()
+            client.force_login(user)
+            for path in paths:
+                response = client.get(path)  # warms the template cache
+                if response.status_code != 200:
+                    self.stderr.write(f"{path}: HTTP {response.status_code}")
+                started = time.perf_counter()
+                for _ in range(requests):
+                    client.get(path)
+                elapsed = time.perf_counter() - started
+                results[path] = (len(response.content), len(gzip.compress(response.content)), elapsed / requests * 1000)
+            transaction.set_rollback(True)
+        return results
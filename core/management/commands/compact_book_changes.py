@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from core import changes
+
+
+class Command(BaseCommand):
+    help = (
+        "Compact the catalog change log: drop entries superseded by a newer one for the same book "
+        "and delete tombstones past their retention window."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Count the entries that would go without deleting them.")
+
+    def handle(self, *args, **options):
+        removed = changes.compact(dry_run=options["dry_run"])
+        verb = "Would remove" if options["dry_run"] else "Removed"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {removed} change log entries."))
@@ -0,0 +1,29 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.template.defaultfilters import filesizeformat
+
+from core import blobs
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete content-addressed media nothing refers to any more (and their image derivatives), "
+        "plus leftovers of interrupted uploads."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Report what would be removed without removing it.")
+        parser.add_argument(
+            "--grace-hours", type=float, default=blobs.GRACE.total_seconds() / 3600,
+            help="Keep unreferenced blobs touched more recently than this (default: %(default)s).",
+        )
+        parser.add_argument("--recount", action="store_true", help="Recompute reference counts from the file fields first.")
+
+    def handle(self, *args, **options):
+        if options["recount"]:
+            fixed = blobs.recount(dry_run=options["dry_run"])
+            self.stdout.write(f"{'Would fix' if options['dry_run'] else 'Fixed'} {len(fixed)} reference counts.")
+        removed, freed = blobs.collect(grace=timedelta(hours=options["grace_hours"]), dry_run=options["dry_run"])
+        verb = "Would remove" if options["dry_run"] else "Removed"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {removed} files ({filesizeformat(freed)})."))
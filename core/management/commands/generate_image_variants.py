@@ -0,0 +1,56 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from PIL import Image
+
+from core import images
+
+
+def _render(label, field_name, source):
+    # Runs in a worker process: file I/O only, the parent writes the results.
+    storage = apps.get_model(label)._meta.get_field(field_name).storage
+    try:
+        return images.render_variants(storage, source, field_name), None
+    except (OSError, ValueError, Image.DecompressionBombError) as exc:
+        return {"source": source, "widths": []}, str(exc)
+
+
+class Command(BaseCommand):
+    help = "Generate resized WebP/JPEG derivatives for existing book covers, avatars and GPay QR codes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes (default: CPU count).")
+        parser.add_argument("--force", action="store_true", help="Regenerate derivatives that are already current.")
+
+    def pending(self, force):
+        for label, field_names in images.IMAGE_FIELDS.items():
+            model = apps.get_model(label)
+            for field_name in field_names:
+                attr = images.variants_field(field_name)
+                rows = model.objects.exclude(**{field_name: ""}).exclude(**{f"{field_name}__isnull": True})
+                for pk, source, variants in rows.values_list("pk", field_name, attr).iterator(chunk_size=2000):
+                    if force or (variants or {}).get("source") != source:
+                        yield label, pk, field_name, source, variants
+
+    def handle(self, *args, **options):
+        jobs = list(self.pending(options["force"]))
+        done = failed = 0
+        with ProcessPoolExecutor(max_workers=max(1, options["workers"]), initializer=django.setup) as pool:
+            futures = {pool.submit(_render, label, field_name, source): (label, pk, field_name, source, old)
+                       for label, pk, field_name, source, old in jobs}
+            for future in as_completed(futures):
+                label, pk, field_name, source, old = futures[future]
+                model = apps.get_model(label)
+                variants, error = future.result()
+                if old and old.get("source") != source:
+                    images.delete_variants(model._meta.get_field(field_name).storage, old)
+                model.objects.filter(pk=pk).update(**{images.variants_field(field_name): variants})
+                if error:
+                    failed += 1
+                    self.stderr.write(f"{label} {pk} {field_name}: {source}: {error}")
+                else:
+                    done += 1
+        self.stdout.write(self.style.SUCCESS(f"Generated derivatives for {done} images ({failed} failed)."))
@@ -0,0 +1,58 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from core import imports
+
+
+class Command(BaseCommand):
+    help = (
+        "Import books for one seller from a CSV or NDJSON file. Columns: title (required), author, genre, "
+        "condition, description, availability, price and cover (a path under --covers-dir)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV or NDJSON file to import.")
+        parser.add_argument("--owner", required=True, help="Username that will own the imported books.")
+        parser.add_argument("--format", choices=imports.FORMATS, help="File format (default: from the file extension).")
+        parser.add_argument("--covers-dir", help="Directory the cover column is relative to.")
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Processes preparing covers (default: CPU count).")
+        parser.add_argument("--batch-size", type=int, default=imports.BATCH_SIZE, help="Rows validated and inserted per transaction.")
+        parser.add_argument("--dry-run", action="store_true", help="Only validate the rows; covers are not checked.")
+
+    def handle(self, *args, **options):
+        try:
+            owner = User.objects.get(username=options["owner"])
+        except User.DoesNotExist:
+            raise CommandError(f"No user named {options['owner']!r}.")
+        covers = imports.DirectoryCovers(options["covers_dir"]) if options["covers_dir"] else None
+        started = time.monotonic()
+        try:
+            fmt = imports.detect_format(options["path"], options["format"])
+            with open(options["path"], encoding="utf-8-sig", newline="") as text:
+                if covers is None or options["dry_run"]:
+                    result = self.run(owner, text, fmt, None, None, options)
+                else:
+                    with ProcessPoolExecutor(max_workers=max(1, options["workers"]), initializer=django.setup) as pool:
+                        result = self.run(owner, text, fmt, covers, pool, options)
+        except (OSError, UnicodeDecodeError, imports.ImportFileError) as exc:
+            raise CommandError(str(exc))
+
+        for line, message in result.errors:
+            self.stderr.write(f"line {line}: {message}")
+        elapsed = time.monotonic() - started
+        if options["dry_run"]:
+            summary = f"{result.valid} valid rows, {result.error_count} errors ({elapsed:.1f}s)."
+        else:
+            summary = f"Imported {result.created} books ({result.covers} with covers), {result.error_count} errors ({elapsed:.1f}s)."
+        self.stdout.write(self.style.SUCCESS(summary) if not result.error_count else self.style.WARNING(summary))
+
+    def run(self, owner, text, fmt, covers, pool, options):
+        return imports.import_books(
+            owner, text, fmt, covers=covers, executor=pool, render_covers=pool is not None,
+            dry_run=options["dry_run"], batch_size=max(1, options["batch_size"]),
+        )
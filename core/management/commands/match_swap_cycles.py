@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from core import cycles
+from core.models import SwapRequest
+
+
+class Command(BaseCommand):
+    help = (
+        "Propose swap circles for every pending swap request, e.g. after deploying the matcher. "
+        "New requests are matched as they arrive."
+    )
+
+    def handle(self, *args, **options):
+        proposed = 0
+        for swap_id in SwapRequest.objects.filter(status="pending").order_by("id").values_list("id", flat=True).iterator():
+            proposed += len(cycles.propose(swap_id))
+        self.stdout.write(self.style.SUCCESS(f"Proposed {proposed} swap circles."))
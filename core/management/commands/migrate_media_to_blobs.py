@@ -0,0 +1,71 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.template.defaultfilters import filesizeformat
+
+from core import blobs, images, jobs
+
+
+class Command(BaseCommand):
+    help = (
+        "Move covers, avatars, GPay QR codes and payment screenshots saved under their upload_to paths into "
+        "the content-addressed store, pointing every row at its blob. Image derivatives are regenerated by "
+        "queued jobs."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Hash the files and report the savings without moving anything.")
+        parser.add_argument("--delete-originals", action="store_true", help="Remove the old files once every row points at its blob.")
+
+    def legacy_names(self, model, field_name):
+        rows = model._default_manager.exclude(**{field_name: ""}).exclude(**{f"{field_name}__isnull": True})
+        rows = rows.exclude(**{f"{field_name}__startswith": blobs.BLOB_DIR + "/"})
+        return rows.order_by().values_list(field_name, flat=True).distinct().iterator(chunk_size=2000)
+
+    def handle(self, *args, **options):
+        storage = blobs.storage
+        dry_run = options["dry_run"]
+        moved, missing, size, stored = [], 0, 0, {}
+        for label, field_names in blobs.FILE_FIELDS.items():
+            model = apps.get_model(label)
+            for field_name in field_names:
+                for name in list(self.legacy_names(model, field_name)):
+                    if not storage.exists(name):
+                        missing += 1
+                        self.stderr.write(f"{label}.{field_name}: {name} is missing, left as is.")
+                        continue
+                    with storage.open(name, "rb") as fh:
+                        if dry_run:
+                            content_hash, blob_size = blobs.digest(fh)
+                        else:
+                            blob = storage.save(name, fh)
+                            content_hash, blob_size = blob, storage.size(blob)
+                    size += storage.size(name)
+                    stored[content_hash] = blob_size
+                    moved.append(name)
+                    if not dry_run:
+                        self.repoint(model, field_name, name, blob)
+        if options["delete_originals"] and not dry_run:
+            for name in moved:
+                storage.delete(name)
+        verb = "Would move" if dry_run else "Moved"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {len(moved)} files ({filesizeformat(size)}) into {len(stored)} blobs "
+            f"({filesizeformat(sum(stored.values()))}); {missing} missing."
+        ))
+
+    def repoint(self, model, field_name, name, blob):
+        with transaction.atomic():
+            rows = model._default_manager.filter(**{field_name: name})
+            pks = list(rows.values_list("pk", flat=True))
+            # Signal-free, so the references are counted here.
+            updated = model._default_manager.filter(pk__in=pks, **{field_name: name}).update(**{field_name: blob})
+            blobs.adjust({blob: updated})
+            if field_name in images.IMAGE_FIELDS.get(model._meta.label, ()):
+                for pk in pks:
+                    jobs.enqueue(
+                        "core.refresh_image_variants",
+                        label=model._meta.label,
+                        pk=pk,
+                        unique_key=f"images:{model._meta.label}:{pk}",
+                    )
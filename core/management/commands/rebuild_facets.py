@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from core import facets
+
+
+class Command(BaseCommand):
+    help = "Recompute the precomputed facet counts used by the catalog filters."
+
+    def handle(self, *args, **options):
+        count = facets.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Wrote {count} facet counts."))
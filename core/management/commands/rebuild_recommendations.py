@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from core import recommendations
+
+
+class Command(BaseCommand):
+    help = "Recompute the \"readers also swapped\" neighbours of every book and every reader's suggestions."
+
+    def handle(self, *args, **options):
+        book_rows, reader_rows = recommendations.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Wrote {book_rows} book neighbours and {reader_rows} reader recommendations."))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from core import fuzzy, search
+
+
+class Command(BaseCommand):
+    help = "Recompute the full-text search document and fuzzy match key for every book."
+
+    def handle(self, *args, **options):
+        count = search.rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f"Reindexed {count} books."))
+        count = fuzzy.rebuild_keys()
+        self.stdout.write(self.style.SUCCESS(f"Refreshed fuzzy keys for {count} books."))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from core import counters
+
+
+class Command(BaseCommand):
+    help = "Recompute every user's DashboardSummary counters from the source tables and fix any drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Report drifted users without fixing them.")
+
+    def handle(self, *args, **options):
+        fixed = counters.reconcile(dry_run=options["dry_run"])
+        verb = "Would fix" if options["dry_run"] else "Fixed"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {len(fixed)} users."))
+        if fixed and options["verbosity"] > 1:
+            self.stdout.write("User ids: " + ", ".join(str(pk) for pk in fixed))
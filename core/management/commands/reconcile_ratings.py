@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from core import ratings
+
+
+class Command(BaseCommand):
+    help = "Recompute Book review_count/rating_sum/rating_avg from the Review table and fix any drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Report drifted books without fixing them.")
+
+    def handle(self, *args, **options):
+        fixed = ratings.reconcile(dry_run=options["dry_run"])
+        verb = "Would fix" if options["dry_run"] else "Fixed"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {len(fixed)} books."))
+        if fixed and options["verbosity"] > 1:
+            self.stdout.write("Book ids: " + ", ".join(str(pk) for pk in fixed))
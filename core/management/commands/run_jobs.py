@@ -0,0 +1,26 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from core.jobs import Worker
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs (core.jobs) until stopped."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=2, help="Jobs run at once, one thread each.")
+        parser.add_argument("--poll-interval", type=float, default=1.0, help="Seconds to wait when the queue is empty.")
+        parser.add_argument("--burst", action="store_true", help="Exit once no due jobs are left.")
+
+    def handle(self, *args, **options):
+        worker = Worker(
+            concurrency=max(1, options["concurrency"]),
+            poll_interval=options["poll_interval"],
+            burst=options["burst"],
+        )
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *_: worker.stop())
+        self.stdout.write(f"Job worker {worker.name} running with concurrency {worker.concurrency}.")
+        worker.run()
+        self.stdout.write(self.style.SUCCESS("Job worker stopped."))
@@ -0,0 +1,31 @@
+import logging
+
+from .querybudget import budget_for, inspect_queries
+
+
+logger = logging.getLogger("core.queries")
+
+
+class QueryBudgetMiddleware:
+    """
+    Opt-in (QUERY_INSPECTOR=True): count the SQL each view runs, expose it in
+    X-DB-Queries / X-DB-Time-ms headers and log budget overruns and N+1 shapes.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with inspect_queries() as report:
+            response = self.get_response(request)
+
+        response["X-DB-Queries"] = str(report.count)
+        response["X-DB-Time-ms"] = f"{report.time_ms:.1f}"
+
+        url_name = request.resolver_match.url_name if request.resolver_match else None
+        budget = budget_for(url_name) if url_name else None
+        if budget is not None and report.count > budget:
+            logger.warning("%s ran %d queries (budget %d)\n%s", url_name, report.count, budget, report.summary())
+        for shape, n in report.n_plus_one():
+            logger.warning("Possible N+1 in %s: %dx %s", url_name or request.path, n, shape)
+        return response
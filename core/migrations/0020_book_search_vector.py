@@ -0,0 +1,50 @@
+# Generated by Django 5.2.6 on 2026-10-18 17:38
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        schema_editor.execute("CREATE INDEX book_search_vector_gin ON core_book USING gin (search_vector)")
+        schema_editor.execute(
+            "UPDATE core_book SET search_vector = "
+            "setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+            "setweight(to_tsvector('simple', coalesce(author, '')), 'B') || "
+            "setweight(to_tsvector('simple', coalesce(genre, '')), 'C') || "
+            "setweight(to_tsvector('simple', coalesce(description, '')), 'D')"
+        )
+    elif vendor == "sqlite":
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE core_book_fts USING fts5("
+            "title, author, genre, description, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+        schema_editor.execute(
+            "INSERT INTO core_book_fts (rowid, title, author, genre, description) "
+            "SELECT id, title, COALESCE(author, ''), COALESCE(genre, ''), COALESCE(description, '') FROM core_book"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        schema_editor.execute("DROP INDEX IF EXISTS book_search_vector_gin")
+    elif vendor == "sqlite":
+        schema_editor.execute("DROP TABLE IF EXISTS core_book_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_book_created_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,135 @@
+# Generated by Django 5.2.6 on 2026-10-18 17:40
+
+import re
+import unicodedata
+
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+
+# fold() and its tables, copied from core.fuzzy so later changes there can't alter this migration.
+# Offsets inside each Brahmic Unicode block, which share Devanagari's layout.
+_INDIC_BLOCKS = range(0x0900, 0x0D80, 0x80)
+_SCHWA_DELETING = {0x0900, 0x0980, 0x0A00, 0x0A80}  # Devanagari, Bengali, Gurmukhi, Gujarati
+_VOWELS = {
+    0x05: "a", 0x06: "a", 0x07: "i", 0x08: "i", 0x09: "u", 0x0A: "u", 0x0B: "ri", 0x0C: "li",
+    0x0D: "e", 0x0E: "e", 0x0F: "e", 0x10: "ai", 0x11: "o", 0x12: "o", 0x13: "o", 0x14: "au",
+}
+_CONSONANTS = {
+    0x15: "k", 0x16: "kh", 0x17: "g", 0x18: "gh", 0x19: "ng",
+    0x1A: "ch", 0x1B: "chh", 0x1C: "j", 0x1D: "jh", 0x1E: "ny",
+    0x1F: "t", 0x20: "th", 0x21: "d", 0x22: "dh", 0x23: "n",
+    0x24: "t", 0x25: "th", 0x26: "d", 0x27: "dh", 0x28: "n", 0x29: "n",
+    0x2A: "p", 0x2B: "ph", 0x2C: "b", 0x2D: "bh", 0x2E: "m",
+    0x2F: "y", 0x30: "r", 0x31: "r", 0x32: "l", 0x33: "l", 0x34: "zh", 0x35: "v",
+    0x36: "sh", 0x37: "sh", 0x38: "s", 0x39: "h",
+}
+_VOWEL_SIGNS = {
+    0x3E: "a", 0x3F: "i", 0x40: "i", 0x41: "u", 0x42: "u", 0x43: "ri", 0x44: "ri",
+    0x45: "e", 0x46: "e", 0x47: "e", 0x48: "ai", 0x49: "o", 0x4A: "o", 0x4B: "o", 0x4C: "au", 0x57: "u",
+}
+_MALAYALAM_CHILLU = {0x7A: "n", 0x7B: "n", 0x7C: "r", 0x7D: "l", 0x7E: "l", 0x7F: "k"}
+_GURMUKHI_TIPPI = 0x70
+_VIRAMA, _NUKTA, _ANUSVARA, _CANDRABINDU, _VISARGA = 0x4D, 0x3C, 0x02, 0x01, 0x03
+_NASAL = "\x00"  # placeholder until we know whether an anusvara reads as "m" or "n"
+
+_NON_WORD_RE = re.compile(r"[\W_]+", re.UNICODE)
+# Romanised Indian names spell long vowels every which way ("Basheer", "Bashir").
+_LONG_VOWEL_RE = re.compile(r"aa|ee|ii|oo|uu")
+_LONG_VOWELS = {"aa": "a", "ee": "i", "ii": "i", "oo": "u", "uu": "u"}
+
+
+def transliterate(text):
+    """Romanise Brahmic-script text with a simple, typing-friendly scheme."""
+    out = []
+    pending = None  # block of the last consonant, which still carries its inherent "a"
+
+    def close(word_end):
+        if pending is not None and not (word_end and pending in _SCHWA_DELETING):
+            out.append("a")
+
+    for ch in unicodedata.normalize("NFC", text):
+        code = ord(ch)
+        block = code & ~0x7F
+        if block not in _INDIC_BLOCKS:
+            close(word_end=True)
+            pending = None
+            out.append(ch)
+            continue
+        offset = code - block
+        if offset in _CONSONANTS:
+            close(word_end=False)
+            out.append(_CONSONANTS[offset])
+            pending = block
+        elif offset in _VOWEL_SIGNS:
+            out.append(_VOWEL_SIGNS[offset])
+            pending = None
+        elif offset == _VIRAMA:
+            pending = None
+        elif offset == _NUKTA:
+            continue
+        else:
+            close(word_end=False)
+            pending = None
+            if offset in _VOWELS:
+                out.append(_VOWELS[offset])
+            elif offset in (_ANUSVARA, _CANDRABINDU) or (block == 0x0A00 and offset == _GURMUKHI_TIPPI):
+                out.append(_NASAL)
+            elif offset == _VISARGA:
+                out.append("h")
+            elif 0x66 <= offset <= 0x6F:
+                out.append(str(offset - 0x66))
+            elif block == 0x0D00 and offset in _MALAYALAM_CHILLU:
+                out.append(_MALAYALAM_CHILLU[offset])
+    close(word_end=True)
+
+    text = "".join(out)
+    text = re.sub(_NASAL + r"(?=[pbm]|[^a-z]|$)", "m", text)
+    return text.replace(_NASAL, "n")
+
+
+def fold(text):
+    """Normalise text for fuzzy comparison: transliterate, strip accents, casefold."""
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFKD", transliterate(text))
+    text = "".join(ch for ch in text if not unicodedata.combining(ch)).casefold()
+    text = _LONG_VOWEL_RE.sub(lambda m: _LONG_VOWELS[m.group()], text)
+    return _NON_WORD_RE.sub(" ", text).strip()
+
+
+def fill_fuzzy_keys(apps, schema_editor):
+    Book = apps.get_model("core", "Book")
+    batch = []
+    for book in Book.objects.only("id", "title", "author").iterator(chunk_size=1000):
+        book.fuzzy_key = fold(f"{book.title} {book.author}")
+        batch.append(book)
+        if len(batch) >= 1000:
+            Book.objects.bulk_update(batch, ["fuzzy_key"])
+            batch = []
+    Book.objects.bulk_update(batch, ["fuzzy_key"])
+
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute("CREATE INDEX book_fuzzy_key_trgm ON core_book USING gin (fuzzy_key gin_trgm_ops)")
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute("DROP INDEX IF EXISTS book_fuzzy_key_trgm")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_book_search_vector'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='book',
+            name='fuzzy_key',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(fill_fuzzy_keys, drop_trigram_index),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.2.6 on 2026-10-18 17:42
+
+from collections import Counter
+from decimal import Decimal
+
+from django.db import migrations, models
+
+
+# Copied from core.facets, so later changes there can't alter this migration.
+PRICE_BUCKETS = [
+    ("free", Decimal("0"), Decimal("0.01")),
+    ("0-100", Decimal("0.01"), Decimal("100")),
+    ("100-250", Decimal("100"), Decimal("250")),
+    ("250-500", Decimal("250"), Decimal("500")),
+    ("500-1000", Decimal("500"), Decimal("1000")),
+    ("1000+", Decimal("1000"), None),
+]
+
+
+def price_bucket(price):
+    price = Decimal(price or 0)
+    for key, low, high in PRICE_BUCKETS:
+        if price >= low and (high is None or price < high):
+            return key
+    return PRICE_BUCKETS[0][0]
+
+
+def normalize_genre(genre):
+    return (genre or "").strip().title()
+
+
+def count_facets(apps, schema_editor):
+    Book = apps.get_model("core", "Book")
+    FacetCount = apps.get_model("core", "FacetCount")
+    counts = Counter()
+    for genre, condition, availability, price in Book.objects.values_list(
+        "genre", "condition", "availability", "price"
+    ).iterator(chunk_size=2000):
+        counts["condition", condition] += 1
+        counts["availability", availability] += 1
+        counts["price", price_bucket(price)] += 1
+        if normalize_genre(genre):
+            counts["genre", normalize_genre(genre)] += 1
+    FacetCount.objects.bulk_create(
+        [FacetCount(facet=facet, value=value, count=n) for (facet, value), n in counts.items()]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_book_fuzzy_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FacetCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('facet', models.CharField(max_length=20)),
+                ('value', models.CharField(max_length=100)),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('facet', 'value'), name='unique_facet_value')],
+            },
+        ),
+        migrations.RunPython(count_facets, migrations.RunPython.noop),
+    ]
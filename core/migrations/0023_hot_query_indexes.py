@@ -0,0 +1,51 @@
+# Generated by Django 5.2.6 on 2026-10-18 17:43
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0022_facetcount'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['owner', '-created_at'], name='book_owner_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(condition=models.Q(('availability__in', ['swap', 'both'])), fields=['-created_at', '-id'], name='book_swappable_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['seller', 'status', '-created_at'], name='payment_seller_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['buyer', 'status', '-created_at'], name='payment_buyer_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='swaprequest',
+            index=models.Index(fields=['owner', 'status', '-created_at'], name='swap_owner_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='swaprequest',
+            index=models.Index(fields=['requester', '-created_at'], name='swap_requester_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='swaprequest',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['requested_book'], name='swap_pending_book_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['buyer', '-created_at'], name='txn_buyer_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['seller', '-created_at'], name='txn_seller_created_idx'),
+        ),
+    ]
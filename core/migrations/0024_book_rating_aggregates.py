@@ -0,0 +1,43 @@
+# Generated by Django 5.2.6 on 2026-10-18 17:47
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Avg, Count, Sum
+
+
+def backfill_ratings(apps, schema_editor):
+    Book = apps.get_model("core", "Book")
+    Review = apps.get_model("core", "Review")
+    for row in Review.objects.values("book").annotate(n=Count("id"), total=Sum("rating"), avg=Avg("rating")).order_by():
+        Book.objects.filter(pk=row["book"]).update(review_count=row["n"], rating_sum=row["total"], rating_avg=row["avg"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0023_hot_query_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='rating_avg',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_ratings, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(condition=models.Q(('review_count__gt', 0)), fields=['-rating_avg', '-id'], name='book_top_rated_idx'),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.6 on 2026-10-18 17:53
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_summaries(apps, schema_editor):
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split("."))
+    Book = apps.get_model("core", "Book")
+    SwapRequest = apps.get_model("core", "SwapRequest")
+    Payment = apps.get_model("core", "Payment")
+    Transaction = apps.get_model("core", "Transaction")
+    DashboardSummary = apps.get_model("core", "DashboardSummary")
+
+    def grouped(queryset, field):
+        return {row[field]: row["n"] for row in queryset.values(field).annotate(n=Count("id")).order_by()}
+
+    counts = {
+        "books": grouped(Book.objects.all(), "owner"),
+        "pending_swaps_received": grouped(SwapRequest.objects.filter(status="pending"), "owner"),
+        "pending_payments": grouped(Payment.objects.filter(status="Pending"), "seller__user"),
+        "purchases": grouped(Transaction.objects.all(), "buyer"),
+        "sales": grouped(Transaction.objects.all(), "seller"),
+    }
+    DashboardSummary.objects.bulk_create(
+        [
+            DashboardSummary(user_id=user_id, **{name: values.get(user_id, 0) for name, values in counts.items()})
+            for user_id in User.objects.values_list("id", flat=True)
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('core', '0024_book_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DashboardSummary',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='dashboard_summary', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('books', models.IntegerField(default=0)),
+                ('pending_swaps_received', models.IntegerField(default=0)),
+                ('pending_payments', models.IntegerField(default=0)),
+                ('purchases', models.IntegerField(default=0)),
+                ('sales', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(backfill_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.6 on 2026-10-18 18:20
+
+from django.db import migrations, models
+
+
+def log_existing_books(apps, schema_editor):
+    # Start the log with every current book, so replaying it from the beginning rebuilds the catalog.
+    Book = apps.get_model("core", "Book")
+    BookChange = apps.get_model("core", "BookChange")
+    ids = Book.objects.order_by("created_at", "id").values_list("id", flat=True)
+    BookChange.objects.bulk_create((BookChange(book_id=pk, action="created") for pk in ids.iterator(chunk_size=2000)), batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0028_book_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookChange',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('book_id', models.IntegerField()),
+                ('action', models.CharField(choices=[('created', 'Created'), ('updated', 'Updated'), ('availability', 'Availability changed'), ('deleted', 'Deleted')], max_length=12)),
+                ('fields', models.JSONField(blank=True, default=list)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['book_id', 'id'], name='bookchange_book_id_idx'), models.Index(fields=['created_at'], name='bookchange_created_idx')],
+            },
+        ),
+        migrations.RunPython(log_existing_books, migrations.RunPython.noop),
+    ]
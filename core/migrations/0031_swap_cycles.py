@@ -0,0 +1,38 @@
+# Generated by Django 5.2.6 on 2026-10-18 18:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0030_book_recommendations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SwapCycle',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=100, unique=True)),
+                ('size', models.PositiveSmallIntegerField()),
+                ('status', models.CharField(choices=[('proposed', 'Proposed'), ('completed', 'Completed'), ('cancelled', 'Cancelled')], default='proposed', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SwapCycleLeg',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveSmallIntegerField()),
+                ('accepted', models.BooleanField(default=False)),
+                ('cycle', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='legs', to='core.swapcycle')),
+                ('swap_request', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cycle_legs', to='core.swaprequest')),
+            ],
+            options={
+                'ordering': ['position'],
+                'constraints': [models.UniqueConstraint(fields=('cycle', 'position'), name='swapcycleleg_position_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.6 on 2026-10-18 18:54
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def locate_profiles(apps, schema_editor):
+    from core import geo
+
+    UserProfile = apps.get_model("core", "UserProfile")
+    profiles = list(UserProfile.objects.exclude(place__isnull=True).exclude(place="").only("id", "place"))
+    for profile in profiles:
+        geo.locate_profile(profile)
+    UserProfile.objects.bulk_update(profiles, ["latitude", "longitude", "geohash"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0031_swap_cycles'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='geohash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=12),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='latitude',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='longitude',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='userprofile',
+            index=models.Index(fields=['geohash'], name='profile_geohash_idx'),
+        ),
+        migrations.RunPython(locate_profiles, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-18 18:58
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0032_profile_location'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='swaprequest',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['offered_book'], name='swap_pending_offered_idx'),
+        ),
+    ]
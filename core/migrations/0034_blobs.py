@@ -0,0 +1,42 @@
+# Generated by Django 5.2.6 on 2026-10-18 19:16
+
+import core.blobs
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0033_swap_pending_offered_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('size', models.PositiveBigIntegerField(default=0)),
+                ('refs', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='book',
+            name='cover',
+            field=models.ImageField(blank=True, null=True, storage=core.blobs.media_storage, upload_to='book_covers/'),
+        ),
+        migrations.AlterField(
+            model_name='payment',
+            name='screenshot',
+            field=models.ImageField(blank=True, help_text='Optional payment screenshot', null=True, storage=core.blobs.media_storage, upload_to='payments/screenshots/'),
+        ),
+        migrations.AlterField(
+            model_name='userprofile',
+            name='avatar',
+            field=models.ImageField(blank=True, null=True, storage=core.blobs.media_storage, upload_to='avatars/'),
+        ),
+        migrations.AlterField(
+            model_name='userprofile',
+            name='gpay_qr',
+            field=models.ImageField(blank=True, null=True, storage=core.blobs.media_storage, upload_to='gpay_qr/'),
+        ),
+    ]
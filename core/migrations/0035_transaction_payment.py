@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-18 19:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0034_blobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='payment',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='recorded_transaction', to='core.payment'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.6 on 2026-10-18 19:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0035_transaction_payment'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bookchange',
+            name='txid',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='bookchange',
+            index=models.Index(fields=['txid', 'id'], name='bookchange_txid_idx'),
+        ),
+    ]
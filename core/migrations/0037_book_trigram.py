@@ -0,0 +1,44 @@
+# Generated by Django 5.2.6 on 2026-10-18 20:05
+
+from django.db import migrations
+
+
+def trigrams(text):
+    # Copied from core.fuzzy, so later changes there can't alter this migration.
+    grams = set()
+    for word in text.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def create_trigram_table(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return  # PostgreSQL matches with pg_trgm on core_book itself
+    Book = apps.get_model("core", "Book")
+    # Like core_book_fts, kept in step by the Book signals rather than a foreign key.
+    schema_editor.execute("CREATE TABLE core_book_trigram (gram TEXT NOT NULL, book_id INTEGER NOT NULL)")
+    schema_editor.execute("CREATE INDEX book_trigram_gram_idx ON core_book_trigram (gram, book_id)")
+    schema_editor.execute("CREATE INDEX book_trigram_book_idx ON core_book_trigram (book_id)")
+    with schema_editor.connection.cursor() as cursor:
+        for pk, key in Book.objects.values_list("id", "fuzzy_key").iterator(chunk_size=1000):
+            cursor.executemany(
+                "INSERT INTO core_book_trigram (gram, book_id) VALUES (%s, %s)",
+                [(gram, pk) for gram in trigrams(key or "")],
+            )
+
+
+def drop_trigram_table(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        schema_editor.execute("DROP TABLE IF EXISTS core_book_trigram")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0036_bookchange_txid'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_table, drop_trigram_table),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.6 on 2026-10-18 20:38
+
+from collections import Counter
+
+from django.db import migrations, models
+
+
+def genre_key(genre):
+    # Copied from core.facets, so later changes there can't alter this migration.
+    return (genre or "").strip().casefold()
+
+
+def fill_genre_keys(apps, schema_editor):
+    Book = apps.get_model("core", "Book")
+    FacetCount = apps.get_model("core", "FacetCount")
+    counts = Counter()
+    batch = []
+    for book in Book.objects.only("id", "genre").iterator(chunk_size=1000):
+        book.genre_key = genre_key(book.genre)
+        if book.genre_key:
+            counts["genre", book.genre_key] += 1
+            counts["genre_spelling", book.genre.strip()] += 1
+            batch.append(book)
+        if len(batch) >= 1000:
+            Book.objects.bulk_update(batch, ["genre_key"])
+            batch = []
+    Book.objects.bulk_update(batch, ["genre_key"])
+    # Genre counts were keyed by the title-cased genre; key them like the filter instead.
+    FacetCount.objects.filter(facet="genre").delete()
+    FacetCount.objects.bulk_create(
+        [FacetCount(facet=facet, value=value, count=n) for (facet, value), n in counts.items()]
+    )
+
+
+def count_title_cased_genres(apps, schema_editor):
+    Book = apps.get_model("core", "Book")
+    FacetCount = apps.get_model("core", "FacetCount")
+    counts = Counter(
+        genre.strip().title() for genre in Book.objects.values_list("genre", flat=True).iterator(chunk_size=2000)
+        if genre.strip()
+    )
+    FacetCount.objects.filter(facet__in=["genre", "genre_spelling"]).delete()
+    FacetCount.objects.bulk_create([FacetCount(facet="genre", value=value, count=n) for value, n in counts.items()])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0037_book_trigram'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='genre_key',
+            field=models.CharField(blank=True, default='', editable=False, max_length=100),
+        ),
+        migrations.RunPython(fill_genre_keys, count_title_cased_genres),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['genre_key', '-created_at', '-id'], name='book_genre_key_idx'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+from django.db import migrations
+
+
+def record_queued_swap_sales(apps, schema_editor):
+    # Copied from core.swaps.record_sales, so later changes there can't alter this migration.
+    # Accepts now write these rows themselves; the jobs that used to are about to lose their task.
+    Job = apps.get_model("core", "Job")
+    Sale = apps.get_model("core", "Sale")
+    SwapRequest = apps.get_model("core", "SwapRequest")
+    Transaction = apps.get_model("core", "Transaction")
+    UserProfile = apps.get_model("core", "UserProfile")
+
+    pending = Job.objects.filter(task="core.record_swap_sale").exclude(status__in=["done", "failed"])
+    swap_ids = [job.kwargs.get("swap_id") for job in pending]
+    swaps = SwapRequest.objects.select_related("requested_book").filter(pk__in=swap_ids, status="accepted", sale__isnull=True)
+    for swap in swaps:
+        book = swap.requested_book
+        buyer_profile, _ = UserProfile.objects.get_or_create(user_id=swap.requester_id)
+        seller_profile, _ = UserProfile.objects.get_or_create(user_id=swap.owner_id)
+        sale_transaction = Transaction.objects.create(
+            buyer_id=swap.requester_id,
+            seller_id=swap.owner_id,
+            book=book,
+            amount=book.price or 0,
+            mobile=buyer_profile.gpay_number,
+            status="success",
+        )
+        Sale.objects.create(
+            swap_request=swap,
+            buyer=buyer_profile,
+            seller=seller_profile,
+            book=book,
+            transaction=sale_transaction,
+        )
+    pending.delete()
+    # payments.verify() records these Transactions itself.
+    Job.objects.filter(task="core.record_payment_transaction").exclude(status__in=["done", "failed"]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0039_catalogimport'),
+    ]
+
+    operations = [
+        migrations.RunPython(record_queued_swap_sales, migrations.RunPython.noop),
+    ]
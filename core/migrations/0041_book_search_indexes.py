@@ -0,0 +1,35 @@
+import django.contrib.postgres.indexes
+from django.db import migrations
+
+
+INDEXES = [
+    django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='book_search_vector_gin'),
+    django.contrib.postgres.indexes.GinIndex(fields=['fuzzy_key'], name='book_fuzzy_key_trgm', opclasses=['gin_trgm_ops']),
+]
+
+
+def create_indexes(apps, schema_editor):
+    # 0020 and 0021 already created them on PostgreSQL, with raw SQL Django's state never saw.
+    if schema_editor.connection.vendor != "postgresql":
+        for index in INDEXES:
+            schema_editor.add_index(apps.get_model("core", "Book"), index)
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        for index in INDEXES:
+            schema_editor.remove_index(apps.get_model("core", "Book"), index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0040_record_queued_swap_sales'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[migrations.RunPython(create_indexes, drop_indexes)],
+            state_operations=[migrations.AddIndex(model_name='book', index=index) for index in INDEXES],
+        ),
+    ]
@@ -1,8 +1,12 @@
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
 from django.contrib.auth.models import User
 from decimal import Decimal
-from django.db.models.signals import post_save
+from django.db.models.signals import pre_delete, pre_save, post_save, post_delete
 from django.dispatch import receiver
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from . import blobs, caching, changes, counters, cycles, facets, fuzzy, geo, images, jobs, ratings, recommendations, search
 
 
 class Book(models.Model):
@@ -13,16 +17,265 @@ class Book(models.Model):
     title = models.CharField(max_length=255)
     author = models.CharField(max_length=255, blank=True)
     genre = models.CharField(max_length=100, blank=True)
+    # Case- and whitespace-insensitive genre that facets group and filter by, see core.facets.
+    genre_key = models.CharField(max_length=100, blank=True, default="", editable=False)
     condition = models.CharField(max_length=10, choices=CONDITION_CHOICES, default="used")
     description = models.TextField(blank=True)
-    cover = models.ImageField(upload_to="book_covers/", blank=True, null=True)
+    cover = models.ImageField(upload_to="book_covers/", storage=blobs.media_storage, blank=True, null=True)
+    # Resized WebP/JPEG derivatives of cover, see core.images.
+    cover_variants = models.JSONField(default=dict, blank=True, editable=False)
     availability = models.CharField(max_length=10, choices=AVAILABILITY_CHOICES, default="swap")
     price = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal("0.00"))
     created_at = models.DateTimeField(auto_now_add=True)
+    # Last change to anything core.api serves; backs its ETag/Last-Modified headers.
+    updated_at = models.DateTimeField(auto_now=True)
+    # Weighted title/author/genre/description document, see core.search.
+    search_vector = SearchVectorField(null=True, blank=True, editable=False)
+    # Folded/transliterated title + author for typo-tolerant matching, see core.fuzzy.
+    fuzzy_key = models.TextField(blank=True, default="", editable=False)
+    # Rating aggregates kept in step with Review rows, see core.ratings.
+    review_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_avg = models.FloatField(null=True, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # Backs keyset pagination in core.pagination.
+            models.Index(fields=["-created_at", "-id"], name="book_created_id_idx"),
+            # my_books / dashboard: a user's own books, newest first.
+            models.Index(fields=["owner", "-created_at"], name="book_owner_created_idx"),
+            # swap / swap_request_view: only the swappable part of the catalog.
+            models.Index(
+                fields=["-created_at", "-id"],
+                condition=models.Q(availability__in=["swap", "both"]),
+                name="book_swappable_idx",
+            ),
+            # Genre facet filter.
+            models.Index(fields=["genre_key", "-created_at", "-id"], name="book_genre_key_idx"),
+            # Full-text and trigram search on PostgreSQL (core.search, core.fuzzy). SQLite
+            # searches its own tables and gets plain indexes here.
+            GinIndex(fields=["search_vector"], name="book_search_vector_gin"),
+            GinIndex(fields=["fuzzy_key"], name="book_fuzzy_key_trgm", opclasses=["gin_trgm_ops"]),
+            # "Top rated" listing.
+            models.Index(
+                fields=["-rating_avg", "-id"],
+                condition=models.Q(review_count__gt=0),
+                name="book_top_rated_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.title} ({self.author})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if facets.FACET_FIELDS <= set(field_names):
+            instance._facet_values = facets.facet_values(instance)
+        counters.snapshot(instance, field_names)
+        changes.snapshot(instance, field_names)
+        blobs.snapshot(instance, field_names)
+        return instance
+
+    def save(self, *args, **kwargs):
+        self.genre_key = facets.genre_key(self.genre)
+        self.fuzzy_key = fuzzy.fold(f"{self.title} {self.author}")
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None and not self._state.adding:
+            # Never write back stale rating aggregates; only core.ratings touches them.
+            update_fields = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in RATING_FIELDS
+            ]
+            kwargs["update_fields"] = update_fields
+        if update_fields is not None and {"title", "author"} & set(update_fields):
+            update_fields = kwargs["update_fields"] = {*update_fields, "fuzzy_key"}
+        if update_fields is not None and "genre" in update_fields:
+            update_fields = kwargs["update_fields"] = {*update_fields, "genre_key"}
+        if update_fields is not None:
+            kwargs["update_fields"] = {*update_fields, "updated_at"}
+        # Keeps the row and its FacetCount/DashboardSummary adjustments in one transaction.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+
+
+SEARCH_FIELDS = {"title", "author", "genre", "description"}
+RATING_FIELDS = {"review_count", "rating_sum", "rating_avg"}
+
+
+@receiver(post_save, sender=Book)
+def update_search_document(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or SEARCH_FIELDS & set(update_fields):
+        search.index_book(instance)
+        fuzzy.index_book(instance.pk, instance.fuzzy_key)
+
+
+@receiver(post_delete, sender=Book)
+def remove_search_document(sender, instance, **kwargs):
+    search.unindex_book(instance.pk)
+    fuzzy.unindex_book(instance.pk)
+
+
+def _touches_facets(update_fields):
+    return update_fields is None or bool(facets.FACET_FIELDS & set(update_fields))
+
+
+@receiver(pre_save, sender=Book)
+def snapshot_facet_values(sender, instance, update_fields=None, **kwargs):
+    # Books loaded with .only()/.defer() have no snapshot yet; read the stored values.
+    if instance._state.adding or getattr(instance, "_facet_values", None) is not None:
+        return
+    if not _touches_facets(update_fields):
+        return
+    stored = Book.objects.filter(pk=instance.pk).first()
+    instance._facet_values = facets.facet_values(stored) if stored else set()
+
+
+@receiver(post_save, sender=Book)
+def update_facet_counts(sender, instance, created, update_fields=None, **kwargs):
+    if not _touches_facets(update_fields):
+        return
+    previous = set() if created else instance._facet_values
+    facets.book_saved(instance, previous)
+    instance._facet_values = facets.facet_values(instance)
+
+
+@receiver(post_delete, sender=Book)
+def release_facet_counts(sender, instance, **kwargs):
+    previous = getattr(instance, "_facet_values", None)
+    facets.book_deleted(instance, previous if previous is not None else facets.facet_values(instance))
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def invalidate_book_pages(sender, instance, **kwargs):
+    caching.invalidate_book(instance.pk)
+    caching.invalidate_catalog()
+
+
+@receiver(pre_save, sender=Book)
+def snapshot_change_values(sender, instance, **kwargs):
+    if not instance._state.adding and getattr(instance, "_change_values", None) is None:
+        instance._change_values = changes.stored_values(instance)
+
+
+@receiver(post_save, sender=Book)
+def record_book_change(sender, instance, created, **kwargs):
+    changes.book_saved(instance, created, getattr(instance, "_change_values", None))
+
+
+@receiver(post_delete, sender=Book)
+def record_book_deletion(sender, instance, **kwargs):
+    changes.book_deleted(instance.pk)
+
+
+class BookChange(models.Model):
+    """One entry of the append-only catalog change log, see core.changes."""
+
+    ACTION_CHOICES = [
+        ("created", "Created"),
+        ("updated", "Updated"),
+        ("availability", "Availability changed"),
+        ("deleted", "Deleted"),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    # Not a foreign key: entries outlive the book they describe.
+    book_id = models.IntegerField()
+    action = models.CharField(max_length=12, choices=ACTION_CHOICES)
+    fields = models.JSONField(default=list, blank=True)
+    # The writing transaction, which orders the feed by commit (core.changes.WritingTransaction).
+    txid = models.BigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # The feed, in commit order.
+            models.Index(fields=["txid", "id"], name="bookchange_txid_idx"),
+            # Compaction: the latest entry per book.
+            models.Index(fields=["book_id", "id"], name="bookchange_book_id_idx"),
+            models.Index(fields=["created_at"], name="bookchange_created_idx"),
+        ]
+
+    def __str__(self):
+        return f"#{self.id} book {self.book_id} {self.action}"
+
+
+class FacetCount(models.Model):
+    """Precomputed number of books per facet value, maintained by core.facets."""
+
+    facet = models.CharField(max_length=20)
+    value = models.CharField(max_length=100)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["facet", "value"], name="unique_facet_value")]
+
+    def __str__(self):
+        return f"{self.facet}={self.value} ({self.count})"
+
+
+class Job(models.Model):
+    """A unit of background work, see core.jobs."""
+
+    STATUS_CHOICES = [("queued", "Queued"), ("running", "Running"), ("done", "Done"), ("failed", "Failed")]
+    ACTIVE = ("queued", "running")
+
+    task = models.CharField(max_length=200)
+    kwargs = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="queued")
+    # At most one queued/running job per key (periodic tasks, per-object refreshes).
+    unique_key = models.CharField(max_length=200, null=True, blank=True)
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    locked_by = models.CharField(max_length=200, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # The worker's claim query: due jobs, oldest first.
+            models.Index(fields=["run_at", "id"], condition=models.Q(status="queued"), name="job_queued_idx"),
+            models.Index(fields=["locked_at"], condition=models.Q(status="running"), name="job_running_idx"),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["unique_key"], condition=models.Q(status__in=["queued", "running"]), name="job_unique_active"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.task} [{self.status}]"
+
+
+class CatalogImport(models.Model):
+    """An uploaded catalog file, imported by a background job; see core.imports.import_upload."""
+
+    STATUS_CHOICES = Job.STATUS_CHOICES
+
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name="catalog_imports")
+    # Kept in the default storage until the import finishes, so any worker can read them.
+    file = models.FileField(upload_to="imports/", blank=True)
+    covers = models.FileField(upload_to="imports/", blank=True)
+    format = models.CharField(max_length=10)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="queued")
+    # Progress, committed with each batch: the last line read and what the lines up to it gave.
+    processed = models.PositiveIntegerField(default=0)
+    valid = models.PositiveIntegerField(default=0)
+    created = models.PositiveIntegerField(default=0)
+    covers_imported = models.PositiveIntegerField(default=0)
+    error_count = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)  # the first [line, message] pairs
+    message = models.TextField(blank=True)  # why the file as a whole could not be imported
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Import {self.pk} by {self.owner_id} [{self.status}]"
 
 
 class SwapRequest(models.Model):
@@ -38,9 +291,29 @@ class SwapRequest(models.Model):
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="pending")  
     created_at = models.DateTimeField(auto_now_add=True) 
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["owner", "status", "-created_at"], name="swap_owner_status_idx"),
+            models.Index(fields=["requester", "-created_at"], name="swap_requester_created_idx"),
+            # Competing pending requests for a book.
+            models.Index(fields=["requested_book"], condition=models.Q(status="pending"), name="swap_pending_book_idx"),
+            models.Index(fields=["offered_book"], condition=models.Q(status="pending"), name="swap_pending_offered_idx"),
+        ]
+
     def __str__(self):
         return f"Swap: {self.requester.username} → {self.requested_book.title} [{self.status}]"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        counters.snapshot(instance, field_names)
+        return instance
+
+    def save(self, *args, **kwargs):
+        # Keeps the row and its DashboardSummary adjustments in one transaction.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
 class Transaction(models.Model):
     STATUS_CHOICES = [
         ("initiated", "Initiated"),
@@ -51,26 +324,73 @@ class Transaction(models.Model):
     buyer = models.ForeignKey(User, on_delete=models.CASCADE, related_name="transactions_purchased")
     seller = models.ForeignKey(User, on_delete=models.CASCADE, related_name="transactions_sold")
     book = models.ForeignKey("core.Book", on_delete=models.CASCADE, related_name="transactions")
+    # The verified payment this records, so recording it again is a no-op.
+    payment = models.OneToOneField(
+        "core.Payment", on_delete=models.SET_NULL, null=True, blank=True, related_name="recorded_transaction"
+    )
     amount = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal("0.00"))
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="initiated")
     mobile = models.CharField(max_length=20, blank=True, null=True)  # Added mobile field
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["buyer", "-created_at"], name="txn_buyer_created_idx"),
+            models.Index(fields=["seller", "-created_at"], name="txn_seller_created_idx"),
+        ]
+
     def __str__(self):
         return f"{self.book.title} – {self.buyer.username} paid {self.amount} ({self.status})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        counters.snapshot(instance, field_names)
+        return instance
+
+    def save(self, *args, **kwargs):
+        # Keeps the row and its DashboardSummary adjustments in one transaction.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
 
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="profile")
-    avatar = models.ImageField(upload_to="avatars/", blank=True, null=True)
+    avatar = models.ImageField(upload_to="avatars/", storage=blobs.media_storage, blank=True, null=True)
     place = models.CharField(max_length=100, blank=True, null=True)
     gpay_number = models.CharField(max_length=20, blank=True, null=True)
     upi_id = models.CharField(max_length=50, blank=True, null=True)
-    gpay_qr = models.ImageField(upload_to="gpay_qr/", blank=True, null=True)
+    gpay_qr = models.ImageField(upload_to="gpay_qr/", storage=blobs.media_storage, blank=True, null=True)
+    avatar_variants = models.JSONField(default=dict, blank=True, editable=False)
+    gpay_qr_variants = models.JSONField(default=dict, blank=True, editable=False)
+    # Where ``place`` is, from the gazetteer in core.geo; empty when it isn't recognised.
+    latitude = models.FloatField(null=True, blank=True, editable=False)
+    longitude = models.FloatField(null=True, blank=True, editable=False)
+    geohash = models.CharField(max_length=12, blank=True, default="", editable=False)
+
+    class Meta:
+        indexes = [
+            # Books near me: owners in the cells around the viewer, see core.geo.near.
+            models.Index(fields=["geohash"], name="profile_geohash_idx"),
+        ]
 
     def __str__(self):
         return f"{self.user.username}'s Profile"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        blobs.snapshot(instance, field_names)
+        return instance
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or "place" in update_fields:
+            geo.locate_profile(self)
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "latitude", "longitude", "geohash"}
+        super().save(*args, **kwargs)
+
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
@@ -82,6 +402,45 @@ def save_user_profile(sender, instance, **kwargs):
         instance.profile.save()
 
 
+@receiver(post_save, sender=Book)
+@receiver(post_save, sender=UserProfile)
+def generate_image_variants(sender, instance, **kwargs):
+    if images.needs_refresh(instance):
+        jobs.enqueue(
+            "core.refresh_image_variants",
+            label=instance._meta.label,
+            pk=instance.pk,
+            unique_key=f"images:{instance._meta.label}:{instance.pk}",
+        )
+
+
+@receiver(post_delete, sender=Book)
+@receiver(post_delete, sender=UserProfile)
+def delete_image_variants(sender, instance, **kwargs):
+    for field_name in images.IMAGE_FIELDS[instance._meta.label]:
+        images.delete_variants(getattr(instance, field_name).storage, getattr(instance, images.variants_field(field_name)))
+
+
+class DashboardSummary(models.Model):
+    """Per-user counts behind the dashboard and sidebar badges, see core.counters."""
+
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name="dashboard_summary")
+    books = models.IntegerField(default=0)
+    pending_swaps_received = models.IntegerField(default=0)
+    pending_payments = models.IntegerField(default=0)
+    purchases = models.IntegerField(default=0)
+    sales = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.user_id}: {self.books} books, {self.pending_swaps_received} swaps, {self.pending_payments} payments"
+
+
+@receiver(post_save, sender=User)
+def create_dashboard_summary(sender, instance, created, **kwargs):
+    if created:
+        DashboardSummary.objects.get_or_create(user=instance)
+
+
 class Sale(models.Model):
     transaction = models.OneToOneField("Transaction", on_delete=models.CASCADE, related_name="sale", null=True, blank=True)
     buyer = models.ForeignKey("UserProfile", on_delete=models.CASCADE, related_name="purchases", null=True, blank=True)
@@ -109,7 +468,7 @@ class Payment(models.Model):
     mobile = models.CharField(max_length=15, blank=True, null=True, help_text="Buyer's mobile number for seller contact")
     payment_method = models.CharField(max_length=50, choices=PAYMENT_METHOD_CHOICES, default="GPay", help_text="Selected payment method")
     transaction_id = models.CharField(max_length=100, blank=True, null=True, help_text="Transaction ID / UPI reference")
-    screenshot = models.ImageField(upload_to="payments/screenshots/", blank=True, null=True, help_text="Optional payment screenshot")
+    screenshot = models.ImageField(upload_to="payments/screenshots/", storage=blobs.media_storage, blank=True, null=True, help_text="Optional payment screenshot")
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="Pending", help_text="Current status of the payment")
     created_at = models.DateTimeField(auto_now_add=True)
 
@@ -117,6 +476,12 @@ class Payment(models.Model):
         ordering = ['-created_at']
         verbose_name = "Payment"
         verbose_name_plural = "Payments"
+        indexes = [
+            # seller_payments (Pending) and sales (Verified), newest first.
+            models.Index(fields=["seller", "status", "-created_at"], name="payment_seller_status_idx"),
+            # purchases (Verified), newest first.
+            models.Index(fields=["buyer", "status", "-created_at"], name="payment_buyer_status_idx"),
+        ]
 
     def __str__(self):
         book_title = self.book.title if self.book else "Unknown Book"
@@ -131,6 +496,18 @@ class Payment(models.Model):
     @property
     def is_rejected(self): return self.status == "Rejected"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        counters.snapshot(instance, field_names)
+        blobs.snapshot(instance, field_names)
+        return instance
+
+    def save(self, *args, **kwargs):
+        # Keeps the row and its DashboardSummary adjustments in one transaction.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
 
 class Review(models.Model):
     book = models.ForeignKey(Book, related_name="reviews", on_delete=models.CASCADE)
@@ -142,3 +519,203 @@ class Review(models.Model):
     def __str__(self):
         return f"{self.reviewer.username} - {self.book.title} ({self.rating}⭐)"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if {"book_id", "rating"} <= set(field_names):
+            instance._rating_state = (instance.book_id, instance.rating)
+        return instance
+
+    def save(self, *args, **kwargs):
+        # Keeps the row and the Book aggregate update in one transaction.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+
+@receiver(pre_save, sender=Review)
+def snapshot_rating(sender, instance, **kwargs):
+    if instance._state.adding or getattr(instance, "_rating_state", None) is not None:
+        return
+    instance._rating_state = Review.objects.filter(pk=instance.pk).values_list("book_id", "rating").first()
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_reviewed_book(sender, instance, **kwargs):
+    # Reviews and the rating aggregates only appear on the book's own page. Registered
+    # before update_book_rating so _rating_state still holds the pre-save book.
+    book_ids = {instance.book_id}
+    if getattr(instance, "_rating_state", None):
+        book_ids.add(instance._rating_state[0])
+    for book_id in book_ids:
+        caching.invalidate_book(book_id)
+
+
+@receiver(post_save, sender=Review)
+def update_book_rating(sender, instance, created, **kwargs):
+    ratings.review_saved(instance, None if created else getattr(instance, "_rating_state", None))
+    instance._rating_state = (instance.book_id, int(instance.rating))
+
+
+@receiver(post_delete, sender=Review)
+def release_book_rating(sender, instance, **kwargs):
+    book_id, rating = getattr(instance, "_rating_state", None) or (instance.book_id, instance.rating)
+    ratings.review_deleted(book_id, rating)
+
+
+@receiver(pre_save, sender=Book)
+@receiver(pre_save, sender=SwapRequest)
+@receiver(pre_save, sender=Payment)
+@receiver(pre_save, sender=Transaction)
+def snapshot_counter_values(sender, instance, **kwargs):
+    if instance._state.adding or getattr(instance, "_counter_values", None) is not None:
+        return
+    instance._counter_values = counters.stored_contributions(instance)
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_save, sender=SwapRequest)
+@receiver(post_save, sender=Payment)
+@receiver(post_save, sender=Transaction)
+def update_dashboard_counters(sender, instance, created, **kwargs):
+    counters.row_saved(instance, set() if created else instance._counter_values)
+
+
+@receiver(post_delete, sender=Book)
+@receiver(post_delete, sender=SwapRequest)
+@receiver(post_delete, sender=Payment)
+@receiver(post_delete, sender=Transaction)
+def release_dashboard_counters(sender, instance, **kwargs):
+    previous = getattr(instance, "_counter_values", None)
+    counters.row_deleted(instance, previous if previous is not None else counters.contributions(instance))
+
+
+def _touches_files(instance, update_fields):
+    return update_fields is None or bool(set(blobs.FILE_FIELDS[instance._meta.label]) & set(update_fields))
+
+
+@receiver(pre_save, sender=Book)
+@receiver(pre_save, sender=UserProfile)
+@receiver(pre_save, sender=Payment)
+def snapshot_blob_names(sender, instance, update_fields=None, **kwargs):
+    if instance._state.adding or getattr(instance, "_blob_names", None) is not None:
+        return
+    if _touches_files(instance, update_fields):
+        instance._blob_names = blobs.stored_names(instance)
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_save, sender=UserProfile)
+@receiver(post_save, sender=Payment)
+def count_blob_references(sender, instance, created, update_fields=None, **kwargs):
+    if _touches_files(instance, update_fields):
+        blobs.row_saved(instance, None if created else instance._blob_names)
+
+
+@receiver(post_delete, sender=Book)
+@receiver(post_delete, sender=UserProfile)
+@receiver(post_delete, sender=Payment)
+def release_blob_references(sender, instance, **kwargs):
+    previous = getattr(instance, "_blob_names", None)
+    blobs.row_deleted(instance, previous if previous is not None else blobs.names(instance))
+
+
+class Blob(models.Model):
+    """A file of core.blobs.ContentAddressedStorage and how many file fields refer to it."""
+
+    name = models.CharField(max_length=100, primary_key=True)
+    size = models.PositiveBigIntegerField(default=0)
+    refs = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} ({self.refs} refs)"
+
+
+class BookNeighbour(models.Model):
+    """One of a book's "readers also swapped" books, maintained by core.recommendations."""
+
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name="neighbours")
+    neighbour = models.ForeignKey(Book, on_delete=models.CASCADE, related_name="neighbour_of")
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["book", "rank"], name="bookneighbour_book_rank_uniq")]
+
+    def __str__(self):
+        return f"{self.book_id} → {self.neighbour_id} ({self.score:.3f})"
+
+
+class ReaderRecommendation(models.Model):
+    """A book suggested to a reader on the dashboard, maintained by core.recommendations."""
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="recommendations")
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name="recommended_to")
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["user", "rank"], name="readerrec_user_rank_uniq")]
+
+    def __str__(self):
+        return f"{self.user_id} ← {self.book_id} ({self.score:.3f})"
+
+
+@receiver(post_save, sender=SwapRequest)
+@receiver(post_save, sender=Payment)
+@receiver(post_save, sender=Review)
+def refresh_recommendations(sender, instance, created, **kwargs):
+    if created:
+        recommendations.interaction_changed(instance)
+
+
+@receiver(post_delete, sender=SwapRequest)
+@receiver(post_delete, sender=Payment)
+@receiver(post_delete, sender=Review)
+def refresh_recommendations_after_delete(sender, instance, **kwargs):
+    recommendations.interaction_changed(instance)
+
+
+class SwapCycle(models.Model):
+    """A 3- or 4-party swap proposed by core.cycles: every participant gives one book and gets one."""
+
+    STATUS_CHOICES = [("proposed", "Proposed"), ("completed", "Completed"), ("cancelled", "Cancelled")]
+
+    # The sorted ids of its requests, so the same cycle is only proposed once.
+    key = models.CharField(max_length=100, unique=True)
+    size = models.PositiveSmallIntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="proposed")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.size}-party swap #{self.pk} [{self.status}]"
+
+
+class SwapCycleLeg(models.Model):
+    """One request of a SwapCycle; its requester gets the requested book and must accept."""
+
+    cycle = models.ForeignKey(SwapCycle, on_delete=models.CASCADE, related_name="legs")
+    swap_request = models.ForeignKey(SwapRequest, on_delete=models.CASCADE, related_name="cycle_legs")
+    position = models.PositiveSmallIntegerField()
+    accepted = models.BooleanField(default=False)
+
+    class Meta:
+        ordering = ["position"]
+        constraints = [models.UniqueConstraint(fields=["cycle", "position"], name="swapcycleleg_position_uniq")]
+
+    def __str__(self):
+        return f"{self.cycle_id}.{self.position}: swap {self.swap_request_id}"
+
+
+@receiver(post_save, sender=SwapRequest)
+def match_swap_cycles(sender, instance, created, **kwargs):
+    if instance.status != "pending":
+        cycles.request_closed(instance.pk)
+    elif created:
+        cycles.request_opened(instance.pk)
+
+
+@receiver(pre_delete, sender=SwapRequest)
+def cancel_swap_cycles(sender, instance, **kwargs):
+    cycles.request_closed(instance.pk)
+
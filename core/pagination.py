@@ -0,0 +1,167 @@
+import base64
+import json
+from datetime import datetime
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+DEFAULT_PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
+DEFAULT_KEYS = ("created_at", "id")
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def encode_cursor(*values):
+    """Turn a position such as (created_at, id) into an opaque, URL-safe token."""
+    raw = json.dumps(values, default=_json_default, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token, size=len(DEFAULT_KEYS)):
+    """Return the list of key values for a token, or None if it is not a valid cursor."""
+    if not token:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    except (ValueError, UnicodeDecodeError):
+        return None
+    if not isinstance(values, list) or len(values) != size:
+        return None
+    return values
+
+
+def get_page_size(request, default=DEFAULT_PAGE_SIZE):
+    try:
+        size = int(request.GET.get("per_page", default))
+    except (TypeError, ValueError):
+        size = default
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+class KeysetPage:
+    """One page of a queryset walked in descending key order."""
+
+    def __init__(self, request, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self._params = request.GET.copy()
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __bool__(self):
+        return bool(self.items)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.prev_cursor is not None
+
+    def _query(self, **cursor):
+        params = self._params.copy()
+        params.pop("after", None)
+        params.pop("before", None)
+        params.update(cursor)
+        return params.urlencode()
+
+    @property
+    def next_query(self):
+        return self._query(after=self.next_cursor)
+
+    @property
+    def previous_query(self):
+        return self._query(before=self.prev_cursor)
+
+
+def first_page_query(request, **changes):
+    """
+    Query string for the first page of the listing with ``changes`` applied to
+    the current GET parameters (a value of None drops the parameter).
+    """
+    params = request.GET.copy()
+    params.pop("after", None)
+    params.pop("before", None)
+    for key, value in changes.items():
+        if value is None:
+            params.pop(key, None)
+        else:
+            params[key] = value
+    return params.urlencode()
+
+
+def _seek(keys, values, op):
+    """Build ``(k1 op v1) OR (k1 = v1 AND k2 op v2) OR ...`` for a keyset position."""
+    condition = Q()
+    for i, key in enumerate(keys):
+        term = Q(**{f"{key}__{op}": values[i]})
+        for prior, value in zip(keys[:i], values[:i]):
+            term &= Q(**{prior: value})
+        condition |= term
+    return condition
+
+
+def _cursor_for(obj, keys):
+    return encode_cursor(*(getattr(obj, key) for key in keys))
+
+
+def _keyset_slice(request, queryset, page_size, keys):
+    size = page_size or get_page_size(request)
+    after = decode_cursor(request.GET.get("after"), len(keys))
+    before = decode_cursor(request.GET.get("before"), len(keys)) if not after else None
+
+    try:
+        if after:
+            queryset = queryset.filter(_seek(keys, after, "lt"))
+        elif before:
+            queryset = queryset.filter(_seek(keys, before, "gt"))
+    except (ValidationError, ValueError, TypeError):
+        # A tampered cursor just lands on the first page.
+        after = before = None
+
+    if before:
+        return queryset.order_by(*keys)[:size + 1], size, after, before
+    return queryset.order_by(*(f"-{key}" for key in keys))[:size + 1], size, after, before
+
+
+def _keyset_page(request, rows, size, keys, after, before):
+    has_more = len(rows) > size
+    if before:
+        rows = rows[:size][::-1]
+        next_cursor = _cursor_for(rows[-1], keys) if rows else None
+        prev_cursor = _cursor_for(rows[0], keys) if rows and has_more else None
+        return KeysetPage(request, rows, next_cursor, prev_cursor)
+    rows = rows[:size]
+    next_cursor = _cursor_for(rows[-1], keys) if rows and has_more else None
+    prev_cursor = _cursor_for(rows[0], keys) if rows and after else None
+    return KeysetPage(request, rows, next_cursor, prev_cursor)
+
+
+def paginate_keyset(request, queryset, page_size=None, keys=DEFAULT_KEYS):
+    """
+    Slice ``queryset`` with a keyset on ``keys`` (newest first) instead of OFFSET.
+
+    ``?after=<cursor>`` walks towards older rows and ``?before=<cursor>`` walks
+    back towards newer ones, so every page is a single indexed range scan no
+    matter how deep it is. ``keys`` must end in a unique column such as ``id``.
+    """
+    rows, size, after, before = _keyset_slice(request, queryset, page_size, keys)
+    return _keyset_page(request, list(rows), size, keys, after, before)
+
+
+async def apaginate_keyset(request, queryset, page_size=None, keys=DEFAULT_KEYS):
+    """``paginate_keyset`` for async views, fetching the page with the async ORM."""
+    rows, size, after, before = _keyset_slice(request, queryset, page_size, keys)
+    return _keyset_page(request, [row async for row in rows], size, keys, after, before)
@@ -0,0 +1,73 @@
+"""
+The seller's payment verification queue.
+
+``verify()`` and ``reject()`` settle a batch of a seller's pending payments
+in one transaction: the payments are locked, written back with a single
+``bulk_update`` and, when verified, their Transaction rows are added with a
+single ``bulk_create``. Bulk writes skip the model signals, so the
+dashboard counters are adjusted here instead.
+"""
+from django.db import transaction
+
+from . import counters
+
+
+# Most payments one request may settle; matches the largest queue page.
+MAX_BATCH = 100
+
+
+def pending(seller_profile):
+    """The seller's payments waiting to be checked."""
+    from .models import Payment
+
+    return Payment.objects.filter(seller=seller_profile, status="Pending")
+
+
+def _locked(seller_profile, payment_ids):
+    ids = [int(pk) for pk in payment_ids if str(pk).isdigit()][:MAX_BATCH]
+    return list(
+        pending(seller_profile).select_for_update(of=("self",)).filter(pk__in=ids).select_related("book").order_by("id")
+    )
+
+
+def verify(seller_profile, payment_ids, mobile):
+    """Mark the seller's pending ``payment_ids`` verified and record their Transactions. Returns how many."""
+    from .models import Payment, Transaction
+
+    with transaction.atomic():
+        payments = _locked(seller_profile, payment_ids)
+        for payment in payments:
+            payment.status = "Verified"
+            payment.mobile = mobile
+            if payment.book and not payment.amount:
+                payment.amount = payment.book.price
+        Payment.objects.bulk_update(payments, ["status", "mobile", "amount"])
+        counters.rows_updated(payments)
+        # Transaction.book is required; a payment whose book was deleted has nothing to record.
+        transactions = Transaction.objects.bulk_create(
+            Transaction(
+                payment=payment,
+                buyer_id=payment.buyer_id,
+                seller_id=seller_profile.user_id,
+                book=payment.book,
+                amount=payment.amount or 0,
+                mobile=mobile,
+                status="success",
+            )
+            for payment in payments if payment.book
+        )
+        counters.rows_added(transactions)
+    return len(payments)
+
+
+def reject(seller_profile, payment_ids):
+    """Mark the seller's pending ``payment_ids`` rejected. Returns how many."""
+    from .models import Payment
+
+    with transaction.atomic():
+        payments = _locked(seller_profile, payment_ids)
+        for payment in payments:
+            payment.status = "Rejected"
+        Payment.objects.bulk_update(payments, ["status"])
+        counters.rows_updated(payments)
+    return len(payments)
@@ -0,0 +1,99 @@
+"""
+Query accounting for views: how many queries ran, how long they took, and
+which statement shapes repeated (the usual sign of an N+1 loop in a template).
+
+``inspect_queries()`` works without DEBUG, so the same numbers are available
+to ``core.middleware.QueryBudgetMiddleware`` and to tests. Budgets are declared
+per URL name in ``core.urls.QUERY_BUDGETS``.
+"""
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from django.db import connections
+
+
+# Same statement this many times in one request smells like a loop issuing queries.
+N_PLUS_ONE_THRESHOLD = 5
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST_RE = re.compile(r"\(\s*(?:\?|%s)(?:\s*,\s*(?:\?|%s))*\s*\)")
+
+
+def normalize(sql):
+    """Reduce a statement to its shape: literals and IN lists become placeholders."""
+    sql = _STRING_RE.sub("?", sql)
+    sql = _NUMBER_RE.sub("?", sql)
+    sql = _IN_LIST_RE.sub("(...)", sql)
+    return " ".join(sql.split())
+
+
+class QueryReport:
+    def __init__(self):
+        self.queries = []  # (sql, seconds)
+
+    def record(self, sql, seconds):
+        self.queries.append((sql, seconds))
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def time_ms(self):
+        return sum(seconds for _, seconds in self.queries) * 1000
+
+    @property
+    def shapes(self):
+        return Counter(normalize(sql) for sql, _ in self.queries)
+
+    def duplicates(self):
+        """Statement shapes that ran more than once, most repeated first."""
+        return [(shape, n) for shape, n in self.shapes.most_common() if n > 1]
+
+    def n_plus_one(self, threshold=N_PLUS_ONE_THRESHOLD):
+        return [(shape, n) for shape, n in self.duplicates() if n >= threshold]
+
+    def summary(self):
+        lines = [f"{self.count} queries in {self.time_ms:.1f} ms"]
+        lines += [f"  {n}x {shape}" for shape, n in self.duplicates()]
+        return "\n".join(lines)
+
+
+@contextmanager
+def inspect_queries(using="default"):
+    report = QueryReport()
+
+    def wrapper(execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            report.record(sql, time.perf_counter() - start)
+
+    with connections[using].execute_wrapper(wrapper):
+        yield report
+
+
+def budget_for(url_name):
+    from .urls import QUERY_BUDGETS
+
+    return QUERY_BUDGETS.get(url_name)
+
+
+class QueryBudgetTestMixin:
+    """TestCase mixin: ``self.assertWithinQueryBudget("dashboard")`` GETs the URL and checks its budget."""
+
+    def assertWithinQueryBudget(self, url_name, *args, query_string=""):
+        from django.urls import reverse
+
+        budget = budget_for(url_name)
+        self.assertIsNotNone(budget, f"No query budget declared for {url_name!r} in core.urls.QUERY_BUDGETS")
+        with inspect_queries() as report:
+            response = self.client.get(reverse(url_name, args=args) + query_string)
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(report.count, budget, f"{url_name} is over its budget of {budget}:\n{report.summary()}")
+        self.assertFalse(report.n_plus_one(), f"{url_name} looks like an N+1:\n{report.summary()}")
+        return report
@@ -0,0 +1,70 @@
+"""
+Denormalized rating aggregates on Book.
+
+``review_count``, ``rating_sum`` and ``rating_avg`` are adjusted with a single
+F()-expression UPDATE whenever a Review is created, edited or deleted, so
+product pages and "top rated" listings read ratings straight off the row.
+``manage.py reconcile_ratings`` repairs any drift from the Review table.
+"""
+from django.db.models import Avg, Count, F, FloatField, Sum
+from django.db.models.functions import Cast, NullIf
+from django.utils import timezone
+
+from . import changes
+
+
+def _apply(book_id, count_delta, sum_delta):
+    from .models import Book
+
+    if book_id is None or (not count_delta and not sum_delta):
+        return
+    new_count = F("review_count") + count_delta
+    new_sum = F("rating_sum") + sum_delta
+    # Right-hand sides see the pre-update row, so all three move together.
+    Book.objects.filter(pk=book_id).update(
+        review_count=new_count,
+        rating_sum=new_sum,
+        rating_avg=Cast(new_sum, FloatField()) / NullIf(new_count, 0),
+        updated_at=timezone.now(),
+    )
+    changes.record(book_id, "updated", ["rating"])
+
+
+def review_saved(review, previous):
+    """``previous`` is the (book_id, rating) the row had before this save, or None if new."""
+    rating = int(review.rating)
+    if previous is None:
+        _apply(review.book_id, +1, rating)
+        return
+    old_book_id, old_rating = previous
+    if old_book_id == review.book_id:
+        _apply(review.book_id, 0, rating - old_rating)
+    else:
+        _apply(old_book_id, -1, -old_rating)
+        _apply(review.book_id, +1, rating)
+
+
+def review_deleted(book_id, rating):
+    _apply(book_id, -1, -int(rating))
+
+
+def reconcile(dry_run=False):
+    """Recompute aggregates from Review and fix the books that drifted. Returns the ids fixed."""
+    from .models import Book, Review
+
+    actual = {
+        row["book"]: row
+        for row in Review.objects.values("book").annotate(n=Count("id"), total=Sum("rating"), avg=Avg("rating")).order_by()
+    }
+    drifted, now = [], timezone.now()
+    for book in Book.objects.only("id", "review_count", "rating_sum", "rating_avg").iterator(chunk_size=2000):
+        row = actual.get(book.id, {"n": 0, "total": 0, "avg": None})
+        if (book.review_count, book.rating_sum) != (row["n"], row["total"] or 0):
+            book.review_count = row["n"]
+            book.rating_sum = row["total"] or 0
+            book.rating_avg = row["avg"]
+            book.updated_at = now
+            drifted.append(book)
+    if drifted and not dry_run:
+        Book.objects.bulk_update(drifted, ["review_count", "rating_sum", "rating_avg", "updated_at"], batch_size=1000)
+    return [book.id for book in drifted]
@@ -0,0 +1,203 @@
+"""
+"Readers also swapped": item-item recommendations from co-occurrence.
+
+Two books co-occur when the same reader asked to swap for, paid for or
+reviewed both. ``rebuild()`` (``manage.py rebuild_recommendations``, also a
+daily job) builds the sparse book-by-book co-occurrence matrix from every
+SwapRequest, Payment and Review, scores each pair by cosine similarity and
+stores the best ``NEIGHBOURS`` per book (``BookNeighbour``) and the best
+``READER_RECOMMENDATIONS`` per reader (``ReaderRecommendation``).
+
+A new or deleted interaction queues ``refresh()``, which recomputes only the
+rows it changes: the book's own, those of the books it co-occurs with, and
+the reader's list. Other readers' lists catch up at the next rebuild.
+
+Pages read the stored rows with one indexed query (``for_book``,
+``for_reader``); nothing is computed per request.
+"""
+import heapq
+import math
+from collections import Counter, defaultdict
+
+from django.apps import apps
+from django.db import transaction
+from django.db.models import Max
+
+from . import jobs
+
+
+NEIGHBOURS = 12
+READER_RECOMMENDATIONS = 12
+SHOWN = 6
+# Only a reader's most recent books count, which bounds the pairs a very
+# active account (a shop, a bulk buyer) adds to the matrix.
+MAX_BASKET = 200
+BATCH_SIZE = 2000
+
+# Interaction model -> (reader field, book field)
+SOURCES = {
+    "core.SwapRequest": ("requester_id", "requested_book_id"),
+    "core.Payment": ("buyer_id", "book_id"),
+    "core.Review": ("reviewer_id", "book_id"),
+}
+
+
+def interactions(readers=None, books=None):
+    """
+    ``(reader, book, latest interaction time)`` for every reader and book that
+    interacted, optionally only for ``readers`` or ``books``. A pair may repeat
+    once per source.
+    """
+    for label, (reader_field, book_field) in SOURCES.items():
+        queryset = apps.get_model(label)._default_manager.filter(**{f"{book_field}__isnull": False}).order_by()
+        if readers is not None:
+            queryset = queryset.filter(**{f"{reader_field}__in": list(readers)})
+        if books is not None:
+            queryset = queryset.filter(**{f"{book_field}__in": list(books)})
+        pairs = queryset.values_list(reader_field, book_field).annotate(at=Max("created_at"))
+        yield from pairs.iterator(chunk_size=BATCH_SIZE)
+
+
+def baskets(rows):
+    """Each reader's distinct books, most recent first and at most MAX_BASKET, from interaction rows."""
+    latest = {}
+    for reader, book, at in rows:
+        if latest.get((reader, book), at) <= at:
+            latest[reader, book] = at
+    by_reader = defaultdict(list)
+    for (reader, book), at in latest.items():
+        by_reader[reader].append((at, book))
+    return {reader: [book for _, book in heapq.nlargest(MAX_BASKET, items)] for reader, items in by_reader.items()}
+
+
+def reader_counts(rows):
+    """How many distinct readers each book has, from interaction rows."""
+    readers = defaultdict(set)
+    for reader, book, _ in rows:
+        readers[book].add(reader)
+    return {book: len(ids) for book, ids in readers.items()}
+
+
+def cooccurrence(reader_baskets, books=None):
+    """The sparse co-occurrence matrix ``{book: Counter({other: shared readers})}``, only the ``books`` rows if given."""
+    matrix = defaultdict(Counter)
+    for basket in reader_baskets.values():
+        for book in basket if books is None else books.intersection(basket):
+            matrix[book].update(basket)
+    for book, row in matrix.items():
+        del row[book]
+    return matrix
+
+
+def top_neighbours(book, row, counts):
+    """The NEIGHBOURS best ``(score, other)`` of one matrix row, by cosine similarity."""
+    return heapq.nlargest(
+        NEIGHBOURS,
+        ((shared / math.sqrt(counts[book] * counts[other]), other) for other, shared in row.items()),
+    )
+
+
+def reader_picks(basket, neighbours, owned):
+    """The READER_RECOMMENDATIONS best ``(score, book)`` for a reader: neighbours of their books they haven't seen."""
+    scores = Counter()
+    for book in basket:
+        for score, other in neighbours.get(book, ()):
+            scores[other] += score
+    seen = owned.union(basket)
+    return heapq.nlargest(READER_RECOMMENDATIONS, ((score, book) for book, score in scores.items() if book not in seen))
+
+
+def _neighbour_rows(neighbours):
+    from .models import BookNeighbour
+
+    for book, top in neighbours.items():
+        for rank, (score, other) in enumerate(top):
+            yield BookNeighbour(book_id=book, neighbour_id=other, score=score, rank=rank)
+
+
+def _pick_rows(picks):
+    from .models import ReaderRecommendation
+
+    for reader, top in picks.items():
+        for rank, (score, book) in enumerate(top):
+            yield ReaderRecommendation(user_id=reader, book_id=book, score=score, rank=rank)
+
+
+def rebuild():
+    """Recompute every stored recommendation. Returns ``(book rows, reader rows)`` written."""
+    from .models import Book, BookNeighbour, ReaderRecommendation
+
+    rows = list(interactions())
+    reader_baskets = baskets(rows)
+    counts = reader_counts(rows)
+    neighbours = {book: top_neighbours(book, row, counts) for book, row in cooccurrence(reader_baskets).items()}
+    owned = defaultdict(set)
+    for owner, book in Book.objects.values_list("owner_id", "id").iterator(chunk_size=BATCH_SIZE):
+        owned[owner].add(book)
+    picks = {reader: reader_picks(basket, neighbours, owned[reader]) for reader, basket in reader_baskets.items()}
+    with transaction.atomic():
+        BookNeighbour.objects.all().delete()
+        ReaderRecommendation.objects.all().delete()
+        book_rows = BookNeighbour.objects.bulk_create(_neighbour_rows(neighbours), batch_size=BATCH_SIZE)
+        reader_rows = ReaderRecommendation.objects.bulk_create(_pick_rows(picks), batch_size=BATCH_SIZE)
+    return len(book_rows), len(reader_rows)
+
+
+def refresh(book_id, reader_id):
+    """Recompute what one added or removed interaction of ``reader_id`` with ``book_id`` changes."""
+    from .models import Book, BookNeighbour, ReaderRecommendation
+
+    basket = baskets(interactions(readers=[reader_id])).get(reader_id, [])
+    # Rows that changed: the book's own and every row it appears in (a shared-reader
+    # count or its reader count moved), plus the rest of this reader's basket.
+    affected = {book_id, *basket}
+    book_readers = {reader for reader, _, _ in interactions(books=[book_id])}
+    for other_basket in baskets(interactions(readers=book_readers)).values():
+        if book_id in other_basket:
+            affected.update(other_basket)
+
+    affected_rows = list(interactions(books=affected))
+    matrix = cooccurrence(baskets(interactions(readers={reader for reader, _, _ in affected_rows})), affected)
+    counts = reader_counts(affected_rows)
+    others = {other for row in matrix.values() for other in row} - affected
+    counts.update(reader_counts(interactions(books=others)))
+    neighbours = {book: top_neighbours(book, matrix[book], counts) if book in matrix else [] for book in affected}
+    owned = set(Book.objects.filter(owner_id=reader_id).values_list("id", flat=True))
+    picks = {reader_id: reader_picks(basket, neighbours, owned)}
+    with transaction.atomic():
+        BookNeighbour.objects.filter(book_id__in=list(affected)).delete()
+        ReaderRecommendation.objects.filter(user_id=reader_id).delete()
+        BookNeighbour.objects.bulk_create(_neighbour_rows(neighbours), batch_size=BATCH_SIZE)
+        ReaderRecommendation.objects.bulk_create(_pick_rows(picks), batch_size=BATCH_SIZE)
+    return len(affected)
+
+
+def interaction_changed(instance):
+    """Queue a refresh for a SwapRequest, Payment or Review that was created or deleted."""
+    reader_field, book_field = SOURCES[instance._meta.label]
+    book_id, reader_id = getattr(instance, book_field), getattr(instance, reader_field)
+    if book_id is None:
+        return
+    jobs.enqueue(
+        "core.refresh_recommendations",
+        book_id=book_id,
+        reader_id=reader_id,
+        unique_key=f"recommendations:{book_id}:{reader_id}",
+    )
+
+
+def for_book(book_id, viewer=None):
+    """Books readers of ``book_id`` also wanted, best first, leaving out the viewer's own."""
+    from .models import Book
+
+    books = Book.objects.filter(neighbour_of__book_id=book_id).order_by("neighbour_of__rank")
+    if viewer is not None and viewer.is_authenticated:
+        books = books.exclude(owner=viewer)
+    return books[:SHOWN]
+
+
+def for_reader(user):
+    """The books suggested to ``user``, best first."""
+    from .models import Book
+
+    return Book.objects.filter(recommended_to__user=user).order_by("recommended_to__rank")[:SHOWN]
@@ -0,0 +1,140 @@
+"""
+Ranked full-text search over the Book catalog.
+
+Production (PostgreSQL) keeps a weighted ``tsvector`` in ``Book.search_vector``
+behind a GIN index. Local SQLite runs keep the same document in the
+``core_book_fts`` FTS5 table, keyed by book id. Both are maintained by the
+Book signals in ``core.models`` and can be rebuilt with
+``manage.py rebuild_search_index``.
+"""
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection
+from django.db.models import F, FloatField, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce
+
+
+SEARCH_CONFIG = "simple"
+FTS_TABLE = "core_book_fts"
+GIN_INDEX = "book_search_vector_gin"
+
+# Field weights: a hit in the title outranks one in the description.
+WEIGHTS = (("title", "A", 10.0), ("author", "B", 5.0), ("genre", "C", 2.0), ("description", "D", 1.0))
+
+_TERM_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def is_postgres(conn=connection):
+    return conn.vendor == "postgresql"
+
+
+def has_fts(conn=connection):
+    return conn.vendor == "sqlite"
+
+
+def search_vector():
+    vector = None
+    for field, weight, _ in WEIGHTS:
+        part = SearchVector(Coalesce(F(field), Value("")), weight=weight, config=SEARCH_CONFIG)
+        vector = part if vector is None else vector + part
+    return vector
+
+
+def _fts_match(query):
+    """Quote each term for FTS5 and prefix-match the last one, so user input never hits MATCH syntax."""
+    terms = _TERM_RE.findall(query)
+    if not terms:
+        return ""
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+def search_books(queryset, query):
+    """
+    Filter ``queryset`` to books matching ``query`` and annotate a ``rank``
+    (higher is better). Pair with ``paginate_keyset(keys=("rank", "id"))``.
+    """
+    if is_postgres():
+        search_query = SearchQuery(query, search_type="websearch", config=SEARCH_CONFIG)
+        return queryset.filter(search_vector=search_query).annotate(
+            rank=SearchRank(F("search_vector"), search_query)
+        )
+
+    if not has_fts():
+        # Other backends get the old substring match, unranked.
+        return (queryset.filter(title__icontains=query) | queryset.filter(author__icontains=query)).annotate(
+            rank=Value(0.0, output_field=FloatField())
+        )
+
+    match = _fts_match(query)
+    if not match:
+        return queryset.none().annotate(rank=Value(0.0, output_field=FloatField()))
+    weights = ", ".join(str(w) for _, _, w in WEIGHTS)
+    # bm25() is "lower is better"; negate it so both backends sort rank descending.
+    rank = RawSQL(
+        f"SELECT -bm25({FTS_TABLE}, {weights}) FROM {FTS_TABLE} "
+        f"WHERE {FTS_TABLE} MATCH %s AND {FTS_TABLE}.rowid = core_book.id",
+        (match,),
+        output_field=FloatField(),
+    )
+    return queryset.filter(id__in=RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", (match,))).annotate(rank=rank)
+
+
+def index_book(book):
+    """Refresh the search document for a single book."""
+    from .models import Book
+
+    if is_postgres():
+        Book.objects.filter(pk=book.pk).update(search_vector=search_vector())
+        return
+    if not has_fts():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [book.pk])
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, title, author, genre, description) VALUES (%s, %s, %s, %s, %s)",
+            [book.pk, book.title, book.author or "", book.genre or "", book.description or ""],
+        )
+
+
+def index_books(books):
+    """Add search documents for newly bulk-created books."""
+    from .models import Book
+
+    if is_postgres():
+        Book.objects.filter(pk__in=[book.pk for book in books]).update(search_vector=search_vector())
+        return
+    if not has_fts():
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT INTO {FTS_TABLE} (rowid, title, author, genre, description) VALUES (%s, %s, %s, %s, %s)",
+            [(book.pk, book.title, book.author or "", book.genre or "", book.description or "") for book in books],
+        )
+
+
+def unindex_book(book_id):
+    if not has_fts():
+        return  # on Postgres the tsvector lives on the row and goes with it
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [book_id])
+
+
+def rebuild_index():
+    """Recompute every search document in one statement per backend. Returns the row count."""
+    from .models import Book
+
+    if is_postgres():
+        return Book.objects.update(search_vector=search_vector())
+    if not has_fts():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, title, author, genre, description) "
+            "SELECT id, title, COALESCE(author, ''), COALESCE(genre, ''), COALESCE(description, '') FROM core_book"
+        )
+        return cursor.rowcount
@@ -0,0 +1,41 @@
+"""
+Session engines behind ``SESSION_MODE`` (see settings), besides Django's own
+``db`` and ``cached_db``.
+
+- ``cache``: the shared ``sessions`` cache only, no database at all.
+- ``signed_cookies``: the session lives in the cookie itself.
+
+The cache and signed-cookie engines adopt sessions the database engine stored
+before the switch. On a miss they look up the cookie's key in ``django_session``,
+take the data over and delete the row, so changing modes logs nobody out.
+cached_db reads the table anyway and needs no such step.
+"""
+import re
+
+from asgiref.sync import sync_to_async
+from django.contrib.sessions.backends.db import SessionStore as DatabaseStore
+from django.utils import timezone
+
+
+# Keys the database engine hands out (SessionBase._get_new_session_key).
+LEGACY_KEY_RE = re.compile(r"^[0-9a-z]{32}$")
+
+
+def adopt_database_session(session_key, store):
+    """
+    The data of the unexpired ``django_session`` row for ``session_key`` (deleted
+    on the way out, so it cannot outlive a later logout), with its expiry, or
+    ``(None, None)``.
+    """
+    if not session_key or not LEGACY_KEY_RE.match(session_key):
+        return None, None
+    model = DatabaseStore.get_model_class()
+    row = model.objects.filter(session_key=session_key, expire_date__gt=timezone.now()).first()
+    if row is None:
+        return None, None
+    data = store.decode(row.session_data)
+    model.objects.filter(session_key=session_key).delete()
+    return data, row.expire_date
+
+
+aadopt_database_session = sync_to_async(adopt_database_session)
@@ -0,0 +1,28 @@
+"""Cache-only sessions that adopt the database engine's sessions on first use, see core.sessions."""
+from django.contrib.sessions.backends import cache
+
+from . import aadopt_database_session, adopt_database_session
+
+
+class SessionStore(cache.SessionStore):
+    def load(self):
+        key = self.session_key
+        data = super().load()
+        if self.session_key is None:
+            legacy, expiry = adopt_database_session(key, self)
+            if legacy is not None:
+                self._session_key = key
+                self._cache.set(self.cache_key, legacy, self.get_expiry_age(expiry=expiry))
+                return legacy
+        return data
+
+    async def aload(self):
+        key = self.session_key
+        data = await super().aload()
+        if self.session_key is None:
+            legacy, expiry = await aadopt_database_session(key, self)
+            if legacy is not None:
+                self._session_key = key
+                await self._cache.aset(await self.acache_key(), legacy, await self.aget_expiry_age(expiry=expiry))
+                return legacy
+        return data
@@ -0,0 +1,28 @@
+"""Signed-cookie sessions that adopt the database engine's sessions on first use, see core.sessions."""
+from django.contrib.sessions.backends import signed_cookies
+
+from . import LEGACY_KEY_RE, aadopt_database_session, adopt_database_session
+
+
+class SessionStore(signed_cookies.SessionStore):
+    def _is_legacy(self):
+        return bool(self.session_key and LEGACY_KEY_RE.match(self.session_key))
+
+    def _adopted(self, legacy):
+        # Re-issued as a signed cookie on this response.
+        self.modified = True
+        return legacy
+
+    def load(self):
+        if self._is_legacy():
+            legacy, _ = adopt_database_session(self.session_key, self)
+            if legacy is not None:
+                return self._adopted(legacy)
+        return super().load()
+
+    async def aload(self):
+        if self._is_legacy():
+            legacy, _ = await aadopt_database_session(self.session_key, self)
+            if legacy is not None:
+                return self._adopted(legacy)
+        return super().load()
@@ -0,0 +1,123 @@
+"""
+Accepting a swap request.
+
+``accept()`` is one transaction. It locks the books being traded, then the
+request, and flips it from
+pending to accepted with a conditional UPDATE, so of two simultaneous
+accepts (or an accept racing a reject) only one can win. The same
+transaction rejects every other pending request for either book, since
+neither is available any more, and records the Transaction and Sale rows, so
+an accepted request never exists without them.
+``reject()`` makes the same conditional move to rejected, so a reject that
+arrives after an accept leaves the accepted request alone.
+
+Both writes are bulk ``update()`` calls that bypass the model signals, so
+``closed()`` applies what those signals would have done: the dashboard
+counters and the withdrawal of swap circles the requests belonged to.
+"""
+from django.db import transaction
+from django.db.models import Q
+
+from . import counters, cycles
+
+
+class SwapNotPending(ValueError):
+    """The request was accepted, rejected or withdrawn before this accept got to it."""
+
+
+def closed(swaps):
+    """Signal bookkeeping for pending requests just moved to another status with ``update()``."""
+    counters.rows_updated(swaps)
+    cycles.request_closed(*(swap.pk for swap in swaps))
+
+
+def lock_books(swaps):
+    """
+    Lock the books ``swaps`` trade, in pk order. Every accept takes these
+    locks before any request row, so two accepts sharing a book queue up here
+    rather than each locking its own request and then waiting for the other's
+    in ``reject_competing()``.
+    """
+    from .models import Book
+
+    books = ({swap.requested_book_id for swap in swaps} | {swap.offered_book_id for swap in swaps}) - {None}
+    list(Book.objects.select_for_update().filter(pk__in=books).order_by("pk").values_list("pk", flat=True))
+
+
+def record_sales(swaps):
+    """The Transaction and Sale rows for just-accepted ``swaps``; call inside the accepting transaction."""
+    from .models import Book, Sale, Transaction, UserProfile
+
+    books = Book.objects.in_bulk({swap.requested_book_id for swap in swaps})
+    for swap in swaps:
+        book = books[swap.requested_book_id]
+        buyer_profile, _ = UserProfile.objects.get_or_create(user_id=swap.requester_id)
+        seller_profile, _ = UserProfile.objects.get_or_create(user_id=swap.owner_id)
+        sale_transaction = Transaction.objects.create(
+            buyer_id=swap.requester_id,
+            seller_id=swap.owner_id,
+            book=book,
+            amount=book.price or 0,
+            mobile=buyer_profile.gpay_number,
+            status="success",
+        )
+        Sale.objects.create(
+            swap_request=swap,
+            buyer=buyer_profile,
+            seller=seller_profile,
+            book=book,
+            transaction=sale_transaction,
+        )
+
+
+def reject_competing(swaps):
+    """Reject the pending requests, other than ``swaps``, asking for or offering one of their books. Returns how many."""
+    from .models import SwapRequest
+
+    books = ({swap.requested_book_id for swap in swaps} | {swap.offered_book_id for swap in swaps}) - {None}
+    competing = list(
+        SwapRequest.objects.select_for_update()
+        .filter(Q(requested_book_id__in=books) | Q(offered_book_id__in=books), status="pending")
+        .exclude(pk__in=[swap.pk for swap in swaps])
+        .only("id", "owner_id", "status")
+        .order_by("pk")
+    )
+    if not competing:
+        return 0
+    SwapRequest.objects.filter(pk__in=[swap.pk for swap in competing], status="pending").update(status="rejected")
+    for swap in competing:
+        swap.status = "rejected"
+    closed(competing)
+    return len(competing)
+
+
+def accept(swap):
+    """
+    Accept a pending SwapRequest and reject the requests competing with it.
+    Returns how many were rejected; raises SwapNotPending if it lost a race.
+    """
+    from .models import SwapRequest
+
+    with transaction.atomic():
+        lock_books([swap])
+        locked = SwapRequest.objects.select_for_update().filter(pk=swap.pk, status="pending").only(
+            "id", "owner_id", "requester_id", "status", "requested_book_id", "offered_book_id"
+        ).first()
+        # Without row locks (SQLite) both callers can get this far; only one wins this UPDATE.
+        if locked is None or not SwapRequest.objects.filter(pk=swap.pk, status="pending").update(status="accepted"):
+            raise SwapNotPending(f"Swap request {swap.pk} is no longer pending.")
+        locked.status = swap.status = "accepted"
+        closed([locked])
+        record_sales([locked])
+        rejected = reject_competing([locked])
+    return rejected
+
+
+def reject(swap):
+    """Reject a pending SwapRequest; raises SwapNotPending if it was accepted, rejected or withdrawn first."""
+    from .models import SwapRequest
+
+    if not SwapRequest.objects.filter(pk=swap.pk, status="pending").update(status="rejected"):
+        raise SwapNotPending(f"Swap request {swap.pk} is no longer pending.")
+    swap.status = "rejected"
+    closed([swap])
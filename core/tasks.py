@@ -0,0 +1,60 @@
+"""Background jobs for core, run by ``manage.py run_jobs`` (see core.jobs)."""
+from datetime import timedelta
+
+from django.apps import apps
+from django.utils import timezone
+
+from . import blobs, changes, counters, cycles, images, imports, ratings, recommendations
+from .jobs import DONE_RETENTION, task
+
+
+@task(name="core.refresh_image_variants")
+def refresh_image_variants(label, pk):
+    instance = apps.get_model(label)._default_manager.filter(pk=pk).first()
+    if instance is not None:
+        images.refresh_all(instance)
+
+
+@task(name="core.import_catalog", max_attempts=3, atomic=False)
+def import_catalog(import_id):
+    """An uploaded catalog file; commits batch by batch and resumes where a failed attempt stopped."""
+    imports.import_upload(import_id)
+
+
+@task(name="core.match_swap_cycles")
+def match_swap_cycles(swap_id):
+    cycles.propose(swap_id)
+
+
+@task(name="core.reconcile_aggregates", every=timedelta(days=1))
+def reconcile_aggregates():
+    ratings.reconcile()
+    counters.reconcile()
+
+
+@task(name="core.collect_blobs", every=timedelta(days=1))
+def collect_blobs():
+    blobs.recount()
+    blobs.collect()
+
+
+@task(name="core.compact_book_changes", every=timedelta(days=1))
+def compact_book_changes():
+    changes.compact()
+
+
+@task(name="core.refresh_recommendations")
+def refresh_recommendations(book_id, reader_id):
+    recommendations.refresh(book_id, reader_id)
+
+
+@task(name="core.rebuild_recommendations", every=timedelta(days=1))
+def rebuild_recommendations():
+    recommendations.rebuild()
+
+
+@task(name="core.prune_jobs", every=timedelta(days=1))
+def prune_jobs():
+    from .models import Job
+
+    Job.objects.filter(status="done", finished_at__lt=timezone.now() - DONE_RETENTION).delete()
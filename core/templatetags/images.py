@@ -0,0 +1,59 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from .. import images
+
+
+register = template.Library()
+
+CARD_SIZES = "(max-width: 768px) 100vw, 25vw"
+
+
+def _variants(instance, field_name):
+    fieldfile = getattr(instance, field_name)
+    variants = getattr(instance, images.variants_field(field_name), None) or {}
+    if images.is_current(fieldfile, variants) and variants.get("widths"):
+        return fieldfile, variants
+    return fieldfile, None
+
+
+@register.simple_tag
+def srcset(instance, field_name, fmt="webp"):
+    """``srcset`` value for one derivative format, or "" if no derivatives exist yet."""
+    fieldfile, variants = _variants(instance, field_name)
+    if not variants:
+        return ""
+    return ", ".join(
+        f"{fieldfile.storage.url(images.variant_name(variants['source'], width, fmt))} {width}w"
+        for width in variants["widths"]
+    )
+
+
+@register.simple_tag
+def picture(instance, field_name, sizes=CARD_SIZES, alt="", **attrs):
+    """
+    ``<picture>`` with WebP and JPEG ``srcset`` for an image field, falling back
+    to a plain ``<img>`` of the original upload until derivatives exist.
+    Extra keyword arguments (``class``, ``style``) become ``<img>`` attributes.
+    """
+    fieldfile, variants = _variants(instance, field_name)
+    if not fieldfile:
+        return ""
+    extra = format_html_join("", ' {}="{}"', sorted(attrs.items()))
+    if not variants:
+        return format_html('<img src="{}" alt="{}" loading="lazy"{}>', fieldfile.url, alt, extra)
+    largest = variants["widths"][-1]
+    height = round(variants["height"] * largest / variants["width"])
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" alt="{}" loading="lazy" decoding="async"{}></picture>',
+        srcset(instance, field_name, "webp"),
+        sizes,
+        fieldfile.storage.url(images.variant_name(variants["source"], largest, "jpeg")),
+        srcset(instance, field_name, "jpeg"),
+        sizes,
+        largest,
+        height,
+        alt,
+        extra,
+    )
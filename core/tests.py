@@ -1,3 +1,1770 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import zipfile
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import cache, caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.db.models import F
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from PIL import Image
+
+from . import (
+    blobs, changes, counters, cycles, facets, fuzzy, geo, images, imports, jobs, payments, ratings, recommendations, search,
+    swaps,
+)
+from .models import (
+    Blob, Book, BookChange, BookNeighbour, CatalogImport, DashboardSummary, FacetCount, Job, Payment, ReaderRecommendation, Review, Sale,
+    SwapCycle, SwapRequest, Transaction,
+)
+from .pagination import decode_cursor, encode_cursor, paginate_keyset
+from .querybudget import QueryBudgetTestMixin, inspect_queries, normalize
+
+
+def load_settings(name, **env):
+    """Import the settings in a fresh interpreter with ``env`` over a bare environment and print ``name``."""
+    env = {**{k: v for k, v in os.environ.items() if k not in ENV_SETTINGS}, **env}
+    return subprocess.run(
+        [sys.executable, "-c", f"import book_exchange.settings as s; print(s.{name})"],
+        cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+    )
+
+
+ENV_SETTINGS = ("CACHE_DIR", "DB_NAME", "DB_SQLITE", "DEBUG", "REDIS_URL", "SESSION_CACHE_MAX_ENTRIES", "SESSION_MODE")
+
+
+class SeededCatalogTestCase(TestCase):
+    """A few users with books, swap requests, payments, transactions and reviews."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user("reader", password="pw")
+        sellers = [User.objects.create_user(f"seller{i}", password="pw") for i in range(5)]
+        for user, place in zip([cls.reader, *sellers], ["Bengaluru", "Bangalore", "Mysuru", "Chennai", "Mumbai", ""]):
+            user.profile.place = place
+            user.profile.save()
+        books = []
+        for i in range(200):
+            books.append(Book.objects.create(
+                owner=sellers[i % 5] if i % 7 else cls.reader,
+                title=f"Book {i}",
+                author=f"Author {i % 13}",
+                genre=("Fiction", "History", "Poetry")[i % 3],
+                availability=("swap", "sell", "both")[i % 3],
+                price=Decimal(i * 5),
+            ))
+        for i, book in enumerate(books[:60]):
+            SwapRequest.objects.create(
+                requester=cls.reader if i % 2 else sellers[(i + 1) % 5],
+                owner=book.owner,
+                requested_book=book,
+                offered_book=books[-1 - i],
+                status=("pending", "accepted", "rejected")[i % 3],
+            )
+            Payment.objects.create(
+                buyer=cls.reader if i % 2 else sellers[(i + 2) % 5],
+                seller=book.owner.profile,
+                book=book,
+                amount=book.price,
+                screenshot="payments/screenshots/seed.png",
+                status=("Pending", "Verified", "Rejected")[i % 3],
+            )
+            Transaction.objects.create(buyer=cls.reader, seller=book.owner, book=book, amount=book.price)
+            Review.objects.create(book=books[0], reviewer=sellers[i % 5], rating=1 + i % 5, comment="ok")
+        cls.book = books[0]
+        recommendations.rebuild()
+        Job.objects.filter(task__in=["core.refresh_recommendations", "core.match_swap_cycles"]).delete()
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.reader)
+
+
+class KeysetPaginationTests(TestCase):
+    """Cursors round-trip, bad ones fall back to the first page, and pages walk both ways through ties."""
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create_user("shelf", password="pw")
+        Book.objects.bulk_create(Book(owner=owner, title=f"Tied {i}") for i in range(25))
+        # Every book shares one created_at, so only the id breaks ties.
+        Book.objects.update(created_at=timezone.now())
+
+    def page(self, **params):
+        return paginate_keyset(RequestFactory().get("/books/", params), Book.objects.all(), page_size=10)
+
+    def ids(self, page):
+        return [book.id for book in page]
+
+    def test_cursor_round_trip(self):
+        when = timezone.now()
+        token = encode_cursor(when, 42)
+        self.assertNotIn("=", token)
+        self.assertEqual(decode_cursor(token), [when.isoformat(), 42])
+        self.assertIsNone(decode_cursor(token, 3))
+
+    def test_invalid_cursors(self):
+        for token in ("", "!!!", "bm90IGpzb24", encode_cursor(1), encode_cursor("x", 1)[:-2]):
+            with self.subTest(token=token):
+                self.assertIsNone(decode_cursor(token))
+        first = self.ids(self.page())
+        # Well-formed tokens with values of the wrong type land on the first page too.
+        for token in (encode_cursor("yesterday", 1), encode_cursor(timezone.now(), "one"), "garbage"):
+            with self.subTest(token=token):
+                page = self.page(after=token)
+                self.assertEqual(self.ids(page), first)
+                self.assertFalse(page.has_previous)
+
+    def test_ties_on_the_sort_key(self):
+        seen, params = [], {}
+        while True:
+            page = self.page(**params)
+            seen += self.ids(page)
+            if not page.has_next:
+                break
+            params = {"after": page.next_cursor}
+        self.assertEqual(seen, sorted(Book.objects.values_list("id", flat=True), reverse=True))
+
+    def test_forward_then_back(self):
+        first = self.page()
+        second = self.page(after=first.next_cursor)
+        third = self.page(after=second.next_cursor)
+        self.assertEqual(len(third), 5)
+        self.assertFalse(third.has_next)
+        back = self.page(before=third.prev_cursor)
+        self.assertEqual(self.ids(back), self.ids(second))
+        self.assertEqual((back.next_cursor, back.prev_cursor), (second.next_cursor, second.prev_cursor))
+        start = self.page(before=back.prev_cursor)
+        self.assertEqual(self.ids(start), self.ids(first))
+        self.assertFalse(start.has_previous)
+        self.assertIn("after=", start.next_query)
+
+
+class SearchTests(TestCase):
+    """Full-text search ranks title hits above author and description hits, and the index rebuilds from the rows."""
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create_user("library", password="pw")
+        cls.books = [
+            Book.objects.create(owner=owner, title="Apples", author="Pat Lee", description="An orchard year in pictures."),
+            Book.objects.create(owner=owner, title="Seasons", author="Ann Orchard", description="Notes from a farm."),
+            Book.objects.create(owner=owner, title="The Orchard", author="Sam Roe", description="A novel."),
+            Book.objects.create(owner=owner, title="Pears", author="Jo Kim", description="No match here."),
+        ]
+
+    def titles(self, query):
+        return list(search.search_books(Book.objects.all(), query).order_by("-rank", "-id").values_list("title", flat=True))
+
+    def test_ranking_order(self):
+        self.assertEqual(self.titles("orchard"), ["The Orchard", "Seasons", "Apples"])
+        self.assertEqual(self.titles("orch"), ["The Orchard", "Seasons", "Apples"])  # the last term is a prefix
+        self.assertEqual(self.titles('"orchard'), ["The Orchard", "Seasons", "Apples"])  # input never reaches MATCH syntax
+        self.assertEqual(self.titles("?!"), [])
+
+    def test_rebuild_command(self):
+        if search.is_postgres():
+            Book.objects.update(search_vector=None)
+        else:
+            with connection.cursor() as cursor:
+                cursor.execute(f"DELETE FROM {search.FTS_TABLE}")
+        Book.objects.update(fuzzy_key="")
+        self.assertEqual(self.titles("orchard"), [])
+        out = StringIO()
+        call_command("rebuild_search_index", stdout=out)
+        self.assertIn("Reindexed 4 books.", out.getvalue())
+        self.assertEqual(self.titles("orchard"), ["The Orchard", "Seasons", "Apples"])
+        self.assertEqual(Book.objects.get(title="Seasons").fuzzy_key, fuzzy.fold("Seasons Ann Orchard"))
+
+
+    @skipUnless(connection.vendor == "postgresql", "PostgreSQL full-text search")
+    def test_postgres_search_uses_the_gin_index(self):
+        self.assertTrue(all(Book.objects.values_list("search_vector", flat=True)))
+        with connection.cursor() as cursor:
+            cursor.execute("SET enable_seqscan = off")
+            plan = search.search_books(Book.objects.all(), "orchard").explain()
+            cursor.execute("RESET enable_seqscan")
+        self.assertIn(search.GIN_INDEX, plan)
+
+class FuzzySearchTests(TestCase):
+    """Typos, spelling variants and other scripts still find books, through postings every worker shares."""
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create_user("stall", password="pw")
+        for title, author in [
+            ("Godaan", "Premchand"),
+            ("Pathummayude Aadu", "Vaikom Muhammad Basheer"),
+            ("One Hundred Years of Solitude", "Gabriel García Márquez"),
+            ("Malegalalli Madumagalu", "Kuvempu"),
+            ("Pears", "Jo Kim"),
+        ]:
+            Book.objects.create(owner=owner, title=title, author=author)
+
+    def matches(self, query):
+        return [book.title for book in fuzzy.fuzzy_books(Book.objects.all(), query, limit=5)]
+
+    def test_typos_and_transliterations(self):
+        for query, title in [
+            ("premchnd", "Godaan"),
+            ("प्रेमचंद", "Godaan"),
+            ("godan", "Godaan"),
+            ("Bashir", "Pathummayude Aadu"),
+            ("marquez solitud", "One Hundred Years of Solitude"),
+            ("ಕುವೆಂಪು", "Malegalalli Madumagalu"),
+        ]:
+            with self.subTest(query=query):
+                self.assertEqual(self.matches(query)[:1], [title])
+        self.assertEqual(self.matches("xyzzy"), [])
+
+    def test_postings_follow_edits_and_deletes(self):
+        book = Book.objects.get(title="Godaan")
+        book.title, book.author = "Nirmala", "Munshi Premchand"
+        book.save()
+        self.assertEqual(self.matches("nirmla"), ["Nirmala"])
+        self.assertEqual(self.matches("godan"), [])
+        # A write this process's signals never saw (another worker, a bulk import) is found through its rows.
+        fuzzy.index_books(Book.objects.bulk_create([Book(owner=book.owner, title="Kafan", fuzzy_key=fuzzy.fold("Kafan"))]))
+        self.assertEqual(self.matches("kafn"), ["Kafan"])
+        book.delete()
+        self.assertEqual(self.matches("nirmla"), [])
+
+
+    @skipUnless(connection.vendor == "postgresql", "pg_trgm")
+    def test_postgres_matches_through_the_trigram_index(self):
+        self.assertGreater(fuzzy.fuzzy_books(Book.objects.all(), "premchnd", limit=5)[0].similarity, 0)
+        with connection.cursor() as cursor:
+            cursor.execute("SET enable_seqscan = off")
+            plan = Book.objects.filter(fuzzy_key__trigram_word_similar=fuzzy.fold("premchnd")).explain()
+            cursor.execute("RESET enable_seqscan")
+        self.assertIn("book_fuzzy_key_trgm", plan)
+
+class FacetCountTests(TestCase):
+    """Facet counts follow book writes, match a rebuild from scratch and agree with the filters."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user("shop", password="pw")
+        for genre, price in [("fiction", 50), (" Fiction ", 120), ("Fiction", 120), ("History", 600), ("", 0), ("YA", 10)]:
+            Book.objects.create(owner=cls.owner, title=f"{genre or 'No genre'} book", genre=genre, price=Decimal(price))
+
+    def counts(self):
+        return {(row.facet, row.value): row.count for row in FacetCount.objects.filter(count__gt=0)}
+
+    def assertMatchesRebuild(self):
+        stored = self.counts()
+        facets.rebuild()
+        self.assertEqual(stored, self.counts())
+
+    def filtered(self, **params):
+        return facets.apply_filters(Book.objects.all(), params)[0].count()
+
+    def genre_options(self, **params):
+        groups = facets.facet_groups(RequestFactory().get("/purchase/", params), params)
+        return {o["label"]: (o["count"], o["selected"]) for g in groups if g["name"] == "genre" for o in g["options"]}
+
+    def test_counts_and_filters_agree(self):
+        counts = self.counts()
+        self.assertEqual(counts["genre", "fiction"], 3)
+        self.assertNotIn(("genre", ""), counts)
+        for value in ("Fiction", "fiction", " FICTION "):
+            with self.subTest(value=value):
+                self.assertEqual(self.filtered(genre=value), counts["genre", "fiction"])
+        self.assertEqual(self.filtered(price="100-250"), counts["price", "100-250"])
+        self.assertMatchesRebuild()
+
+    def test_genres_shown_as_entered(self):
+        for genre in ("children's", "LGBTQ+ fiction", "McCarthy"):
+            Book.objects.create(owner=self.owner, title="Kept", genre=genre)
+        self.assertEqual(
+            sorted(Book.objects.filter(title="Kept").values_list("genre", flat=True)), ["LGBTQ+ fiction", "McCarthy", "children's"]
+        )
+        # Labelled with the most common spelling.
+        self.assertEqual(self.genre_options(genre="ya"), {
+            "Fiction": (3, False), "History": (1, False), "YA": (1, True), "children's": (1, False),
+            "LGBTQ+ fiction": (1, False), "McCarthy": (1, False),
+        })
+        self.assertMatchesRebuild()
+
+    def test_purchase_counts_leave_out_own_books(self):
+        buyer = User.objects.create_user("buyer", password="pw")
+        Book.objects.create(owner=buyer, title="Mine", genre="fiction", price=Decimal(50))
+        self.client.force_login(buyer)
+        groups = self.client.get(reverse("purchase")).context["facets"]
+        counts = {(g["name"], o["value"]): o["count"] for g in groups for o in g["options"]}
+        self.assertEqual(counts["genre", "fiction"], 3)
+        self.assertEqual(counts["price", "0-100"], 2)
+        self.assertEqual(len(self.client.get(reverse("purchase"), {"genre": "fiction"}).context["books"]), 3)
+
+    def test_counts_after_edits_and_deletes(self):
+        book = Book.objects.get(title="fiction book")
+        book.genre = "history "
+        book.price = Decimal("700")
+        book.condition = "new"
+        book.save()
+        self.assertEqual(Book.objects.get(pk=book.pk).genre, "history ")
+        self.assertEqual((self.counts()["genre", "history"], self.filtered(genre="History")), (2, 2))
+        self.assertMatchesRebuild()
+
+        Book.objects.get(title="History book").delete()
+        Book.objects.get(title="Fiction book").delete()
+        self.assertEqual(self.counts()["genre", "fiction"], self.filtered(genre="Fiction"))
+        self.assertEqual(self.genre_options()["history"], (1, False))
+        self.assertMatchesRebuild()
+
+
+class SettingsTests(TestCase):
+    """Environment-driven settings fail loudly instead of quietly falling back."""
+
+    def test_sqlite_only_stands_in_when_asked(self):
+        engine = "DATABASES['default']['ENGINE']"
+        self.assertEqual(load_settings(engine).stdout.strip(), "django.db.backends.postgresql")
+        self.assertEqual(load_settings(engine, DB_NAME="bookswap").stdout.strip(), "django.db.backends.postgresql")
+        for env in ({"DEBUG": "True"}, {"DB_SQLITE": "True"}):
+            with self.subTest(**env):
+                self.assertEqual(load_settings(engine, **env).stdout.strip(), "django.db.backends.sqlite3")
+
+    def test_pages_cached_only_in_a_shared_cache(self):
+        backend = "CACHES['default']['BACKEND']"
+        self.assertEqual(load_settings(backend).stdout.strip(), "django.core.cache.backends.dummy.DummyCache")
+        self.assertEqual(load_settings(backend, DEBUG="True").stdout.strip(), "django.core.cache.backends.locmem.LocMemCache")
+        self.assertIn("FileBasedCache", load_settings(backend, CACHE_DIR=tempfile.gettempdir()).stdout)
+        self.assertIn("RedisCache", load_settings(backend, REDIS_URL="redis://cache:6379/0").stdout)
+
+
+class QueryPlanTests(SeededCatalogTestCase):
+    """
+    EXPLAIN every SELECT a view runs against a seeded database and fail if any
+    of them falls back to a sequential scan of one of our tables.
+    """
+
+    # Lookup tables small enough that scanning them is the right plan.
+    SCAN_ALLOWED = {"core_facetcount"}
+
+    def setUp(self):
+        super().setUp()
+        if connection.vendor == "postgresql":
+            # Seeded tables are tiny; make the planner show whether an index path exists at all.
+            with connection.cursor() as cursor:
+                cursor.execute("SET enable_seqscan = off")
+
+    def tearDown(self):
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("RESET enable_seqscan")
+
+    def sequential_scans(self, sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                cursor.execute("EXPLAIN " + sql)
+                lines = [row[0] for row in cursor.fetchall()]
+                return [
+                    line for line in lines
+                    if "Seq Scan on " in line and line.split("Seq Scan on ")[1].split()[0] not in self.SCAN_ALLOWED
+                ]
+            cursor.execute("EXPLAIN QUERY PLAN " + sql)
+            details = [row[-1] for row in cursor.fetchall()]
+        return [
+            detail for detail in details
+            if detail.startswith("SCAN ")
+            and "USING INDEX" not in detail
+            and "USING COVERING INDEX" not in detail
+            and "VIRTUAL TABLE" not in detail
+            and "CONSTANT ROW" not in detail
+            and detail.split()[1] not in self.SCAN_ALLOWED
+        ]
+
+    def assertNoSequentialScans(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        offenders = []
+        for query in ctx.captured_queries:
+            sql = query["sql"]
+            if sql.lstrip().upper().startswith("SELECT"):
+                offenders += [f"{line}\n    in: {sql}" for line in self.sequential_scans(sql)]
+        self.assertFalse(offenders, f"{url} runs sequential scans:\n" + "\n".join(offenders))
+
+    def test_home(self):
+        self.assertNoSequentialScans(reverse("home"))
+
+    def test_purchase_fuzzy_fallback(self):
+        self.assertNoSequentialScans(reverse("purchase") + "?q=bokk")
+
+    def test_book_list(self):
+        self.assertNoSequentialScans(reverse("book_list"))
+
+    def test_book_list_nearby(self):
+        self.assertNoSequentialScans(reverse("book_list") + "?within=20")
+
+    def test_book_details(self):
+        self.assertNoSequentialScans(reverse("book_details", args=[self.book.id]))
+
+    def test_purchase(self):
+        self.assertNoSequentialScans(reverse("purchase"))
+
+    def test_purchase_search(self):
+        self.assertNoSequentialScans(reverse("purchase") + "?q=book")
+
+    def test_swap(self):
+        self.assertNoSequentialScans(reverse("swap"))
+
+    def test_swap_nearby(self):
+        self.assertNoSequentialScans(reverse("swap") + "?within=100")
+
+    def test_swap_request_view(self):
+        self.assertNoSequentialScans(reverse("swap_request"))
+
+    def test_swap_requests_received(self):
+        self.assertNoSequentialScans(reverse("swap_requests_received"))
+
+    def test_swap_cycles(self):
+        self.assertNoSequentialScans(reverse("swap_cycles"))
+
+    def test_my_books(self):
+        self.assertNoSequentialScans(reverse("my_books"))
+
+    def test_dashboard(self):
+        self.assertNoSequentialScans(reverse("dashboard"))
+
+    def test_purchases(self):
+        self.assertNoSequentialScans(reverse("purchases"))
+
+    def test_sales(self):
+        self.assertNoSequentialScans(reverse("sales"))
+
+    def test_seller_payments(self):
+        self.assertNoSequentialScans(reverse("seller_payments"))
+
+    def test_api_books(self):
+        self.assertNoSequentialScans(reverse("api_books"))
+
+    def test_api_book_reviews(self):
+        self.assertNoSequentialScans(reverse("api_book_reviews", args=[self.book.id]))
+
+    def test_api_changes(self):
+        # Polling from a cursor; a first read from the start walks the primary key by design.
+        cursor = encode_cursor(BookChange.objects.order_by("id")[50].id, timezone.now())
+        self.assertNoSequentialScans(reverse("api_changes") + f"?after={cursor}")
+
+
+    @skipUnless(connection.vendor == "postgresql", "PostgreSQL schema")
+    def test_postgres_has_every_declared_index(self):
+        with connection.cursor() as cursor:
+            for model in apps.get_app_config("core").get_models():
+                existing = connection.introspection.get_constraints(cursor, model._meta.db_table)
+                for index in model._meta.indexes:
+                    with self.subTest(index=index.name):
+                        self.assertIn(index.name, existing)
+                        self.assertEqual(existing[index.name]["type"], "gin" if isinstance(index, GinIndex) else "btree")
+
+class QueryBudgetTests(QueryBudgetTestMixin, SeededCatalogTestCase):
+    """Each view stays within its QUERY_BUDGETS entry no matter how many rows it lists."""
+
+    def test_normalize_collapses_literals_and_in_lists(self):
+        self.assertEqual(
+            normalize("SELECT * FROM core_book WHERE id IN (%s, %s, %s) AND title = 'x'"),
+            normalize("SELECT * FROM core_book WHERE id IN (%s) AND title = 'yy'"),
+        )
+
+    def test_home(self):
+        self.assertWithinQueryBudget("home")
+
+    def test_book_list(self):
+        self.assertWithinQueryBudget("book_list")
+        self.assertWithinQueryBudget("book_list", query_string="?within=20")
+
+    def test_book_details(self):
+        self.assertWithinQueryBudget("book_details", self.book.id)
+
+    def test_purchase(self):
+        self.assertWithinQueryBudget("purchase")
+        self.assertWithinQueryBudget("purchase", query_string="?q=book")
+
+    def test_swap(self):
+        self.assertWithinQueryBudget("swap")
+        self.assertWithinQueryBudget("swap", query_string="?within=100")
+
+    def test_swap_request_view(self):
+        self.assertWithinQueryBudget("swap_request")
+
+    def test_swap_requests_sent(self):
+        self.assertWithinQueryBudget("swap_requests_sent")
+
+    def test_swap_requests_received(self):
+        self.assertWithinQueryBudget("swap_requests_received")
+
+    def test_swap_cycles(self):
+        self.assertWithinQueryBudget("swap_cycles")
+
+    def test_my_books(self):
+        self.assertWithinQueryBudget("my_books")
+
+    def test_dashboard(self):
+        self.assertWithinQueryBudget("dashboard")
+
+    def test_purchases(self):
+        self.assertWithinQueryBudget("purchases")
+
+    def test_sales(self):
+        self.assertWithinQueryBudget("sales")
+
+    def test_seller_payments(self):
+        self.assertWithinQueryBudget("seller_payments")
+
+    def test_review(self):
+        self.assertWithinQueryBudget("review")
+
+    def test_api(self):
+        self.assertWithinQueryBudget("api_books")
+        self.assertWithinQueryBudget("api_books", query_string="?fields=id,title,owner&genre=Fiction")
+        self.assertWithinQueryBudget("api_book", self.book.id)
+        self.assertWithinQueryBudget("api_book_reviews", self.book.id)
+        self.assertWithinQueryBudget("api_user", "seller1")
+        self.assertWithinQueryBudget("api_changes")
+
+
+class PageCacheTests(SeededCatalogTestCase):
+    """Anonymous home and book pages come from the cache until a Book or Review changes."""
+
+    def setUp(self):
+        super().setUp()
+        self.client.logout()
+
+    def assertServedFromCache(self, url):
+        self.client.get(url)
+        with inspect_queries() as report:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(report.count, 0, report.summary())
+        return response
+
+    def test_home_is_cached_until_a_book_changes(self):
+        self.assertServedFromCache(reverse("home"))
+        with self.captureOnCommitCallbacks(execute=True):
+            Book.objects.create(owner=self.reader, title="Fresh Arrival", author="New Author")
+        self.assertContains(self.client.get(reverse("home")), "Fresh Arrival")
+
+    def test_book_details_is_cached_until_a_review_changes(self):
+        url = reverse("book_details", args=[self.book.id])
+        self.assertServedFromCache(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(book=self.book, reviewer=self.reader, rating=5, comment="Loved every page")
+        self.assertContains(self.client.get(url), "Loved every page")
+
+    def test_review_post_on_async_view(self):
+        self.client.force_login(self.reader)
+        url = reverse("book_details", args=[self.book.id])
+        response = self.client.post(url, {"review_submit": "1", "rating": 4, "comment": "Async review"})
+        self.assertRedirects(response, url, fetch_redirect_response=False)
+        self.assertTrue(Review.objects.filter(book=self.book, comment="Async review").exists())
+
+    def test_logged_in_users_get_a_fresh_page(self):
+        url = reverse("book_details", args=[self.book.id])
+        self.assertServedFromCache(url)
+        self.client.force_login(self.reader)
+        self.assertContains(self.client.get(url), "Submit Review")
+
+
+class TemplateLayoutTests(SeededCatalogTestCase):
+    """Pages share core/base.html and take their styles from the static bundle."""
+
+    pages = ["home", "book_list", "login", "dashboard", "my_books", "purchase", "swap", "sales", "settings", "seller_payments"]
+
+    def test_pages_link_the_bundle_instead_of_inline_styles(self):
+        for name in self.pages:
+            with self.subTest(name):
+                response = self.client.get(reverse(name))
+                self.assertContains(response, "css/bookswap.css")
+                self.assertContains(response, f'class="page-{name.replace("_", "-")}')
+                self.assertNotContains(response, "<style")
+
+    def test_templates_have_no_inline_styles_or_scripts(self):
+        directory = os.path.join(settings.BASE_DIR, "core", "templates", "core")
+        for name in os.listdir(directory):
+            with open(os.path.join(directory, name), encoding="utf-8") as fh:
+                source = fh.read()
+            self.assertNotIn("<style", source, name)
+            self.assertNotIn("<script>", source, name)
+
+    def test_dashboard_pages_share_the_sidebar(self):
+        response = self.client.get(reverse("sales"))
+        self.assertTemplateUsed(response, "core/base_sidebar.html")
+        self.assertContains(response, 'class="sidebar"', count=1)
+        self.assertContains(response, reverse("swap_cycles"))
+
+    def test_production_uses_the_cached_loader(self):
+        loaders = settings.TEMPLATES[0]["OPTIONS"]["loaders"]
+        if settings.DEBUG:
+            self.assertEqual(loaders, settings.TEMPLATE_LOADERS)
+        else:
+            self.assertEqual(loaders, [("django.template.loaders.cached.Loader", settings.TEMPLATE_LOADERS)])
+
+
+class RatingAggregateTests(TestCase):
+    """Book rating aggregates move with every review write and reconcile repairs any drift."""
+
+    def setUp(self):
+        owner = User.objects.create_user("author", password="pw")
+        self.readers = [User.objects.create_user(f"critic{i}", password="pw") for i in range(3)]
+        self.book = Book.objects.create(owner=owner, title="Rated")
+        self.other = Book.objects.create(owner=owner, title="Also rated")
+
+    def aggregates(self, book):
+        book = Book.objects.get(pk=book.pk)
+        return book.review_count, book.rating_sum, book.rating_avg
+
+    def review(self, reader, rating, book=None):
+        return Review.objects.create(book=book or self.book, reviewer=self.readers[reader], rating=rating, comment="-")
+
+    def test_create_edit_delete(self):
+        first = self.review(0, 5)
+        self.review(1, 2)
+        self.assertEqual(self.aggregates(self.book), (2, 7, 3.5))
+
+        first.rating = 3
+        first.save()
+        self.assertEqual(self.aggregates(self.book), (2, 5, 2.5))
+        # A stale Book instance saved later must not write its old aggregates back.
+        stale = Book.objects.get(pk=self.book.pk)
+        self.review(2, 4)
+        stale.title = "Rated, renamed"
+        stale.save()
+        self.assertEqual(self.aggregates(self.book), (3, 9, 3.0))
+
+        first.book = self.other
+        first.save()
+        self.assertEqual(self.aggregates(self.book), (2, 6, 3.0))
+        self.assertEqual(self.aggregates(self.other), (1, 3, 3.0))
+
+        first.delete()
+        self.assertEqual(self.aggregates(self.other), (0, 0, None))
+        self.assertEqual(ratings.reconcile(dry_run=True), [])
+
+    def test_reconcile_repairs_drift(self):
+        self.review(0, 4)
+        self.review(1, 1, book=self.other)
+        Book.objects.filter(pk=self.book.pk).update(review_count=9, rating_sum=40, rating_avg=4.4)
+        # bulk_create skips the signals, so the aggregates miss this review.
+        Review.objects.filter(book=self.other).delete()
+        Review.objects.bulk_create([Review(book=self.other, reviewer=self.readers[2], rating=2, comment="-")])
+
+        self.assertEqual(ratings.reconcile(dry_run=True), [self.book.pk, self.other.pk])
+        self.assertEqual(self.aggregates(self.book), (9, 40, 4.4))
+        out = StringIO()
+        call_command("reconcile_ratings", stdout=out)
+        self.assertIn("Fixed 2 books.", out.getvalue())
+        self.assertEqual(self.aggregates(self.book), (1, 4, 4.0))
+        self.assertEqual(self.aggregates(self.other), (1, 2, 2.0))
+        self.assertEqual(ratings.reconcile(), [])
+
+
+class DashboardSummaryTests(SeededCatalogTestCase):
+    """Counters follow row changes and always match a recount from the source tables."""
+
+    def assertMatchesSourceTables(self, *users):
+        for user in users:
+            summary = DashboardSummary.objects.get(pk=user.pk)
+            self.assertEqual({name: getattr(summary, name) for name in counters.COUNTERS}, counters.compute(user.pk))
+
+    def test_seeded_counts(self):
+        self.assertMatchesSourceTables(*User.objects.all())
+        self.assertEqual(counters.reconcile(dry_run=True), [])
+
+    def test_state_changes_move_counts(self):
+        seller = User.objects.get(username="seller1")
+        swap = SwapRequest.objects.filter(owner=seller, status="pending").first()
+        swap.status = "accepted"
+        swap.save()
+        payment = Payment.objects.filter(seller=seller.profile, status="Pending").first()
+        payment.status = "Verified"
+        payment.save()
+        Transaction.objects.create(buyer=self.reader, seller=seller, book=self.book, amount=self.book.price)
+        book = Book.objects.filter(owner=seller).first()
+        book.owner = self.reader
+        book.save()
+        Transaction.objects.filter(seller=seller).first().delete()
+        self.assertMatchesSourceTables(seller, self.reader)
+
+    def test_reconcile_fixes_drift(self):
+        seller = User.objects.get(username="seller0")
+        DashboardSummary.objects.filter(pk=self.reader.pk).update(books=999)
+        DashboardSummary.objects.filter(pk=seller.pk).delete()
+        self.assertEqual(sorted(counters.reconcile()), sorted([self.reader.pk, seller.pk]))
+        self.assertMatchesSourceTables(self.reader, seller)
+
+    def test_dashboard_reads_one_summary_row(self):
+        response = self.client.get(reverse("dashboard"))
+        summary = DashboardSummary.objects.get(pk=self.reader.pk)
+        self.assertContains(response, f"{summary.books} books")
+
+
+class ImageVariantTests(TestCase):
+    """Uploads get resized WebP/JPEG derivatives and listing pages serve them through srcset."""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        cache.clear()
+        self.owner = User.objects.create_user("owner", password="pw")
+
+    def upload(self, size=(1200, 1800)):
+        buffer = BytesIO()
+        Image.new("RGB", size, "navy").save(buffer, "JPEG", quality=95)
+        return SimpleUploadedFile("cover.jpg", buffer.getvalue(), content_type="image/jpeg")
+
+    def test_upload_generates_variants(self):
+        book = Book.objects.create(owner=self.owner, title="Covered", cover=self.upload())
+        self.assertEqual(book.cover_variants, {})
+        self.assertEqual(jobs.run_pending(), 1)
+        book.refresh_from_db()
+        self.assertEqual(book.cover_variants["source"], book.cover.name)
+        self.assertEqual(book.cover_variants["widths"], [160, 320, 640])
+        for width in book.cover_variants["widths"]:
+            for fmt in images.FORMATS:
+                name = images.variant_name(book.cover.name, width, fmt)
+                self.assertTrue(book.cover.storage.exists(name), name)
+                self.assertLess(book.cover.storage.size(name), book.cover.size)
+        response = self.client.get(reverse("book_list"))
+        self.assertContains(response, 'type="image/webp"')
+        self.assertContains(response, "320w.webp 320w")
+
+    def test_small_images_are_not_upscaled(self):
+        book = Book.objects.create(owner=self.owner, title="Tiny", cover=self.upload((100, 150)))
+        jobs.run_pending()
+        book.refresh_from_db()
+        self.assertEqual(book.cover_variants["widths"], [100])
+
+    def test_backfill_command(self):
+        book = Book.objects.create(owner=self.owner, title="Old upload", cover=self.upload())
+        Job.objects.all().delete()
+        self.assertNotContains(self.client.get(reverse("book_list")), "srcset")
+        call_command("generate_image_variants", workers=2, stdout=StringIO())
+        book.refresh_from_db()
+        self.assertEqual(book.cover_variants["widths"], [160, 320, 640])
+
+
+
+class BlobStorageTests(TestCase):
+    """Uploads are stored once per content, reference-counted and collected when nothing uses them."""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.owner = User.objects.create_user("owner", password="pw")
+
+    def upload(self, colour="navy", name="cover.jpg"):
+        buffer = BytesIO()
+        Image.new("RGB", (40, 60), colour).save(buffer, "JPEG")
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type="image/jpeg")
+
+    def refs(self, name):
+        return Blob.objects.get(name=name).refs
+
+    def files(self):
+        return sorted(
+            os.path.relpath(os.path.join(root, name), self.media_root)
+            for root, _, names in os.walk(os.path.join(self.media_root, blobs.BLOB_DIR)) for name in names
+        )
+
+    def test_same_content_stored_once(self):
+        first = Book.objects.create(owner=self.owner, title="First", cover=self.upload())
+        second = Book.objects.create(owner=self.owner, title="Second", cover=self.upload(name="scan.JPEG"))
+        self.owner.profile.gpay_qr = self.upload(name="qr.jpg")
+        self.owner.profile.save()
+        self.assertEqual(first.cover.name, second.cover.name)
+        self.assertEqual(self.owner.profile.gpay_qr.name, first.cover.name)
+        self.assertTrue(blobs.is_blob(first.cover.name))
+        self.assertEqual(self.files(), [first.cover.name])
+        self.assertEqual(self.refs(first.cover.name), 3)
+
+    def test_references_follow_rows(self):
+        book = Book.objects.create(owner=self.owner, title="Book", cover=self.upload())
+        old = book.cover.name
+        book.cover = self.upload("red")
+        book.save()
+        self.assertEqual((self.refs(old), self.refs(book.cover.name)), (0, 1))
+        Book.objects.get(pk=book.pk).delete()
+        self.assertEqual(self.refs(book.cover.name), 0)
+        self.assertFalse(blobs.recount(dry_run=True))
+
+    def test_collect_removes_unreferenced_blobs(self):
+        kept = Book.objects.create(owner=self.owner, title="Kept", cover=self.upload())
+        dropped = Book.objects.create(owner=self.owner, title="Dropped", cover=self.upload("red"))
+        jobs.run_pending()
+        dropped.refresh_from_db()
+        derivative = images.variant_name(dropped.cover.name, dropped.cover_variants["widths"][0], "webp")
+        self.assertTrue(blobs.storage.exists(derivative))
+        recent = blobs.storage.save("avatars/new.jpg", self.upload("green"))
+        dropped.delete()
+        old = (timezone.now() - timedelta(days=2)).timestamp()
+        for name in (kept.cover.name, dropped.cover.name):
+            os.utime(blobs.storage.path(name), (old, old))
+
+        call_command("gc_blobs", stdout=StringIO())
+        self.assertEqual(list(Blob.objects.values_list("name", flat=True)), [kept.cover.name])
+        self.assertFalse(blobs.storage.exists(dropped.cover.name))
+        self.assertFalse(blobs.storage.exists(derivative))
+        self.assertTrue(blobs.storage.exists(recent))
+
+    def test_migrate_existing_media(self):
+        legacy = FileSystemStorage(location=self.media_root)
+        data = self.upload().read()
+        names = [legacy.save(f"book_covers/{title}.jpg", ContentFile(data)) for title in ("a", "b")]
+        books = [Book.objects.create(owner=self.owner, title=title) for title in ("a", "b", "gone")]
+        for book, name in zip(books, names + ["book_covers/gone.jpg"]):
+            Book.objects.filter(pk=book.pk).update(cover=name)
+        Job.objects.all().delete()
+
+        call_command("migrate_media_to_blobs", "--delete-originals", stdout=StringIO(), stderr=StringIO())
+        covers = list(Book.objects.filter(pk__in=[b.pk for b in books]).order_by("title").values_list("cover", flat=True))
+        self.assertEqual(covers[0], covers[1])
+        self.assertEqual(covers[2], "book_covers/gone.jpg")
+        self.assertEqual(self.refs(covers[0]), 2)
+        self.assertFalse(any(legacy.exists(name) for name in names))
+        self.assertEqual(Job.objects.filter(task="core.refresh_image_variants").count(), 2)
+
+
+calls = []
+
+
+@jobs.task(name="tests.flaky", max_attempts=2)
+def flaky(fail):
+    calls.append(fail)
+    if fail:
+        raise RuntimeError("boom")
+
+
+class JobQueueTests(SeededCatalogTestCase):
+    """Jobs are claimed once, retried with backoff and give up after max_attempts."""
+
+    def setUp(self):
+        super().setUp()
+        calls.clear()
+
+    def test_success_and_unique_key(self):
+        first = jobs.enqueue(flaky, fail=False, unique_key="once")
+        self.assertEqual(jobs.enqueue(flaky, fail=False, unique_key="once"), first)
+        self.assertEqual(jobs.run_pending(), 1)
+        self.assertEqual(calls, [False])
+        self.assertEqual(Job.objects.get(pk=first.pk).status, "done")
+
+    def test_retry_with_backoff_then_fail(self):
+        job = jobs.enqueue(flaky, fail=True)
+        jobs.run_pending()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ("queued", 1))
+        self.assertIn("boom", job.last_error)
+        self.assertEqual(jobs.run_pending(), 0)  # backing off
+        Job.objects.filter(pk=job.pk).update(run_at=job.created_at)
+        jobs.run_pending()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ("failed", 2))
+
+    def test_periodic_tasks_reschedule(self):
+        jobs.schedule_periodic()
+        jobs.schedule_periodic()
+        self.assertEqual(Job.objects.filter(task="core.prune_jobs", status="queued").count(), 1)
+        jobs.run_pending()
+        upcoming = Job.objects.get(task="core.prune_jobs", status="queued")
+        self.assertGreater(upcoming.run_at, upcoming.created_at)
+
+    def test_failed_periodic_task_reschedules(self):
+        with mock.patch.object(flaky.task, "every", timedelta(hours=1)):
+            job = jobs.enqueue(flaky, fail=True, unique_key="tests.flaky")
+            jobs.run_pending()
+            Job.objects.filter(pk=job.pk).update(run_at=job.created_at)
+            jobs.run_pending()
+        self.assertEqual(Job.objects.get(pk=job.pk).status, "failed")
+        self.assertGreater(Job.objects.get(unique_key="tests.flaky", status="queued").run_at, timezone.now())
+
+    def test_heartbeat_keeps_long_jobs_running(self):
+        jobs.enqueue(flaky, fail=False)
+        job = jobs.claim("host:1:0")
+        Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() - jobs.STALE_AFTER * 2)
+        self.assertEqual(jobs.heartbeat(["host:1:0"]), 1)
+        self.assertEqual(jobs.requeue_stale(), 0)
+
+    def test_requeued_job_finishes_once(self):
+        jobs.enqueue(flaky, fail=False)
+        first = jobs.claim("host:1:0")
+        # That worker stopped sending heartbeats; its job is requeued and claimed again.
+        Job.objects.filter(pk=first.pk).update(locked_at=timezone.now() - jobs.STALE_AFTER * 2)
+        jobs.requeue_stale()
+        second = jobs.claim("host:2:0")
+        self.assertFalse(jobs.execute(first))
+        self.assertEqual(Job.objects.get(pk=first.pk).locked_by, "host:2:0")
+        self.assertTrue(jobs.execute(second))
+        self.assertEqual(Job.objects.get(pk=first.pk).status, "done")
+
+    def test_worker_survives_database_errors(self):
+        worker = jobs.Worker(poll_interval=0.01, burst=True)
+        with mock.patch.object(jobs, "claim", side_effect=[OperationalError("server closed the connection"), None]) as claim, \
+                self.assertLogs("core.jobs", "ERROR"):
+            worker.run()
+        self.assertEqual(claim.call_count, 2)
+
+
+    @skipUnless(connection.vendor == "postgresql", "SELECT ... SKIP LOCKED")
+    def test_postgres_claims_skip_locked_jobs(self):
+        jobs.enqueue(flaky, fail=False)
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertIsNotNone(jobs.claim("host:1:0"))
+        self.assertTrue(any("FOR UPDATE SKIP LOCKED" in query["sql"] for query in ctx.captured_queries))
+
+class ExportTests(SeededCatalogTestCase):
+    """Sales and purchase history streams as CSV or NDJSON, optionally limited to a date range."""
+
+    def read(self, response):
+        self.assertTrue(response.streaming)
+        return b"".join(response.streaming_content).decode()
+
+    def test_purchases_csv(self):
+        response = self.client.get(reverse("export_purchases"))
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        lines = self.read(response).splitlines()
+        self.assertEqual(lines[0], "id,created_at,status,book,seller,amount,payment_method,transaction_id")
+        self.assertEqual(len(lines) - 1, Payment.objects.filter(buyer=self.reader).count())
+
+    def test_sales_ndjson_from_transactions(self):
+        seller = User.objects.get(username="seller1")
+        self.client.force_login(seller)
+        body = self.read(self.client.get(reverse("export_sales"), {"format": "ndjson", "source": "transactions"}))
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual(len(rows), Transaction.objects.filter(seller=seller).count())
+        self.assertEqual(rows[0]["buyer"], "reader")
+
+    def test_date_range(self):
+        old = Payment.objects.filter(buyer=self.reader).first()
+        Payment.objects.filter(pk=old.pk).update(created_at=old.created_at - timedelta(days=30))
+        day = timezone.localdate(old.created_at - timedelta(days=30)).isoformat()
+        body = self.read(self.client.get(reverse("export_purchases"), {"start": day, "end": day}))
+        self.assertEqual(len(body.splitlines()), 2)
+        self.assertIn(f"\n{old.pk},", body)
+
+    def test_bad_parameters(self):
+        self.assertEqual(self.client.get(reverse("export_sales"), {"start": "yesterday"}).status_code, 400)
+        self.assertEqual(self.client.get(reverse("export_sales"), {"format": "xml"}).status_code, 400)
+
+
+
+class ImportTests(TestCase):
+    """CSV/NDJSON imports create books in bulk, keep the derived tables in step and report bad rows."""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=os.path.join(self.media_root, "media"))
+        override.enable()
+        self.addCleanup(override.disable)
+        cache.clear()
+        self.seller = User.objects.create_user("store", password="pw")
+
+    def cover(self):
+        buffer = BytesIO()
+        Image.new("RGB", (800, 1200), "teal").save(buffer, "JPEG")
+        return buffer.getvalue()
+
+    def assert_derived_tables_match(self):
+        self.assertEqual(counters.reconcile(dry_run=True), [])
+        stored = {(row.facet, row.value): row.count for row in FacetCount.objects.filter(count__gt=0)}
+        facets.rebuild()
+        self.assertEqual(stored, {(row.facet, row.value): row.count for row in FacetCount.objects.all()})
+
+    def test_command_imports_csv_with_covers(self):
+        covers = os.path.join(self.media_root, "covers")
+        os.makedirs(covers)
+        with open(os.path.join(covers, "dune.jpg"), "wb") as fh:
+            fh.write(self.cover())
+        path = os.path.join(self.media_root, "books.csv")
+        with open(path, "w", newline="") as fh:
+            fh.write(
+                "Title,author,genre,condition,availability,price,cover\n"
+                "Dune,Frank Herbert,Sci-Fi,new,sell,350,dune.jpg\n"
+                ",Nobody,,used,swap,0,\n"
+                "Emma,Jane Austen,Classics,mint,swap,0,\n"
+                "Kim,Rudyard Kipling,Classics,used,both,abc,\n"
+                "Ulysses,James Joyce,Classics,used,swap,,missing.jpg\n"
+                + "".join(f"Stock {i},Author {i % 7},Classics,used,both,{i},\n" for i in range(25))
+            )
+        err = StringIO()
+        call_command("import_books", path, owner="store", covers_dir=covers, workers=2, batch_size=10, stdout=StringIO(), stderr=err)
+
+        self.assertEqual(Book.objects.filter(owner=self.seller).count(), 26)
+        self.assertEqual([line.split(":")[0] for line in err.getvalue().splitlines()], ["line 3", "line 4", "line 5", "line 6"])
+        self.assertIn("title", err.getvalue())
+        self.assertIn("missing.jpg", err.getvalue())
+        dune = Book.objects.get(title="Dune")
+        self.assertEqual(dune.cover_variants["widths"], [160, 320, 640])
+        self.assertTrue(dune.cover.storage.exists(dune.cover.name))
+        self.assertEqual(dune.fuzzy_key, fuzzy.fold("Dune Frank Herbert"))
+        self.assertFalse(Job.objects.exists())
+        self.assertEqual(DashboardSummary.objects.get(pk=self.seller.pk).books, 26)
+        self.assertEqual(list(search.search_books(Book.objects.all(), "herbert").values_list("title", flat=True)), ["Dune"])
+        self.assert_derived_tables_match()
+
+    def test_dry_run_writes_nothing(self):
+        path = os.path.join(self.media_root, "books.ndjson")
+        with open(path, "w") as fh:
+            fh.write('{"title": "Dune"}\n{"author": "Nobody"}\nnot json\n')
+        out = StringIO()
+        call_command("import_books", path, owner="store", dry_run=True, stdout=out, stderr=StringIO())
+        self.assertIn("1 valid rows, 2 errors", out.getvalue())
+        self.assertFalse(Book.objects.exists())
+
+    def upload(self, rows, covers=None):
+        files = {"file": SimpleUploadedFile("books.ndjson", "\n".join(json.dumps(r) for r in rows).encode())}
+        if covers is not None:
+            files["covers"] = SimpleUploadedFile("covers.zip", covers)
+        return self.client.post(reverse("import_books"), files)
+
+    def test_upload_ndjson_with_cover_archive(self):
+        archive = BytesIO()
+        with zipfile.ZipFile(archive, "w") as zf:
+            zf.writestr("covers/emma.jpg", self.cover())
+        rows = [
+            {"title": "Emma", "author": "Jane Austen", "genre": "Classics", "price": 120, "cover": "covers/emma.jpg"},
+            {"title": "Persuasion", "author": "Jane Austen", "availability": "nowhere"},
+            {"title": "Mansfield Park", "author": "Jane Austen"},
+        ]
+        self.client.force_login(self.seller)
+        response = self.upload(rows, archive.getvalue())
+        upload = CatalogImport.objects.get()
+        self.assertRedirects(response, reverse("import_status", args=[upload.id]), fetch_redirect_response=False)
+        self.assertContains(self.client.get(response.url), "Importing…")
+        # The import, then the cover derivatives it leaves to the job queue.
+        self.assertEqual(jobs.run_pending(), 2)
+        status = self.client.get(response.url)
+        self.assertContains(status, "Imported 2 books (1 with covers)")
+        self.assertEqual(status.context["catalog_import"].errors[0][0], 2)
+        self.assertEqual(CatalogImport.objects.filter(file="", covers="", status="done").count(), 1)
+        emma = Book.objects.get(title="Emma")
+        self.assertTrue(blobs.is_blob(emma.cover.name))
+        self.assertEqual(Blob.objects.get(name=emma.cover.name).refs, 1)
+        self.assertEqual(emma.cover_variants["widths"], [160, 320, 640])
+        self.assert_derived_tables_match()
+
+    def test_upload_rejects_oversized_covers(self):
+        archive = BytesIO()
+        with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr("covers/emma.jpg", self.cover())
+            zf.writestr("covers/bomb.jpg", bytes(imports.MAX_COVER_BYTES + 1))  # a few KB once deflated
+        rows = [{"title": "Emma", "cover": "covers/emma.jpg"}, {"title": "Persuasion", "cover": "covers/bomb.jpg"}]
+        self.client.force_login(self.seller)
+
+        status = self.client.get(self.upload(rows, archive.getvalue()).url)
+        jobs.run_pending()
+        status = self.client.get(status.wsgi_request.path)
+        self.assertContains(status, "Imported 1 book (1 with covers)")
+        self.assertEqual(status.context["catalog_import"].errors, [[2, "cover 'covers/bomb.jpg' is larger than 10 MB."]])
+        with mock.patch.object(imports, "MAX_ARCHIVE_BYTES", imports.MAX_COVER_BYTES):
+            response = self.upload(rows, archive.getvalue())
+        self.assertContains(response, "uncompressed", status_code=400)
+        self.assertEqual(list(Book.objects.values_list("title", flat=True)), ["Emma"])
+
+    def test_upload_resumes_after_a_failed_attempt(self):
+        self.client.force_login(self.seller)
+        self.upload([{"title": f"Stock {i}"} for i in range(25)] + [{"author": "No title"}])
+        index_books, batches = search.index_books, []
+
+        def second_batch_fails(books):
+            batches.append(books)
+            if len(batches) == 2:
+                raise RuntimeError("worker died")
+            index_books(books)
+
+        with mock.patch.object(imports, "BATCH_SIZE", 10), mock.patch.object(imports.search, "index_books", second_batch_fails):
+            jobs.run_pending()
+            upload = CatalogImport.objects.get()
+            self.assertEqual((upload.status, upload.processed, upload.created), ("running", 10, 10))
+            Job.objects.filter(task="core.import_catalog").update(run_at=timezone.now())
+            jobs.run_pending()
+        upload.refresh_from_db()
+        self.assertEqual((upload.status, upload.created, upload.error_count), ("done", 25, 1))
+        self.assertEqual(Book.objects.filter(owner=self.seller).count(), 25)
+        self.assert_derived_tables_match()
+
+    def test_batch_the_database_refuses_becomes_row_errors(self):
+        text = StringIO("title\n" + "".join(f"Stock {i}\n" for i in range(6)))
+        with mock.patch.object(imports.counters, "rows_added", side_effect=[None, IntegrityError("duplicate key"), None]):
+            result = imports.import_books(self.seller, text, "csv", batch_size=2)
+        self.assertEqual(result.created, 4)
+        self.assertEqual(result.errors, [(4, "could not be saved: duplicate key"), (5, "could not be saved: duplicate key")])
+        self.assertEqual(sorted(Book.objects.values_list("title", flat=True)), ["Stock 0", "Stock 1", "Stock 4", "Stock 5"])
+
+    def test_upload_rejects_unknown_format(self):
+        self.client.force_login(self.seller)
+        response = self.client.post(reverse("import_books"), {"file": SimpleUploadedFile("books.xlsx", b"PK")})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Book.objects.exists())
+
+
+class ApiTests(SeededCatalogTestCase):
+    """The JSON API pages with cursors, trims fields on request and answers revalidation with 304."""
+
+    def test_book_list_pages_and_selects_fields(self):
+        response = self.client.get(reverse("api_books"), {"fields": "id,title,price,owner", "per_page": 50})
+        self.assertEqual(response["Content-Type"], "application/json")
+        body = response.json()
+        self.assertEqual(len(body["results"]), 50)
+        self.assertEqual(set(body["results"][0]), {"id", "title", "price", "owner"})
+        self.assertIsNone(body["previous"])
+        seen = [row["id"] for row in body["results"]]
+        while body["next"]:
+            body = self.client.get(body["next"]).json()
+            seen += [row["id"] for row in body["results"]]
+        self.assertEqual(sorted(seen), sorted(Book.objects.values_list("id", flat=True)))
+        self.assertEqual(self.client.get(reverse("api_books"), {"fields": "title,secret"}).status_code, 400)
+
+    def test_book_detail_conditional_get(self):
+        url = reverse("api_book", args=[self.book.id])
+        response = self.client.get(url)
+        self.assertEqual(response.json()["rating"], round(Book.objects.get(pk=self.book.pk).rating_avg, 2))
+        etag, last_modified = response["ETag"], response["Last-Modified"]
+        self.assertFalse(etag.startswith("W/"))
+
+        with inspect_queries() as report:
+            not_modified = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.content, b"")
+        self.assertEqual(not_modified["ETag"], etag)
+        self.assertEqual(report.count, 1)
+        self.assertEqual(self.client.get(url, headers={"If-Modified-Since": last_modified}).status_code, 304)
+        # The same book with other fields is another representation.
+        self.assertNotEqual(self.client.get(url, {"fields": "id"})["ETag"], etag)
+
+        Review.objects.create(book=self.book, reviewer=self.reader, rating=5, comment="Again")
+        changed = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed["ETag"], etag)
+
+    def test_list_etag_changes_with_an_edit(self):
+        url = reverse("api_books")
+        etag = self.client.get(url)["ETag"]
+        self.assertEqual(self.client.get(url, headers={"If-None-Match": etag}).status_code, 304)
+        newest = Book.objects.order_by("-created_at", "-id").first()
+        newest.title = "Renamed"
+        newest.save(update_fields=["title"])
+        self.assertEqual(self.client.get(url, headers={"If-None-Match": etag}).status_code, 200)
+
+    def test_reviews_and_profiles(self):
+        reviews = self.client.get(reverse("api_book_reviews", args=[self.book.id]), {"fields": "rating,reviewer"}).json()
+        self.assertEqual(len(reviews["results"]), 24)
+        self.assertEqual(set(reviews["results"][0]), {"rating", "reviewer"})
+        response = self.client.get(reverse("api_user", args=["seller1"]))
+        profile = response.json()
+        self.assertEqual(profile["books"], Book.objects.filter(owner__username="seller1").count())
+        self.assertNotIn("gpay_number", profile)
+        self.assertEqual(self.client.get(response.request["PATH_INFO"], headers={"If-None-Match": response["ETag"]}).status_code, 304)
+        self.assertEqual(self.client.get(reverse("api_user", args=["nobody"])).status_code, 404)
+        self.assertEqual(self.client.get(reverse("api_book_reviews", args=[0])).status_code, 404)
+
+
+class ChangeFeedTests(SeededCatalogTestCase):
+    """Book writes land in the change log, the feed replays them from a cursor and compaction keeps it small."""
+
+    def settle(self, age=timedelta(seconds=10)):
+        BookChange.objects.update(created_at=F("created_at") - age)
+
+    def read_feed(self, url=None, **params):
+        response = self.client.get(url or reverse("api_changes"), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def replay(self, url=None):
+        """Follow the feed to its end and return (mirror of book id -> title, last response)."""
+        mirror = {}
+        body = {"next": url or reverse("api_changes") + "?fields=id,title&limit=70", "has_more": True}
+        while body["has_more"]:
+            body = self.read_feed(body["next"])
+            for entry in body["changes"]:
+                if entry["action"] == "deleted":
+                    mirror.pop(entry["book_id"], None)
+                elif entry["book"]:
+                    mirror[entry["book_id"]] = entry["book"]["title"]
+        return mirror, body
+
+    def test_writes_are_logged(self):
+        BookChange.objects.all().delete()
+        book = Book.objects.create(owner=self.reader, title="Logged", author="A")
+        book.price = Decimal("99")
+        book.save()
+        book.availability = "sell"
+        book.save()
+        book.save()  # nothing changed
+        Review.objects.create(book=book, reviewer=self.reader, rating=4, comment="Fine")
+        pk = book.pk
+        Book.objects.get(pk=pk).delete()
+        log = list(BookChange.objects.order_by("id").values_list("book_id", "action", "fields"))
+        self.assertEqual(log[:4], [
+            (pk, "created", []),
+            (pk, "updated", ["price"]),
+            (pk, "availability", ["availability"]),
+            (pk, "updated", ["rating"]),
+        ])
+        # Deleting the book cascades to its review first, which logs one more rating update.
+        self.assertEqual(log[-1], (pk, "deleted", []))
+
+    def test_incremental_sync(self):
+        mirror, body = self.replay()
+        self.assertEqual(mirror, dict(Book.objects.values_list("id", "title")))
+
+        renamed = Book.objects.order_by("id")[3]
+        renamed.title = "Renamed"
+        renamed.save()
+        gone = Book.objects.order_by("id")[4].pk
+        Book.objects.filter(pk=gone).delete()
+        added = Book.objects.create(owner=self.reader, title="Brand new")
+        delta = self.read_feed(body["next"])
+        self.assertEqual(
+            [(entry["book_id"], entry["action"]) for entry in delta["changes"]],
+            [(renamed.pk, "updated"), (gone, "deleted"), (added.pk, "created")],
+        )
+        self.assertEqual(delta["changes"][0]["book"]["title"], "Renamed")
+        self.assertIsNone(delta["changes"][1]["book"])
+
+    def test_feed_follows_commit_order(self):
+        BookChange.objects.all().delete()
+        slow, quick = Book.objects.order_by("id")[:2]
+        changes.record(slow.pk, "updated", ["title"])
+        changes.record(quick.pk, "updated", ["title"])
+        # The first entry's transaction committed after the second's; its lower id must not be skipped.
+        BookChange.objects.filter(book_id=slow.pk).update(txid=20)
+        BookChange.objects.filter(book_id=quick.pk).update(txid=10)
+        first = self.read_feed(limit=1)
+        second = self.read_feed(first["next"])
+        self.assertEqual([entry["book_id"] for entry in first["changes"] + second["changes"]], [quick.pk, slow.pk])
+        self.assertEqual(self.read_feed(second["next"])["changes"], [])
+
+    def test_compaction_keeps_a_replayable_log(self):
+        for i, book in enumerate(Book.objects.order_by("id")[:20]):
+            book.title = f"Edition {i}"
+            book.save()
+        doomed = Book.objects.order_by("id").last().pk
+        Book.objects.filter(pk=doomed).delete()
+        self.settle(changes.COMPACT_AFTER + timedelta(days=1))
+        before = BookChange.objects.count()
+        out = StringIO()
+        call_command("compact_book_changes", stdout=out)
+        self.assertEqual(BookChange.objects.count(), Book.objects.count() + 1)
+        self.assertIn(f"Removed {before - BookChange.objects.count()} ", out.getvalue())
+        mirror, _ = self.replay()
+        self.assertEqual(mirror, dict(Book.objects.values_list("id", "title")))
+
+        self.settle(changes.TOMBSTONE_RETENTION)
+        changes.compact()
+        self.assertFalse(BookChange.objects.filter(book_id=doomed).exists())
+
+    def test_stale_and_bad_cursors(self):
+        stale = encode_cursor(0, 1, timezone.now() - changes.TOMBSTONE_RETENTION - timedelta(days=1))
+        self.assertEqual(self.client.get(reverse("api_changes"), {"after": stale}).status_code, 410)
+        # Cursors from before entries recorded their transaction still resume.
+        first = BookChange.objects.order_by("id").first()
+        legacy = self.read_feed(after=encode_cursor(first.id, timezone.now()), limit=1)
+        self.assertGreater(legacy["changes"][0]["id"], first.id)
+        self.assertEqual(self.client.get(reverse("api_changes"), {"after": "garbage"}).status_code, 400)
+
+
+    @skipUnless(connection.vendor == "postgresql", "PostgreSQL transaction ids")
+    def test_postgres_entries_carry_their_transaction(self):
+        BookChange.objects.all().delete()
+        with transaction.atomic():
+            added = [Book.objects.create(owner=self.reader, title=title) for title in ("One", "Two")]
+        txids = set(BookChange.objects.values_list("txid", flat=True))
+        self.assertEqual(len(txids), 1)
+        self.assertGreater(txids.pop(), 0)
+        self.assertEqual([entry["book_id"] for entry in self.read_feed()["changes"]], [book.pk for book in added])
+
+class SessionModeTests(TestCase):
+    """Every session mode keeps users signed in across a switch from database sessions and skips django_session reads."""
+
+    def setUp(self):
+        caches["sessions"].clear()
+        self.user = User.objects.create_user("member", password="pw")
+
+    def database_login(self):
+        with override_settings(SESSION_ENGINE=settings.SESSION_ENGINES["db"]):
+            self.client.force_login(self.user)
+        return self.client.cookies[settings.SESSION_COOKIE_NAME].value
+
+    def session_queries(self, path):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return sum(1 for query in ctx.captured_queries if "django_session" in query["sql"])
+
+    def test_switching_modes_keeps_users_signed_in(self):
+        for mode in ("cached_db", "cache", "signed_cookies"):
+            with self.subTest(mode=mode), override_settings(SESSION_ENGINE=settings.SESSION_ENGINES[mode]):
+                self.client = self.client_class()
+                key = self.database_login()
+                self.assertEqual(self.client.get(reverse("dashboard")).status_code, 200)
+                self.assertEqual(self.session_queries(reverse("my_books")), 0)
+                if mode != "cached_db":
+                    # Adopted: the row is gone, so a later logout can't be undone by it.
+                    self.assertFalse(Session.objects.filter(session_key=key).exists())
+
+    def test_logout_ends_an_adopted_cache_session(self):
+        with override_settings(SESSION_ENGINE=settings.SESSION_ENGINES["cache"]):
+            key = self.database_login()
+            self.client.get(reverse("dashboard"))
+            self.client.get(reverse("logout"))
+            self.client.cookies[settings.SESSION_COOKIE_NAME] = key
+            self.assertRedirects(self.client.get(reverse("dashboard")), f"{settings.LOGIN_URL}?next={reverse('dashboard')}", fetch_redirect_response=False)
+
+    def test_async_views_adopt_sessions(self):
+        with override_settings(SESSION_ENGINE=settings.SESSION_ENGINES["signed_cookies"]):
+            key = self.database_login()
+            self.assertContains(self.client.get(reverse("home")), reverse("logout"))
+            self.assertNotEqual(self.client.cookies[settings.SESSION_COOKIE_NAME].value, key)
+
+    def test_cache_modes_need_a_shared_cache(self):
+        self.assertEqual(load_settings("SESSION_ENGINE").stdout.strip(), "django.contrib.sessions.backends.db")
+        for mode in ("cache", "cached_db"):
+            with self.subTest(mode=mode):
+                self.assertIn("ImproperlyConfigured", load_settings("SESSION_ENGINE", SESSION_MODE=mode).stderr)
+                self.assertEqual(load_settings("SESSION_ENGINE", SESSION_MODE=mode, CACHE_DIR=tempfile.gettempdir()).returncode, 0)
+                self.assertEqual(load_settings("SESSION_ENGINE", SESSION_MODE=mode, REDIS_URL="redis://cache:6379/0").returncode, 0)
+
+    def test_file_session_cache_keeps_many_sessions(self):
+        sessions = load_settings("CACHES['sessions']", CACHE_DIR=tempfile.gettempdir()).stdout
+        self.assertIn("'MAX_ENTRIES': 100000", sessions)
+        self.assertIn("RedisCache", load_settings("CACHES['sessions']", REDIS_URL="redis://cache:6379/0").stdout)
+
+
+class RecommendationTests(TestCase):
+    """Co-occurrence neighbours per book and per reader, rebuilt in full or refreshed per interaction."""
+
+    def setUp(self):
+        cache.clear()
+        self.shop = User.objects.create_user("shop", password="pw")
+        self.books = [Book.objects.create(owner=self.shop, title=f"Novel {i}") for i in range(6)]
+        self.readers = [User.objects.create_user(f"reader{i}", password="pw") for i in range(4)]
+        a, b, c, _ = self.readers
+        self.interact(a, 0, 1)
+        self.interact(b, 0, 1, 2)
+        self.interact(c, 2, 3)
+
+    def interact(self, reader, *indexes):
+        for i in indexes:
+            book = self.books[i]
+            if i % 3 == 0:
+                SwapRequest.objects.create(requester=reader, owner=book.owner, requested_book=book)
+            elif i % 3 == 1:
+                Payment.objects.create(buyer=reader, seller=book.owner.profile, book=book, amount=book.price)
+            else:
+                Review.objects.create(book=book, reviewer=reader, rating=4, comment="good")
+
+    def neighbours(self, index):
+        return list(BookNeighbour.objects.filter(book=self.books[index]).order_by("rank").values_list("neighbour_id", flat=True))
+
+    def stored(self):
+        return (
+            sorted(BookNeighbour.objects.values_list("book_id", "neighbour_id", "rank")),
+            sorted(ReaderRecommendation.objects.values_list("user_id", "book_id", "rank")),
+        )
+
+    def test_rebuild_ranks_by_cosine_similarity(self):
+        recommendations.rebuild()
+        ids = [book.id for book in self.books]
+        # Novel 0 and Novel 1 share both their readers; Novel 2 shares one of three.
+        self.assertEqual(self.neighbours(0), [ids[1], ids[2]])
+        self.assertEqual(self.neighbours(2), [ids[3], ids[1], ids[0]])  # ties go to the newer book
+        a = self.readers[0]
+        self.assertEqual(list(ReaderRecommendation.objects.filter(user=a).values_list("book_id", flat=True)), [ids[2]])
+        self.assertEqual([book.id for book in recommendations.for_reader(a)], [ids[2]])
+        self.assertEqual([book.id for book in recommendations.for_book(ids[0], self.shop)], [])
+
+    def test_refresh_matches_a_full_rebuild(self):
+        recommendations.rebuild()
+        Job.objects.all().delete()
+        self.interact(self.readers[3], 1, 3, 4)
+        Review.objects.filter(reviewer=self.readers[1], book=self.books[2]).delete()
+        self.assertEqual(Job.objects.filter(task="core.refresh_recommendations").count(), 4)
+        jobs.run_pending()
+        refreshed = self.stored()
+        recommendations.rebuild()
+        full = self.stored()
+        self.assertEqual(refreshed[0], full[0])
+        # Only the interacting readers' own lists are refreshed.
+        for reader in (self.readers[1], self.readers[3]):
+            self.assertEqual([row for row in refreshed[1] if row[0] == reader.id], [row for row in full[1] if row[0] == reader.id])
+
+    def test_refresh_touches_only_affected_rows(self):
+        recommendations.rebuild()
+        untouched = BookNeighbour.objects.filter(book=self.books[3]).values_list("pk", flat=True)
+        before = set(untouched)
+        recommendations.refresh(self.books[0].id, self.readers[0].id)
+        self.assertEqual(set(untouched), before)
+
+    def test_pages_show_recommendations_with_one_query(self):
+        recommendations.rebuild()
+        self.client.force_login(self.readers[0])
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse("book_details", args=[self.books[0].id]))
+        self.assertContains(response, "Readers also swapped")
+        self.assertContains(response, "Novel 1")
+        self.assertEqual(sum(1 for query in ctx.captured_queries if "core_bookneighbour" in query["sql"]), 1)
+        self.assertContains(self.client.get(reverse("dashboard")), "Recommended for You")
+
+
+class SwapCycleTests(TestCase):
+    """Rings of 3 and 4 pending requests are found as requests arrive and go ahead once everyone accepts."""
+
+    def setUp(self):
+        self.users = [User.objects.create_user(name, password="pw") for name in "abcd"]
+        self.books = {user.username: Book.objects.create(owner=user, title=f"{user.username}'s book") for user in self.users}
+
+    def want(self, requester, owner, offered=True):
+        return SwapRequest.objects.create(
+            requester=User.objects.get(username=requester),
+            owner=User.objects.get(username=owner),
+            requested_book=self.books[owner],
+            offered_book=self.books[requester] if offered else None,
+        )
+
+    def ring(self, cycle):
+        return [leg.swap_request.requester.username for leg in cycle.legs.all()]
+
+    def test_three_and_four_party_rings(self):
+        self.want("a", "b")
+        self.want("b", "c")
+        self.want("c", "d")
+        jobs.run_pending()
+        self.assertFalse(SwapCycle.objects.exists())
+        self.want("c", "a")  # closes a -> b -> c -> a
+        self.want("d", "a", offered=False)  # closes a -> b -> c -> d -> a
+        jobs.run_pending()
+        rings = sorted((cycle.size, self.ring(cycle)) for cycle in SwapCycle.objects.all())
+        self.assertEqual(rings, [(3, ["c", "a", "b"]), (4, ["d", "a", "b", "c"])])
+
+    def test_pairs_and_mismatched_offers_are_not_rings(self):
+        self.want("a", "b")
+        self.want("b", "a")
+        self.want("b", "c")
+        # a -> b -> c -> a would need c to give b the book b asked for, but c offers another one.
+        extra = Book.objects.create(owner=self.users[2], title="c's other book")
+        SwapRequest.objects.create(requester=self.users[2], owner=self.users[0], requested_book=self.books["a"], offered_book=extra)
+        jobs.run_pending()
+        self.assertFalse(SwapCycle.objects.exists())
+
+    def test_four_party_ring_needs_every_leg_to_match(self):
+        self.want("a", "b")
+        self.want("b", "c")
+        # a -> b -> c -> d -> a would need c to give b the book b asked for, but c offers another one.
+        extra = Book.objects.create(owner=self.users[2], title="c's other book")
+        SwapRequest.objects.create(requester=self.users[2], owner=self.users[3], requested_book=self.books["d"], offered_book=extra)
+        self.want("d", "a", offered=False)
+        jobs.run_pending()
+        self.assertFalse(SwapCycle.objects.exists())
+
+    def test_everyone_accepts(self):
+        requests = [self.want("a", "b"), self.want("b", "c"), self.want("c", "a")]
+        jobs.run_pending()
+        cycle = SwapCycle.objects.get()
+        for user in self.users[:2]:
+            self.client.force_login(user)
+            self.assertContains(self.client.get(reverse("swap_cycles")), "3-way swap")
+            self.client.post(reverse("respond_swap_cycle", args=[cycle.id]), {"action": "accept"})
+        self.assertEqual(SwapCycle.objects.get().status, "proposed")
+        self.client.force_login(self.users[2])
+        self.client.post(reverse("respond_swap_cycle", args=[cycle.id]), {"action": "accept"})
+        self.assertEqual(SwapCycle.objects.get().status, "completed")
+        self.assertEqual({request.status for request in SwapRequest.objects.filter(pk__in=[r.pk for r in requests])}, {"accepted"})
+        self.assertEqual(Sale.objects.filter(swap_request__in=requests).count(), 3)
+
+    def test_request_gone_meanwhile_cancels_the_ring(self):
+        requests = [self.want("a", "b"), self.want("b", "c"), self.want("c", "a")]
+        jobs.run_pending()
+        cycle = SwapCycle.objects.get()
+        for user in self.users[:2]:
+            cycles.accept(cycle, user)
+        # Accepted on its own by a racing request, without the signals that would have cancelled the ring.
+        SwapRequest.objects.filter(pk=requests[1].pk).update(status="accepted")
+        self.assertFalse(cycles.accept(cycle, self.users[2]))
+        self.assertEqual(SwapCycle.objects.get().status, "cancelled")
+        self.assertEqual([SwapRequest.objects.get(pk=r.pk).status for r in requests], ["pending", "accepted", "pending"])
+        self.assertFalse(Sale.objects.exists())
+
+    def test_closed_request_cancels_its_rings(self):
+        first = self.want("a", "b")
+        self.want("b", "c")
+        self.want("c", "a")
+        jobs.run_pending()
+        first.status = "rejected"
+        first.save()
+        self.assertEqual(SwapCycle.objects.get().status, "cancelled")
+        self.client.force_login(self.users[1])
+        self.assertNotContains(self.client.get(reverse("swap_cycles")), "3-way swap")
+
+    def test_outsiders_cannot_respond(self):
+        self.want("a", "b")
+        self.want("b", "c")
+        self.want("c", "a")
+        jobs.run_pending()
+        self.client.force_login(self.users[3])
+        response = self.client.post(reverse("respond_swap_cycle", args=[SwapCycle.objects.get().id]), {"action": "decline"})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(SwapCycle.objects.get().status, "proposed")
+
+
+class GeoTests(TestCase):
+    """Places resolved through the gazetteer and listings narrowed to owners nearby."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = cls.user("viewer", "Indiranagar, Bengaluru")
+        for name, place in [("near", "Bangalore"), ("mid", "Mysore"), ("far", "Mumbai"), ("nowhere", "")]:
+            Book.objects.create(owner=cls.user(name, place), title=f"{name} book", availability="swap")
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.viewer)
+
+    @staticmethod
+    def user(name, place):
+        user = User.objects.create_user(name, password="pw")
+        user.profile.place = place
+        user.profile.save()
+        return user
+
+    def titles(self, url):
+        return [book.title for book in self.client.get(url).context["books"]]
+
+    def test_locate(self):
+        self.assertEqual(geo.locate("Koramangala, Bangalore").name, "Bengaluru")
+        self.assertEqual(geo.locate("new delhi").name, "New Delhi")
+        self.assertEqual(geo.locate("Banglore").name, "Bengaluru")
+        self.assertIsNone(geo.locate("Atlantis"))
+        self.assertIsNone(geo.locate(None))
+
+    def test_encode(self):
+        self.assertEqual(geo.encode(57.64911, 10.40744, 11), "u4pruydqqvj")
+
+    def test_profile_location_follows_place(self):
+        profile = self.viewer.profile
+        self.assertEqual(profile.geohash, geo.encode(12.972, 77.595))
+        profile.place = "Chennai"
+        profile.save(update_fields=["place"])
+        profile.refresh_from_db()
+        self.assertEqual(profile.geohash[:2], geo.encode(13.083, 80.271, 2))
+        profile.place = "somewhere"
+        profile.save()
+        profile.refresh_from_db()
+        self.assertEqual((profile.latitude, profile.geohash), (None, ""))
+
+    def test_listings_within_radius_nearest_first(self):
+        self.assertEqual(self.titles(reverse("book_list") + "?within=20"), ["near book"])
+        self.assertEqual(self.titles(reverse("book_list") + "?within=200"), ["near book", "mid book"])
+        self.assertEqual(self.titles(reverse("swap") + "?within=2000"), ["near book", "mid book", "far book"])
+        self.assertContains(self.client.get(reverse("book_list") + "?within=200"), "km away")
+
+    def test_nearby_pages_by_distance(self):
+        first = self.client.get(reverse("book_list") + "?within=2000&per_page=2").context["books"]
+        self.assertEqual([book.title for book in first], ["near book", "mid book"])
+        rest = self.titles(reverse("book_list") + f"?{first.next_query}")
+        self.assertEqual(rest, ["far book"])
+
+    def test_viewer_without_place_sees_everything(self):
+        self.client.force_login(User.objects.get(username="nowhere"))
+        response = self.client.get(reverse("book_list") + "?within=20")
+        self.assertEqual(len(response.context["books"]), 4)
+        self.assertContains(response, "to see books near you")
+
+
+class SwapAcceptTests(TestCase):
+    """Accepting a request is one locked transition that also declines the requests competing with it."""
+
+    def setUp(self):
+        self.owner, self.first, self.second = (User.objects.create_user(name, password="pw") for name in ("owner", "first", "second"))
+        self.wanted = Book.objects.create(owner=self.owner, title="Wanted")
+        self.offers = {user: Book.objects.create(owner=user, title=f"{user.username}'s offer") for user in (self.first, self.second)}
+        self.swaps = [self.request(user) for user in (self.first, self.second)]
+        self.client.force_login(self.owner)
+
+    def request(self, requester, book=None):
+        return SwapRequest.objects.create(
+            requester=requester, owner=(book or self.wanted).owner, requested_book=book or self.wanted, offered_book=self.offers[requester]
+        )
+
+    def statuses(self):
+        return dict(SwapRequest.objects.values_list("id", "status"))
+
+    def test_accept_declines_competing_requests(self):
+        # Someone else wants the book offered in return; it is gone too.
+        third = User.objects.create_user("third", password="pw")
+        self.offers[third] = Book.objects.create(owner=third, title="third's offer")
+        for_offer = self.request(third, book=self.offers[self.first])
+        unrelated = self.request(third, book=Book.objects.create(owner=self.owner, title="Other"))
+        self.assertEqual(counters.for_user(self.owner).pending_swaps_received, 3)
+
+        self.client.post(reverse("accept_swap", args=[self.swaps[0].id]))
+        self.assertEqual(self.statuses(), {
+            self.swaps[0].id: "accepted", self.swaps[1].id: "rejected", for_offer.id: "rejected", unrelated.id: "pending",
+        })
+        self.assertEqual(counters.for_user(self.owner).pending_swaps_received, 1)
+        self.assertEqual(counters.for_user(self.first).pending_swaps_received, 0)
+        self.assertFalse(counters.reconcile(dry_run=True))
+        self.assertEqual(Sale.objects.filter(transaction__isnull=False).count(), 1)
+
+    def test_accept_records_the_sale(self):
+        self.client.post(reverse("accept_swap", args=[self.swaps[0].id]))
+        sale = Sale.objects.select_related("transaction").get(swap_request=self.swaps[0])
+        self.assertEqual((sale.transaction.buyer, sale.transaction.seller, sale.book), (self.first, self.owner, self.wanted))
+        self.assertEqual((sale.buyer.user, sale.seller.user), (self.first, self.owner))
+
+    def test_stale_accept_loses(self):
+        # Both loaded while pending, like two requests racing; only the first transition happens.
+        stale = SwapRequest.objects.get(pk=self.swaps[0].pk)
+        swaps.accept(self.swaps[0])
+        with self.assertRaises(swaps.SwapNotPending):
+            swaps.accept(stale)
+        with self.assertRaises(swaps.SwapNotPending):
+            swaps.accept(self.swaps[1])
+        self.assertEqual(Sale.objects.filter(transaction__isnull=False).count(), 1)
+        self.assertFalse(counters.reconcile(dry_run=True))
+
+    def test_reject_after_accept_loses(self):
+        self.client.post(reverse("accept_swap", args=[self.swaps[0].id]))
+        self.client.post(reverse("reject_swap", args=[self.swaps[0].id]))
+        self.assertEqual(self.statuses(), {self.swaps[0].id: "accepted", self.swaps[1].id: "rejected"})
+        self.assertFalse(counters.reconcile(dry_run=True))
+
+    def test_reject_needs_post(self):
+        self.client.get(reverse("reject_swap", args=[self.swaps[1].id]))
+        self.client.post(reverse("reject_swap", args=[self.swaps[0].id]))
+        self.assertEqual(self.statuses(), {self.swaps[0].id: "rejected", self.swaps[1].id: "pending"})
+        self.assertEqual(counters.for_user(self.owner).pending_swaps_received, 1)
+        self.assertFalse(counters.reconcile(dry_run=True))
+
+    def test_accept_needs_post_and_ownership(self):
+        self.client.get(reverse("accept_swap", args=[self.swaps[0].id]))
+        self.client.force_login(self.first)
+        self.assertEqual(self.client.post(reverse("accept_swap", args=[self.swaps[0].id])).status_code, 404)
+        self.assertEqual(set(self.statuses().values()), {"pending"})
+
+
+class SwapAcceptRaceTests(TransactionTestCase):
+    """Two accepts running at the same time, in separate connections: exactly one succeeds."""
+
+    def setUp(self):
+        owner = User.objects.create_user("owner", password="pw")
+        book = Book.objects.create(owner=owner, title="Wanted")
+        self.swaps = [
+            SwapRequest.objects.create(requester=User.objects.create_user(name, password="pw"), owner=owner, requested_book=book)
+            for name in ("first", "second")
+        ]
+
+    def race(self, targets):
+        barrier = threading.Barrier(len(targets))
+        outcomes = []
+
+        def accept(swap):
+            try:
+                barrier.wait()
+                swaps.accept(swap)
+                outcomes.append("accepted")
+            except swaps.SwapNotPending:
+                outcomes.append("lost")
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=accept, args=(swap,)) for swap in targets]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return sorted(outcomes)
+
+    def test_same_request_accepted_once(self):
+        self.assertEqual(self.race([self.swaps[0], self.swaps[0]]), ["accepted", "lost"])
+        self.assertEqual(SwapRequest.objects.get(pk=self.swaps[0].pk).status, "accepted")
+        self.assertEqual(Sale.objects.filter(transaction__isnull=False).count(), 1)
+
+    def test_competing_requests_not_both_accepted(self):
+        self.assertEqual(self.race(self.swaps), ["accepted", "lost"])
+        self.assertEqual(sorted(SwapRequest.objects.values_list("status", flat=True)), ["accepted", "rejected"])
+        self.assertEqual(Sale.objects.filter(transaction__isnull=False).count(), 1)
+
+
+class PaymentQueueTests(TestCase):
+    """Sellers page through pending payments and settle a selection in one transaction."""
+
+    def setUp(self):
+        self.seller = User.objects.create_user("seller", password="pw")
+        self.buyer = User.objects.create_user("buyer", password="pw")
+        self.payments = [self.pay(self.seller, price=10 * (i + 1)) for i in range(12)]
+        self.client.force_login(self.seller)
+
+    def pay(self, seller, price=10):
+        book = Book.objects.create(owner=seller, title="For sale", availability="sell", price=Decimal(price))
+        return Payment.objects.create(buyer=self.buyer, seller=seller.profile, book=book)
+
+    def resolve(self, action, payments, **data):
+        return self.client.post(reverse("resolve_payments"), {"action": action, "payment": [p.id for p in payments], **data})
+
+    def statuses(self):
+        return dict(Payment.objects.values_list("id", "status"))
+
+    def test_queue_pages(self):
+        response = self.client.get(reverse("seller_payments") + "?per_page=5")
+        self.assertEqual(len(response.context["payments"]), 5)
+        self.assertTrue(response.context["payments"].has_next)
+        self.assertContains(response, "No screenshot uploaded")
+
+    def test_bulk_verify(self):
+        other = self.pay(User.objects.create_user("other", password="pw"))
+        self.resolve("verify", self.payments[:10] + [other], mobile="9876543210")
+        statuses = self.statuses()
+        self.assertEqual([statuses[p.id] for p in self.payments], ["Verified"] * 10 + ["Pending"] * 2)
+        self.assertEqual(statuses[other.id], "Pending")
+        self.assertEqual(Transaction.objects.filter(seller=self.seller).count(), 10)
+        self.assertEqual(Payment.objects.get(pk=self.payments[2].pk).amount, Decimal(30))
+        self.assertEqual(counters.for_user(self.seller).pending_payments, 2)
+        self.assertEqual(counters.for_user(self.buyer).purchases, 10)
+        self.assertFalse(counters.reconcile(dry_run=True))
+
+    def test_batch_cost_does_not_grow(self):
+        profile = self.seller.profile
+        with CaptureQueriesContext(connection) as small:
+            payments.verify(profile, [p.id for p in self.payments[:2]], "9876543210")
+        with self.assertNumQueries(len(small.captured_queries)):
+            payments.verify(profile, [p.id for p in self.payments[2:]], "9876543210")
+
+    def test_bulk_reject(self):
+        self.resolve("reject", self.payments[:3])
+        self.assertEqual(list(self.statuses().values()).count("Rejected"), 3)
+        self.assertFalse(Transaction.objects.exists())
+        self.assertEqual(counters.for_user(self.seller).pending_payments, 9)
+
+    def test_verify_needs_mobile(self):
+        self.resolve("verify", self.payments[:2])
+        self.assertEqual(set(self.statuses().values()), {"Pending"})
 
-# Create your tests here.
@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import api, views
 from core import views as core_views
 
 
@@ -9,6 +9,13 @@ urlpatterns = [
     path('books/', views.book_list, name='book_list'),
     path('book/<int:book_id>/', views.book_details, name='book_details'),
     path('books/add/', views.add_book, name='add_book'),
+    path('books/import/', views.import_books, name='import_books'),
+    path('books/import/<int:import_id>/', views.import_status, name='import_status'),
+    path('api/v1/books/', api.book_list, name='api_books'),
+    path('api/v1/books/<int:book_id>/', api.book_detail, name='api_book'),
+    path('api/v1/books/<int:book_id>/reviews/', api.book_reviews, name='api_book_reviews'),
+    path('api/v1/users/<str:username>/', api.user_profile, name='api_user'),
+    path('api/v1/changes/', api.change_feed, name='api_changes'),
     path('books/edit/<int:id>/', views.edit_book, name='edit_book'),
     path('books/delete/<int:id>/', views.delete_book, name='delete_book'),
     path('books/<int:book_id>/swap/', views.request_swap, name='request_swap'),
@@ -26,11 +33,15 @@ urlpatterns = [
     path("swap/received/", views.swap_requests_received, name="swap_requests_received"),
     path("swap/accept/<int:swap_id>/", views.accept_swap, name="accept_swap"),
     path("swap/reject/<int:swap_id>/", views.reject_swap, name="reject_swap"),
+    path("swap/circles/", views.swap_cycles, name="swap_cycles"),
+    path("swap/circles/<int:cycle_id>/respond/", views.respond_swap_cycle, name="respond_swap_cycle"),
     path("sell-book/", views.sell_book, name="sell_book"),
     path("settings/", views.settings, name="settings"),
     path("review/", views.review, name="review"),
     path('purchases/', views.purchases, name='purchases'),
     path('sales/', views.sales, name='sales'),
+    path('sales/export/', views.export_sales, name='export_sales'),
+    path('purchases/export/', views.export_purchases, name='export_purchases'),
     path("purchase/", views.purchase, name="purchase"),
     path('purchase/<int:id>/', views.purchase_book, name='purchase_book'),
     path("buy/<int:id>/", views.buy_book, name="buy_book"),
@@ -40,6 +51,7 @@ urlpatterns = [
     path("checkout/<int:seller_id>/", views.checkout, name="checkout"),
     path("payments/success/", core_views.payment_success, name="payment_success"),
     path("payments/seller/", core_views.seller_payments, name="seller_payments"),
+    path("payments/seller/resolve/", views.resolve_payments, name="resolve_payments"),
     path("payments/verify/<int:payment_id>/", views.verify_payment, name="verify_payment"),
     path("payments/success/", views.payment_success, name="payment_success"),
     
@@ -49,3 +61,28 @@ urlpatterns = [
 
 ]
 
+
+# Max SQL queries per request (session + user lookups included), enforced by
+# core.tests and logged by core.middleware.QueryBudgetMiddleware when exceeded.
+QUERY_BUDGETS = {
+    'home': 3,
+    'book_list': 5,
+    'book_details': 5,
+    'purchase': 7,
+    'swap': 4,
+    'swap_request': 5,
+    'swap_requests_sent': 3,
+    'swap_requests_received': 4,
+    'swap_cycles': 3,
+    'my_books': 4,
+    'dashboard': 5,
+    'purchases': 4,
+    'sales': 5,
+    'seller_payments': 4,
+    'review': 5,
+    'api_books': 1,
+    'api_book': 1,
+    'api_book_reviews': 2,
+    'api_user': 1,
+    'api_changes': 2,
+}
@@ -1,45 +1,123 @@
-from django.shortcuts import render, redirect, get_object_or_404
+from asgiref.sync import sync_to_async
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from .models import Book, SwapRequest, Transaction, Review, Sale
-from django.db.models import Avg
+from django.http import HttpResponseBadRequest
+from django.urls import reverse
+from .models import Book, CatalogImport, SwapCycle, SwapRequest, Review
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.models import User
 from django.contrib.auth import update_session_auth_hash
 from .models import UserProfile
 from .models import Payment
 from .forms import BookForm, ReviewForm, SwapRequestForm, UserProfileForm 
+from .pagination import KeysetPage, apaginate_keyset, first_page_query, get_page_size, paginate_keyset
+from .fuzzy import fuzzy_books
+from .facets import afacet_groups, apply_filters
+from .search import search_books
+from .caching import abook_version, acatalog_version, afragment_cached, cache_anonymous_page
+from .exports import ExportError, export_response
+from .imports import ImportFileError, ZipCovers, detect_format
+from .jobs import enqueue
+from .recommendations import for_book, for_reader
+from . import cycles, geo, payments, swaps
 
 
 
-def home(request):
-    latest_books = Book.objects.order_by('-created_at')[:5]
-    return render(request, 'core/home.html', {'latest_books': latest_books})
+async def _auser(request):
+    # Templates read request.user synchronously; resolve it once on the async path.
+    request.user = await request.auser()
+    return request.user
 
 
-def book_list(request):
-    books = Book.objects.all()
-    return render(request, 'core/book_list.html', {'books': books})
+async def _home_key(request):
+    return f"home:{await acatalog_version()}"
 
 
-def book_details(request, book_id):
-    book = get_object_or_404(Book, id=book_id)
-    average_rating = book.reviews.aggregate(Avg('rating'))['rating__avg']
-    reviews = book.reviews.all()
-    
-    if request.method == 'POST' and 'review_submit' in request.POST:
+@cache_anonymous_page(_home_key)
+async def home(request):
+    await _auser(request)
+    version = await acatalog_version()
+    latest_books = []
+    if not await afragment_cached("home_latest_books", version):
+        latest_books = [book async for book in Book.objects.order_by('-created_at')[:5]]
+    return render(request, 'core/home.html', {'latest_books': latest_books, 'catalog_version': version})
+
+
+async def _nearby(request, user, books):
+    """``(books near the viewer, radius)`` for ``?within=<km>``, or ``(None, radius)`` if that can't be done."""
+    radius = geo.radius_from(request.GET)
+    origin = await geo.aviewer_location(user) if radius else None
+    if origin is None:
+        return None, radius
+    return geo.near(books, *origin, radius), radius
+
+
+def _radius_choices(request, within):
+    return {
+        'within': within,
+        'radius_queries': [(km, first_page_query(request, within=km, sort=None)) for km in geo.RADII_KM],
+        'anywhere_query': first_page_query(request, within=None),
+    }
+
+
+async def book_list(request):
+    user = await _auser(request)
+    books, selected = apply_filters(Book.objects.all(), request.GET)
+    nearby, radius = await _nearby(request, user, books)
+    top_rated = nearby is None and request.GET.get('sort') == 'top'
+    if nearby is not None:
+        books = await apaginate_keyset(request, nearby, keys=('nearness', 'id'))
+    elif top_rated:
+        books = await apaginate_keyset(request, books.filter(review_count__gt=0), keys=('rating_avg', 'id'))
+    else:
+        books = await apaginate_keyset(request, books)
+    context = {
+        'books': books,
+        'page': books,
+        'facets': await afacet_groups(request, selected),
+        'top_rated': top_rated,
+        'newest_query': first_page_query(request, sort=None, within=None),
+        'top_rated_query': first_page_query(request, sort='top', within=None),
+        'location_missing': radius is not None and nearby is None,
+        **_radius_choices(request, radius if nearby is not None else None),
+    }
+    return render(request, 'core/book_list.html', context)
+
+
+async def _book_details_key(request, book_id):
+    return f"book:{book_id}:{await abook_version(book_id)}"
+
+
+@cache_anonymous_page(_book_details_key)
+async def book_details(request, book_id):
+    user = await _auser(request)
+    book = await aget_object_or_404(Book, id=book_id)
+    version = await abook_version(book.id)
+
+    if request.method == 'POST' and 'review_submit' in request.POST and user.is_authenticated:
         form = ReviewForm(request.POST)
         if form.is_valid():
             review = form.save(commit=False)
             review.book = book
-            review.reviewer = request.user
-            review.save()
+            review.reviewer = user
+            await review.asave()
             messages.success(request, "Review added!")
             return redirect('book_details', book_id=book_id)
     else:
         form = ReviewForm()
-    
-    context = {'book': book, 'reviews': reviews, 'average_rating': average_rating, 'form': form}
+
+    reviews = []
+    if not await afragment_cached("book_detail", book.id, version):
+        reviews = [review async for review in book.reviews.select_related('reviewer')]
+    context = {
+        'book': book,
+        'reviews': reviews,
+        'also_swapped': [other async for other in for_book(book.id, user)],
+        'average_rating': book.rating_avg,
+        'form': form,
+        'book_version': version,
+    }
     return render(request, 'core/book_details.html', context)
 
 
@@ -102,18 +180,7 @@ def request_swap(request, book_id):
 @login_required
 def dashboard(request):
     my_books = Book.objects.filter(owner=request.user)
-    my_swaps_sent = SwapRequest.objects.filter(requester=request.user)
-    my_swaps_received = SwapRequest.objects.filter(owner=request.user)
-    my_purchases = Transaction.objects.filter(buyer=request.user)
-    my_sales = Transaction.objects.filter(seller=request.user)
-    context = {
-        'my_books': my_books,
-        'my_swaps_sent': my_swaps_sent,
-        'my_swaps_received': my_swaps_received,
-        'my_purchases': my_purchases,
-        'my_sales': my_sales,
-    }
-    return render(request, 'core/dashboard.html',{"my_books": my_books})
+    return render(request, 'core/dashboard.html', {"my_books": my_books, "recommended": for_reader(request.user)})
 
 
 
@@ -173,8 +240,8 @@ def signup(request):
 
 @login_required
 def success(request):
-    books = Book.objects.all().order_by('-id')  
-    return render(request, 'core/success.html', {'books': books})
+    books = paginate_keyset(request, Book.objects.all())
+    return render(request, 'core/success.html', {'books': books, 'page': books})
 
 @login_required
 def my_books(request):
@@ -254,14 +321,21 @@ def swap_request_view(request):
 
         return redirect("swap_request_view") 
 
-    swap_requests = SwapRequest.objects.filter(requester=request.user).order_by("-created_at")
+    swap_requests = (
+        SwapRequest.objects.filter(requester=request.user)
+        .select_related("requested_book", "offered_book")
+        .order_by("-created_at")
+    )
     user_books = Book.objects.filter(owner=request.user)
-    available_books = Book.objects.filter(availability__in=["swap", "both"]).exclude(owner=request.user)
+    available_books = paginate_keyset(
+        request, Book.objects.filter(availability__in=["swap", "both"]).exclude(owner=request.user)
+    )
 
     context = {
         "swap_requests": swap_requests,
         "user_books": user_books,
         "available_books": available_books,
+        "page": available_books,
     }
     return render(request, "core/swap_request.html", context)
 
@@ -270,7 +344,7 @@ def swap_request_view(request):
 def swap_requests_sent(request):
     swap_requests = SwapRequest.objects.filter(
         requester=request.user
-    ).order_by("-created_at")
+    ).select_related("requested_book", "owner", "offered_book").order_by("-created_at")
 
     return render(request, "core/swap_requests_sent.html", {
         "swap_requests": swap_requests
@@ -281,7 +355,7 @@ def swap_requests_sent(request):
 def swap_requests_received(request):
     swap_requests = SwapRequest.objects.filter(
         owner=request.user
-    ).order_by("-created_at")
+    ).select_related("requested_book", "requester", "offered_book").order_by("-created_at")
 
     return render(request, "core/swap_requests_received.html", {
         "swap_requests": swap_requests
@@ -289,9 +363,20 @@ def swap_requests_received(request):
 
 
 @login_required
-def swap(request):
-    books = Book.objects.filter(availability__in=["swap", "both"]).exclude(owner=request.user)
-    return render(request, "core/swap.html", {"books": books})
+async def swap(request):
+    user = await _auser(request)
+    books = Book.objects.filter(availability__in=["swap", "both"]).exclude(owner=user)
+    nearby, radius = await _nearby(request, user, books)
+    if nearby is not None:
+        books = await apaginate_keyset(request, nearby, keys=("nearness", "id"))
+    else:
+        books = await apaginate_keyset(request, books)
+    return render(request, "core/swap.html", {
+        "books": books,
+        "page": books,
+        "location_missing": radius is not None and nearby is None,
+        **_radius_choices(request, radius if nearby is not None else None),
+    })
 
 @login_required
 def request_swap(request, book_id):
@@ -336,47 +421,57 @@ def request_swap(request, book_id):
 
 @login_required
 def accept_swap(request, swap_id):
+    if request.method != "POST":
+        return redirect('swap_requests_received')
     swap = get_object_or_404(SwapRequest, id=swap_id, owner=request.user)
 
-    swap.status = "accepted"
-    swap.save()
-
-    if swap.offered_book:
-        swap.offered_book.is_sold = True
-        swap.offered_book.save()
-
-    buyer_profile, _ = UserProfile.objects.get_or_create(user=swap.requester)
-    seller_profile, _ = UserProfile.objects.get_or_create(user=request.user)
-
-    transaction = Transaction.objects.create(
-        buyer=swap.requester,
-        seller=request.user,
-        book=swap.requested_book,
-        amount=swap.requested_book.price if swap.requested_book else 0,
-        mobile=buyer_profile.gpay_number,
-        status="success"
-    )
-
-    Sale.objects.create(
-        swap_request=swap,
-        buyer=buyer_profile,      
-        seller=seller_profile,    
-        book=swap.requested_book,
-        transaction=transaction
-    )
+    # The Transaction/Sale rows commit with the status change.
+    try:
+        rejected = swaps.accept(swap)
+    except swaps.SwapNotPending:
+        messages.error(request, "⚠️ This swap request is no longer pending.")
+        return redirect('swap_requests_received')
 
-    messages.success(request, "Swap accepted successfully!")
+    if rejected:
+        messages.success(request, f"Swap accepted successfully! {rejected} other request(s) for these books were declined.")
+    else:
+        messages.success(request, "Swap accepted successfully!")
     return redirect('swap_requests_received')
 
 
 @login_required
 def reject_swap(request, swap_id):
+    if request.method != "POST":
+        return redirect("swap_requests_received")
     swap = get_object_or_404(SwapRequest, id=swap_id, owner=request.user)
-    swap.status = "rejected"
-    swap.save()
+    try:
+        swaps.reject(swap)
+    except swaps.SwapNotPending:
+        messages.error(request, "⚠️ This swap request is no longer pending.")
+        return redirect("swap_requests_received")
     messages.info(request, "Swap request rejected.")
     return redirect("swap_requests_received")
 
+@login_required
+def swap_cycles(request):
+    return render(request, "core/swap_cycles.html", {"cycles": cycles.for_user(request.user)})
+
+
+@login_required
+def respond_swap_cycle(request, cycle_id):
+    if request.method != "POST":
+        return redirect("swap_cycles")
+    cycle = get_object_or_404(SwapCycle, id=cycle_id, status="proposed", legs__swap_request__requester=request.user)
+    if request.POST.get("action") == "decline":
+        cycles.decline(cycle)
+        messages.info(request, "Swap circle declined.")
+    elif cycles.accept(cycle, request.user):
+        messages.success(request, "Everyone accepted: the swap circle is on!")
+    else:
+        messages.success(request, "Accepted. We'll go ahead once everyone in the circle accepts.")
+    return redirect("swap_cycles")
+
+
 @login_required
 def sell_book(request):
     if request.method == "POST":
@@ -466,11 +561,55 @@ def sales(request):
     sales = Payment.objects.filter(
         seller=profile,
         status="Verified"
-    ).select_related("book", "buyer").order_by("-created_at")
+    ).select_related("book", "buyer__profile").order_by("-created_at")
 
     return render(request, "core/sales.html", {"sales": sales})
 
 
+@login_required
+def export_sales(request):
+    try:
+        return export_response(request, "sales")
+    except ExportError as exc:
+        return HttpResponseBadRequest(str(exc))
+
+
+@login_required
+def export_purchases(request):
+    try:
+        return export_response(request, "purchases")
+    except ExportError as exc:
+        return HttpResponseBadRequest(str(exc))
+
+
+@login_required
+def import_books(request):
+    context = {'imports': CatalogImport.objects.filter(owner=request.user).order_by('-created_at')[:5]}
+    if request.method == 'POST':
+        upload = request.FILES.get('file')
+        covers = request.FILES.get('covers')
+        try:
+            if upload is None:
+                raise ImportFileError("Choose a CSV or NDJSON file to import.")
+            fmt = detect_format(upload.name, request.POST.get('format'))
+            if covers:
+                ZipCovers(covers)  # a broken or oversized archive fails now rather than in the job
+        except ImportFileError as exc:
+            context['error'] = str(exc)
+            return render(request, 'core/import_books.html', context, status=400)
+        # Large files outlast a request: the job imports them and the status page follows along.
+        catalog_import = CatalogImport.objects.create(owner=request.user, file=upload, covers=covers or '', format=fmt)
+        enqueue('core.import_catalog', import_id=catalog_import.id)
+        return redirect('import_status', import_id=catalog_import.id)
+    return render(request, 'core/import_books.html', context)
+
+
+@login_required
+def import_status(request, import_id):
+    catalog_import = get_object_or_404(CatalogImport, id=import_id, owner=request.user)
+    return render(request, 'core/import_books.html', {'catalog_import': catalog_import})
+
+
 @login_required
 def verify_payment(request, payment_id):
     seller_profile = request.user.profile
@@ -492,29 +631,10 @@ def verify_payment(request, payment_id):
                     }
                 )
 
-            payment.status = "Verified"
-            payment.mobile = seller_mobile  
-
-            if payment.book:
-                if not payment.amount:
-                    payment.amount = payment.book.price
-                payment.book.is_sold = True
-                payment.book.save()
-
-            payment.save()
-
-            Transaction.objects.create(
-                buyer=payment.buyer,
-                seller=request.user,   
-                book=payment.book,
-                amount=payment.amount if payment.amount else 0,
-                mobile=payment.mobile,
-                status="success"
-            )
+            payments.verify(seller_profile, [payment.id], seller_mobile)
 
         elif action == "reject":
-            payment.status = "Rejected"
-            payment.save()
+            payments.reject(seller_profile, [payment.id])
 
         return redirect("sales")  
 
@@ -524,16 +644,28 @@ def verify_payment(request, payment_id):
 
 
 @login_required
-def purchase(request):
+async def purchase(request):
+    user = await _auser(request)
     query = request.GET.get('q', '')  
-    books = Book.objects.exclude(owner=request.user)
+    books, selected = apply_filters(Book.objects.exclude(owner=user), request.GET)
 
+    fuzzy = False
     if query:
-        books = books.filter(title__icontains=query) | books.filter(author__icontains=query)
-
+        ranked = await apaginate_keyset(request, search_books(books, query), keys=("rank", "id"))
+        if not ranked and "after" not in request.GET and "before" not in request.GET:
+            # Nothing matched exactly: fall back to typo/transliteration-tolerant matches.
+            ranked = KeysetPage(request, await sync_to_async(fuzzy_books)(books, query, limit=get_page_size(request)))
+            fuzzy = bool(ranked)
+        books = ranked
+    else:
+        books = await apaginate_keyset(request, books)
     context = {
         'books': books,
+        'page': books,
         'query': query,
+        'fuzzy': fuzzy,
+        # Counts match what a click lists before search: other people's books only.
+        'facets': await afacet_groups(request, selected, exclude_owner=user),
     }
     return render(request, 'core/purchase.html', context)
 
@@ -637,14 +769,36 @@ def checkout(request, book_id):
 
 @login_required
 def seller_payments(request):
-    profile = request.user.profile 
-    payments = Payment.objects.filter(seller=profile, status="Pending")
+    queue = paginate_keyset(request, payments.pending(request.user.profile).select_related("buyer", "book"))
 
     return render(request, "core/seller_payments.html", {
-        "payments": payments
+        "payments": queue,
+        "page": queue,
     })
 
 
+@login_required
+def resolve_payments(request):
+    """Verify or reject the payments ticked in the seller's queue."""
+    if request.method != "POST":
+        return redirect("seller_payments")
+    profile = request.user.profile
+    selected = request.POST.getlist("payment")
+    action = request.POST.get("action")
+    if not selected:
+        messages.error(request, "⚠️ Select at least one payment.")
+    elif action == "verify":
+        mobile = request.POST.get("mobile", "").strip()
+        if not mobile:
+            messages.error(request, "⚠️ Please enter your mobile number before verifying.")
+        else:
+            messages.success(request, f"✅ Verified {payments.verify(profile, selected, mobile)} payment(s).")
+    elif action == "reject":
+        messages.info(request, f"Rejected {payments.reject(profile, selected)} payment(s).")
+    next_query = request.POST.get("next", "")
+    return redirect(reverse("seller_payments") + (f"?{next_query}" if next_query else ""))
+
+
 
 @login_required
 def payment_success(request):
@@ -0,0 +1,25 @@
+// BookSwap page behaviour, loaded on every page; each part acts only where its elements exist.
+
+// Buy: show the details of the chosen payment method.
+document.getElementById("payment_method")?.addEventListener("change", (event) => {
+  document.getElementById("gpay-info").style.display = event.target.value === "GPay" ? "block" : "none";
+  document.getElementById("upi-info").style.display = event.target.value === "UPI" ? "block" : "none";
+});
+
+// Seller payments: select every payment on the page.
+document.getElementById("select-all")?.addEventListener("change", (event) => {
+  document.querySelectorAll(".payment-select").forEach((box) => { box.checked = event.target.checked; });
+});
+
+// Received swap requests: accepting needs the owner's mobile number.
+document.querySelectorAll("input[id^='receiver_mobile_']").forEach((input) => {
+  const button = input.closest("form").querySelector(".accept-btn");
+  input.addEventListener("input", () => {
+    button.disabled = input.value.trim() === "";
+  });
+});
+
+// Catalogue import: reload while the background import is still running.
+document.querySelectorAll("[data-refresh]").forEach((element) => {
+  setTimeout(() => window.location.reload(), Number(element.dataset.refresh) * 1000);
+});